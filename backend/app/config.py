@@ -1,27 +1,138 @@
 from pydantic_settings import BaseSettings
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from string import Formatter
+import hashlib
+import logging
+import re
+import time
 import yaml
 import os
 
+logger = logging.getLogger(__name__)
+
 
 class PromptsConfig:
-    """Prompts configuration loaded from YAML file."""
+    """
+    Prompts configuration loaded from YAML file.
+
+    The file is re-checked (mtime polling) at most every `reload_interval`
+    seconds when prompts are read. A changed file is validated first and then
+    swapped in as a whole, so readers never see a half-loaded or broken set.
+    An invalid file at startup raises ValueError.
+    """
+    
+    # Template variables services/llm passes to each prompt; a prompt must use exactly these
+    PROMPT_VARIABLES = {
+        "dept_monthly_report": {"context"},
+        "project_weekly_report": {"project_title", "week_range", "team_updates"},
+        "project_report": {
+            "project_title", "start_date", "end_date", "description", "status", "customer", "event_text", "task_text",
+        },
+        "personal_report": {"username", "project_context", "inspiration_context"},
+    }
+    REQUIRED_KEYS = tuple(PROMPT_VARIABLES)
     
-    def __init__(self, prompts_file: Optional[str] = None):
-        self.prompts: Dict[str, Any] = {}
+    def __init__(self, prompts_file: Optional[str] = None, reload_interval: float = 2.0):
         if prompts_file is None:
             # 默认在 app 目录下查找 prompts.yaml
             prompts_file = os.path.join(os.path.dirname(__file__), "prompts.yaml")
+        self.prompts_file = prompts_file
+        self.reload_interval = reload_interval
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        # (prompts, version) swapped as a single tuple
+        self._snapshot: Tuple[Dict[str, Any], str] = ({}, "")
         self._load_prompts(prompts_file)
     
+    @property
+    def prompts(self) -> Dict[str, Any]:
+        return self._snapshot[0]
+    
+    @property
+    def version(self) -> str:
+        """Short content hash of the active prompt set."""
+        self.reload_if_changed()
+        return self._snapshot[1]
+    
     def _load_prompts(self, file_path: str):
         """Load prompts from YAML file."""
         if os.path.exists(file_path):
+            self._mtime = os.path.getmtime(file_path)
             with open(file_path, 'r', encoding='utf-8') as f:
-                self.prompts = yaml.safe_load(f) or {}
+                raw = f.read()
+            loaded = yaml.safe_load(raw) or {}
+            errors = self.validate(loaded)
+            if errors:
+                raise ValueError(f"Invalid prompts file {file_path}: {errors}")
         else:
             # 如果文件不存在，使用默认提示词
-            self.prompts = self._get_default_prompts()
+            loaded, raw = self._get_default_prompts(), "defaults"
+        self._snapshot = (loaded, self._hash(raw))
+    
+    def reload_if_changed(self) -> bool:
+        """Reload the YAML file if its mtime changed. Returns True if a new version was activated."""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return False
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.prompts_file)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            with open(self.prompts_file, 'r', encoding='utf-8') as f:
+                raw = f.read()
+            loaded = yaml.safe_load(raw) or {}
+        except Exception as e:
+            logger.error(f"Failed to read prompts file, keeping version {self._snapshot[1]}: {e}")
+            return False
+        errors = self.validate(loaded)
+        if errors:
+            logger.error(f"Invalid prompts file, keeping version {self._snapshot[1]}: {errors}")
+            return False
+        self._snapshot = (loaded, self._hash(raw))
+        logger.info(f"✓ Prompts reloaded, version {self._snapshot[1]}")
+        return True
+    
+    @classmethod
+    def validate(cls, loaded: Any) -> List[str]:
+        """Check structure, template syntax and template variables. Returns a list of problems."""
+        if not isinstance(loaded, dict):
+            return ["top level must be a mapping"]
+        errors = [f"missing prompt '{key}'" for key in cls.REQUIRED_KEYS if key not in loaded]
+        for key, config in loaded.items():
+            if not isinstance(config, dict):
+                errors.append(f"'{key}' must be a mapping with system/user")
+                continue
+            used = set()
+            for role in ("system", "user"):
+                template = config.get(role)
+                if not isinstance(template, str):
+                    errors.append(f"'{key}.{role}' must be a string")
+                    continue
+                try:
+                    # Same f-string syntax ChatPromptTemplate uses
+                    fields = [name for _, name, _, _ in Formatter().parse(template) if name is not None]
+                except ValueError as e:
+                    errors.append(f"'{key}.{role}': {e}")
+                    continue
+                if "" in fields:
+                    errors.append(f"'{key}.{role}': positional fields {{}} are not allowed")
+                used.update(re.split(r"[.\[]", name, 1)[0] for name in fields if name)
+            expected = cls.PROMPT_VARIABLES.get(key)
+            if expected is not None:
+                if used - expected:
+                    errors.append(f"'{key}' uses unknown variables: {sorted(used - expected)}")
+                if expected - used:
+                    errors.append(f"'{key}' is missing variables: {sorted(expected - used)}")
+        return errors
+    
+    @staticmethod
+    def _hash(raw: str) -> str:
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
     
     def _get_default_prompts(self) -> Dict[str, Any]:
         """Get default prompts if YAML file not found."""
@@ -46,7 +157,13 @@ class PromptsConfig:
     
     def get_prompt(self, key: str) -> Dict[str, str]:
         """Get prompt by key. Returns dict with 'system' and 'user' keys."""
-        return self.prompts.get(key, {})
+        return self.get_prompt_with_version(key)[0]
+    
+    def get_prompt_with_version(self, key: str) -> Tuple[Dict[str, str], str]:
+        """Get prompt by key together with the version it belongs to."""
+        self.reload_if_changed()
+        loaded, version = self._snapshot
+        return loaded.get(key, {}), version
 
 
 class Settings(BaseSettings):
@@ -67,12 +184,93 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "gpt-4o"
 
+    # LLM Report Generation
+    LLM_MAP_CONCURRENCY: int = 4  # Max concurrent per-project summaries in hierarchical mode
+    LLM_SUMMARY_CACHE_SIZE: int = 256  # Cached per-project summaries (LRU)
+    LLM_BATCH_CONCURRENCY: int = 4  # Max concurrent calls when batch-generating project weekly reports
+    PROMPTS_RELOAD_INTERVAL: float = 2.0  # Seconds between prompts.yaml mtime checks
+
+    # LLM Upstream Limits
+    LLM_MAX_IN_FLIGHT: int = 8  # Upstream calls in flight across all users
+    LLM_MAX_IN_FLIGHT_PER_USER: int = 2
+    LLM_RATE_PER_SECOND: float = 2.0  # Token bucket refill rate, 0 disables rate limiting
+    LLM_RATE_BURST: int = 5
+
+    # LLM Model Routing
+    # Optional extra endpoints; unset API base/key fall back to the OPENAI_* values
+    LLM_FAST_MODEL: Optional[str] = None  # Used for small contexts
+    LLM_FAST_API_BASE: Optional[str] = None
+    LLM_FAST_API_KEY: Optional[str] = None
+    LLM_FAST_MAX_TOKENS: int = 4000  # Estimated prompt tokens up to which the fast model is used
+    LLM_LONG_MODEL: Optional[str] = None  # Used for large contexts
+    LLM_LONG_API_BASE: Optional[str] = None
+    LLM_LONG_API_KEY: Optional[str] = None
+    LLM_LONG_MIN_TOKENS: int = 24000  # Estimated prompt tokens from which the long-context model is used
+    LLM_TIMEOUT_SECONDS: float = 120.0  # Per-call deadline, 0 disables
+    LLM_HEDGE_PERCENTILE: float = 0.0  # Send a second request once a call exceeds this latency percentile, 0 disables
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Latency samples needed before hedging starts
+    LLM_BREAKER_FAILURES: int = 5  # Consecutive failures that open an endpoint's circuit breaker
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0  # Time an open breaker rejects calls before a trial call
+
+    # LLM Cost Estimation (price per 1K tokens, in your billing currency)
+    LLM_PRICE_PROMPT_PER_1K: float = 0.0
+    LLM_PRICE_COMPLETION_PER_1K: float = 0.0
+
+    # Background Jobs
+    JOB_WORKER_CONCURRENCY: int = 2  # Jobs run concurrently per API process (0 disables the worker)
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: int = 10  # Doubled on each retry
+    JOB_LEASE_SECONDS: int = 60  # RUNNING jobs without a heartbeat for this long are reclaimed
+    JOB_POLL_INTERVAL: float = 2.0
+
+    # Scheduler (leader-elected through a MySQL named lock)
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_TICK_SECONDS: float = 60.0
+    PERSONAL_DRAFT_WEEKDAY: int = 3  # 0=Monday, drafts are pre-generated on Thursday night
+    PERSONAL_DRAFT_HOUR: int = 22  # Start of the off-peak window (Beijing time)
+    PERSONAL_DRAFT_WINDOW_HOURS: int = 8
+
     # MinIO Configuration
     MINIO_ENDPOINT: str = "localhost:9000"
     MINIO_ACCESS_KEY: str = "minioadmin"
     MINIO_SECRET_KEY: str = "minioadmin"
     MINIO_BUCKET: str = "deptsync"
     MINIO_SECURE: bool = False
+    MINIO_REGION: str = "us-east-1"
+    MINIO_PUBLIC_ENDPOINT: Optional[str] = None  # Browser-facing host:port for presigned URLs, defaults to MINIO_ENDPOINT
+    MINIO_PUBLIC_SECURE: bool = False
+    MINIO_MAX_WORKERS: int = 10  # Threads for storage calls (matches minio's connection pool size)
+    MINIO_PART_SIZE_MB: int = 10  # Multipart part size for streamed uploads (S3 minimum is 5)
+    UPLOAD_MAX_SIZE_MB: int = 50
+    UPLOAD_BATCH_MAX_FILES: int = 50  # Files per /api/files/upload-batch request
+    UPLOAD_BATCH_CONCURRENCY: int = 4  # Files from one batch written to MinIO at the same time
+    UPLOAD_SESSION_MAX_SIZE_MB: int = 4096  # Limit for resumable upload sessions
+    UPLOAD_CHUNK_SIZE_MB: int = 8  # Part size for upload sessions (S3 minimum is 5)
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # Sessions idle this long are aborted and cleaned up
+
+    # File Serving
+    FILE_SERVE_MODE: str = "proxy"  # proxy: stream through the API; redirect: 302 to a presigned URL; accel: X-Accel-Redirect
+    FILE_PRESIGN_EXPIRES_SECONDS: int = 300
+    FILE_ACCEL_PREFIX: str = "/_minio"  # Internal location the fronting proxy maps to the MinIO endpoint
+    FILE_REQUIRE_AUTH: bool = False  # Require login to read files (Authorization header or the file session cookie); also drops the bucket's public-read policy
+    FILE_SESSION_MINUTES: int = 60  # Lifetime of the file session cookie; the frontend renews it at half-life
+    FILE_COOKIE_SECURE: bool = False  # Mark the file session cookie Secure (set when served over HTTPS)
+    THUMBNAIL_WORKERS: int = 2  # Threads resizing images for ?size= derivatives
+    THUMBNAIL_MAX_PIXELS: int = 100_000_000  # Larger images get no derivatives; the original is served
+    FILE_CACHE_DIR: Optional[str] = None  # Local disk cache for hot objects in proxy mode; unset disables it
+    FILE_CACHE_SIZE_MB: int = 1024
+    FILE_CACHE_MAX_OBJECT_MB: int = 20  # Larger objects are always streamed from MinIO
+
+    # DOCX export
+    DOCX_WORKERS: int = 2  # Processes rendering Word exports
+    DOCX_MAX_QUEUE: int = 16  # Exports allowed to wait for a free worker before new ones get 503
+
+    # Storage garbage collection
+    STORAGE_GC_ENABLED: bool = True
+    STORAGE_GC_INTERVAL_HOURS: int = 24
+    STORAGE_GC_GRACE_DAYS: int = 7  # How long an object must stay unreferenced before it is deleted
+    # Only log what the scheduled run would delete; review a few dry runs before turning this off
+    STORAGE_GC_DRY_RUN: bool = True
 
     @property
     def DATABASE_URL(self) -> str:
@@ -84,4 +282,4 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
-prompts = PromptsConfig()
+prompts = PromptsConfig(reload_interval=settings.PROMPTS_RELOAD_INTERVAL)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
 
@@ -14,3 +14,26 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def add_missing_columns(*tables):
+    """
+    Add columns (and their indexes) declared on the models but missing from
+    tables that already exist, plus declared indexes missing by name.
+    create_all() only creates missing tables; this covers new nullable
+    columns and indexes, not type changes or drops.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE `{table.name}` ADD COLUMN `{column.name}` {column_type} NULL"))
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
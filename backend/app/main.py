@@ -9,9 +9,9 @@ import logging
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-from .database import engine, Base, SessionLocal
+from .database import engine, Base, SessionLocal, add_missing_columns
 from .models import *
-from .routers import auth, users, projects, tasks, events, inspirations, reports, llm, files
+from .routers import auth, users, projects, tasks, events, inspirations, reports, llm, files, jobs, digests, upload_sessions
 from .utils.auth import get_password_hash
 from .models.user import User as UserModel, UserRole
 
@@ -39,7 +39,10 @@ app.include_router(events.router)
 app.include_router(inspirations.router)
 app.include_router(reports.router)
 app.include_router(llm.router)
+app.include_router(upload_sessions.router)
 app.include_router(files.router)
+app.include_router(jobs.router)
+app.include_router(digests.router)
 
 
 @app.on_event("startup")
@@ -47,6 +50,7 @@ async def startup():
     """Create tables, seed admin user, and init MinIO on startup."""
     # Create all tables
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(Attachment.__table__)
     
     # Seed admin user if not exists
     db = SessionLocal()
@@ -70,10 +74,29 @@ async def startup():
     
     # Initialize MinIO bucket
     try:
-        from .services.minio_service import ensure_bucket
-        ensure_bucket()
+        from .services.storage import ensure_bucket
+        await ensure_bucket()
     except Exception as e:
         logger.warning(f"MinIO initialization failed (file uploads will not work): {e}")
+    
+    # Start background job worker
+    from .services.jobs import start_worker
+    start_worker()
+    
+    # Start periodic task scheduler
+    from .services.scheduler import start_scheduler
+    start_scheduler()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background workers."""
+    from .services.scheduler import stop_scheduler
+    from .services.jobs import stop_worker
+    from .services.docx_pool import pool as docx_pool
+    await stop_scheduler()
+    await stop_worker()
+    docx_pool.shutdown()
 
 
 @app.get("/")
@@ -4,4 +4,9 @@ from .project import Project
 from .task import TaskAssignment
 from .event import TimelineEvent
 from .inspiration import Inspiration
-from .report import WeeklyReport, WeeklyReportDetail, Attachment
+from .report import WeeklyReport, WeeklyReportDetail, PersonalReportDraft, Attachment
+from .job import Job
+from .digest import ProjectWeekDigest
+from .llm_call import LLMCall
+from .upload_session import UploadSession, UploadSessionPart
+from .storage_gc import OrphanMark
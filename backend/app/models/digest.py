@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Integer, Date, DateTime, JSON, Text, UniqueConstraint
+from ..database import Base
+
+
+class ProjectWeekDigest(Base):
+    """
+    Materialised per-project, per-ISO-week activity digest.
+
+    Updated incrementally as events and tasks are written (see services/digest.py),
+    so monthly reports and dashboards read a handful of rows instead of raw events.
+    """
+    __tablename__ = "project_week_digest"
+    __table_args__ = (UniqueConstraint("project_id", "iso_year", "iso_week", name="uq_digest_project_week"),)
+
+    id = Column(String(36), primary_key=True, index=True)
+    project_id = Column(String(36), index=True, nullable=False)
+    iso_year = Column(Integer, nullable=False)
+    iso_week = Column(Integer, nullable=False)
+    week_start = Column(Date, index=True, nullable=False)  # Monday of the ISO week
+    event_counts = Column(JSON, default=dict)  # {EventType: count}
+    tasks_created = Column(Integer, default=0)
+    tasks_completed = Column(Integer, default=0)
+    tasks_deleted = Column(Integer, default=0)
+    progress_delta = Column(Integer, default=0)  # Sum of task progress changes, in percentage points
+    summary = Column(Text, nullable=True)  # Cached LLM summary, cleared when the week's events change
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, String, Enum as SQLEnum, DateTime, JSON, Integer, Boolean
+from ..database import Base
+import enum
+
+
+class JobStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+
+class Job(Base):
+    """Durable background job, claimed by in-process workers (see services/jobs.py)."""
+    __tablename__ = "jobs"
+
+    id = Column(String(36), primary_key=True, index=True)
+    type = Column(String(50), nullable=False)  # e.g. "report"
+    params = Column(JSON, default=dict)
+    status = Column(SQLEnum(JobStatus), default=JobStatus.PENDING, index=True)
+    progress = Column(Integer, default=0)  # 0-100
+    message = Column(String(500), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(String(2000), nullable=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    cancel_requested = Column(Boolean, default=False)
+    created_by = Column(String(36), index=True, nullable=False)
+    worker_id = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # RUNNING jobs past this are reclaimed
+    run_after = Column(DateTime, nullable=False)  # Earliest start, used for retry backoff
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
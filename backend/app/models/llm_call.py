@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, DateTime, Integer
+from ..database import Base
+
+
+class LLMCall(Base):
+    """One upstream LLM call, recorded by services/llm_metrics.py."""
+    __tablename__ = "llm_calls"
+
+    id = Column(String(36), primary_key=True, index=True)
+    prompt_key = Column(String(100), index=True, nullable=False)
+    prompt_version = Column(String(20), nullable=True)
+    model = Column(String(100), nullable=False)
+    user_id = Column(String(36), index=True, nullable=True)  # None for scheduled/system calls
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    ttft_ms = Column(Integer, nullable=True)  # Time to first token
+    latency_ms = Column(Integer, nullable=False)
+    outcome = Column(String(20), nullable=False)  # success | error | timeout | cancelled
+    error_type = Column(String(100), nullable=True)
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, index=True, nullable=False)
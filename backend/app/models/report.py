@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, JSON, ForeignKey
+from sqlalchemy import BigInteger, Column, String, DateTime, JSON, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from ..database import Base
 
@@ -33,12 +33,50 @@ class WeeklyReportDetail(Base):
     report = relationship("WeeklyReport", back_populates="details")
 
 
+class PersonalReportDraft(Base):
+    """AI draft of a user's personal report, pre-generated by the scheduler."""
+    __tablename__ = "personal_report_drafts"
+    __table_args__ = (UniqueConstraint("user_id", "week_start_date", name="uq_draft_user_week"),)
+
+    id = Column(String(36), primary_key=True, index=True)
+    user_id = Column(String(36), index=True, nullable=False)
+    week_start_date = Column(DateTime, nullable=False)
+    data = Column(JSON, nullable=False)  # Same shape as /api/llm/personal-report output
+    input_fingerprint = Column(String(64), nullable=True)  # personal_drafts.input_fingerprint of the inputs
+    # {project_ids, inspiration_ids, activity}: the selection the draft was made for, so the UI can preselect it,
+    # and personal_drafts.activity_fingerprint of the user's events and tasks in those projects
+    selection = Column(JSON, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+
+
 class Attachment(Base):
-    """Generic attachment table for future use."""
+    """
+    One reference to a stored file.
+
+    Files are stored once per content hash; every upload of the same bytes
+    adds a row pointing at the same object, so the reference count of an
+    object is the number of rows with its sha256.
+
+    A row is created unattached by an upload and claimed by the event or
+    report whose attachments JSON references it (entity_type/entity_id), so
+    listings and usage queries never need to scan JSON columns or MinIO.
+    """
     __tablename__ = "attachments"
+    __table_args__ = (
+        Index("ix_attachments_entity", "entity_type", "entity_id"),
+        Index("ix_attachments_url", "url", mysql_length=255),
+    )
 
     id = Column(String(36), primary_key=True, index=True)
     name = Column(String(500), nullable=False)
-    url = Column(String(1000), nullable=False)
+    url = Column(String(1000), nullable=False)  # Object name in the bucket, as stored in attachment JSON
     caption = Column(String(500), nullable=True)
-    folder = Column(String(200), nullable=True)
+    folder = Column(String(200), nullable=True)  # Classified folder, e.g. projects/{name}/图片
+    sha256 = Column(String(64), index=True, nullable=True)
+    size = Column(BigInteger, nullable=True)
+    content_type = Column(String(200), nullable=True)
+    owner_id = Column(String(36), index=True, nullable=True)
+    project_id = Column(String(36), index=True, nullable=True)
+    entity_type = Column(String(20), nullable=True)  # "event" or "report"; NULL until saved with one
+    entity_id = Column(String(36), nullable=True)
+    created_at = Column(DateTime, nullable=True)
@@ -0,0 +1,18 @@
+from sqlalchemy import BigInteger, Column, DateTime, String
+from ..database import Base
+
+
+class OrphanMark(Base):
+    """
+    A bucket object seen without any attachment reference (see services/storage_gc.py).
+
+    The object is deleted once it has stayed unreferenced for the grace
+    period; the mark is dropped as soon as a reference shows up again.
+    """
+    __tablename__ = "orphan_marks"
+
+    id = Column(String(64), primary_key=True)  # SHA-256 of object_name, which is too long to index
+    object_name = Column(String(1000), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    first_seen = Column(DateTime, nullable=False, index=True)
+    last_seen = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,40 @@
+from sqlalchemy import BigInteger, Column, DateTime, Enum as SQLEnum, Integer, String, UniqueConstraint
+from ..database import Base
+import enum
+
+
+class UploadSessionStatus(str, enum.Enum):
+    ACTIVE = "ACTIVE"
+    COMPLETED = "COMPLETED"
+    ABORTED = "ABORTED"
+
+
+class UploadSession(Base):
+    """Resumable chunked upload, backed by a MinIO multipart upload (see services/upload_sessions.py)."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(36), primary_key=True, index=True)
+    owner_id = Column(String(36), index=True, nullable=False)
+    filename = Column(String(500), nullable=False)
+    content_type = Column(String(200), nullable=False)
+    folder = Column(String(200), nullable=True)  # Classified folder, as for single uploads
+    object_name = Column(String(1000), nullable=False)
+    upload_id = Column(String(500), nullable=True)  # S3 multipart upload id
+    size = Column(BigInteger, nullable=False)  # Declared total size
+    chunk_size = Column(Integer, nullable=False)  # Every part but the last is exactly this size
+    status = Column(SQLEnum(UploadSessionStatus), default=UploadSessionStatus.ACTIVE, index=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # Abandoned sessions are aborted after this
+
+
+class UploadSessionPart(Base):
+    __tablename__ = "upload_session_parts"
+    __table_args__ = (UniqueConstraint("session_id", "part_number", name="uq_session_part"),)
+
+    id = Column(String(36), primary_key=True)
+    session_id = Column(String(36), index=True, nullable=False)
+    part_number = Column(Integer, nullable=False)  # 1-based
+    etag = Column(String(200), nullable=False)
+    size = Column(Integer, nullable=False)
+    uploaded_at = Column(DateTime, nullable=False)
@@ -0,0 +1,36 @@
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_db
+from ..schemas.digest import ProjectWeekDigestResponse
+from ..services import digest
+from ..utils.auth import get_current_user
+from ..models.user import User
+
+router = APIRouter(prefix="/api/digests", tags=["digests"])
+
+
+@router.get("", response_model=List[ProjectWeekDigestResponse])
+async def get_digests(
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    project_id: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Weekly project digests overlapping the date range, optionally for one project."""
+    return digest.get_digests(db, start_date, end_date, [project_id] if project_id else None)
+
+
+@router.post("/rebuild")
+async def rebuild_digests(
+    project_id: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Recompute digest event counts from the events table (admin only)."""
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    weeks = digest.rebuild_event_counts(db, project_id)
+    return {"message": "Digests rebuilt", "weeks": weeks}
@@ -10,7 +10,10 @@ from ..schemas.event import EventCreate, EventUpdate, EventResponse
 from ..utils.auth import get_current_user
 from ..models.user import User
 from ..services.docx_service import generate_event_docx
+from ..services import attachments, digest
+from ..services.docx_pool import ExportBusyError, pool as docx_pool
 from fastapi.responses import StreamingResponse
+from io import BytesIO
 from urllib.parse import quote
 
 router = APIRouter(prefix="/api/events", tags=["events"])
@@ -60,6 +63,10 @@ async def create_event(
         attachments=[att.model_dump() for att in event.attachments]
     )
     db.add(db_event)
+    attachments.sync_entity(
+        db, attachments.ENTITY_EVENT, db_event.id, db_event.project_id, db_event.attachments, current_user.id
+    )
+    digest.record_event_created(db, db_event)
     db.commit()
     db.refresh(db_event)
     return db_event
@@ -77,9 +84,16 @@ async def update_event(
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
+    old_type = event.type
     update_data = update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(event, key, value)
+    if "content" in update_data or "type" in update_data:
+        digest.record_event_updated(db, event, old_type)
+    if "attachments" in update_data:
+        attachments.sync_entity(
+            db, attachments.ENTITY_EVENT, event.id, event.project_id, event.attachments, current_user.id
+        )
     
     db.commit()
     db.refresh(event)
@@ -97,6 +111,8 @@ async def delete_event(
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
+    digest.record_event_deleted(db, event)
+    attachments.release_entity(db, attachments.ENTITY_EVENT, event.id)
     db.delete(event)
     db.commit()
     return {"message": "Event deleted"}
@@ -115,9 +131,12 @@ async def export_event(
         raise HTTPException(status_code=404, detail="Event not found")
         
     event_dto = EventResponse.model_validate(event)
-    event_data = event_dto.model_dump()
+    event_data = event_dto.model_dump(mode="json")
     
-    file_stream = generate_event_docx(event_data)
+    try:
+        file_stream = BytesIO(await docx_pool.render(generate_event_docx, event_data))
+    except ExportBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
     # Sanitize filename
     date_part = str(event.date)[:10] if event.date else "unknown"
@@ -1,20 +1,90 @@
 """
 File upload router - handles file uploads to MinIO.
 """
+import asyncio
 import logging
+import mimetypes
 import traceback
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
-from typing import Optional
-from ..utils.auth import get_current_user
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..utils.auth import FILE_SCOPE, get_current_user, decode_token, create_file_token
+from ..models.project import Project
 from ..models.user import User
-from ..services.minio_service import upload_file
+from ..config import settings
+from ..services import attachments, file_cache, storage, thumbnails
+from ..services.storage import FileTooLargeError
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
-# Image MIME types for auto-classification
-IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/svg+xml', 'image/bmp', 'image/x-icon'}
+# <img> and <a> cannot send the Authorization header, so file reads can use this cookie instead
+FILE_SESSION_COOKIE = "deptsync_files"
+
+async def _store_upload(
+    db: Session,
+    file: UploadFile,
+    folder: Optional[str],
+    project_name: Optional[str],
+    current_user: User,
+) -> dict:
+    """Store one uploaded file (deduplicated by content) and record its Attachment reference."""
+    max_size = settings.UPLOAD_MAX_SIZE_MB * 1024 * 1024
+    # Reject early when the multipart part declares its size
+    if file.size is not None and file.size > max_size:
+        raise FileTooLargeError(max_size)
+    
+    content_type = file.content_type or "application/octet-stream"
+    original_name = file.filename or "unnamed"
+    
+    minio_folder = attachments.classify_folder(content_type, folder, project_name, current_user.name)
+    
+    logger.info(f"Upload: file={original_name}, type={content_type}, folder={minio_folder}")
+    
+    # Hash the spooled upload first so known content never reaches MinIO again
+    sha256, file_size = await storage.hash_stream(file.file, max_size)
+    existing = attachments.find_by_hash(db, sha256)
+    if existing:
+        path = existing.url
+    else:
+        # Same content always maps to the same key, so concurrent uploads of it are harmless
+        result = await storage.upload_file(
+            file.file,
+            original_filename=original_name,
+            content_type=content_type,
+            max_size=max_size,
+            object_name=attachments.content_key(sha256, original_name),
+        )
+        path = result["path"]
+        if content_type in thumbnails.RESIZABLE_TYPES:
+            thumbnails.schedule_derivatives(path)
+    attachments.add_reference(
+        db, path, original_name, sha256, file_size, content_type, minio_folder, current_user.id
+    )
+    
+    # Construct proxy URL
+    url = f"/api/files/content/{path}"
+    
+    logger.info(f"Upload success: path={path}, url={url}, deduplicated={bool(existing)}")
+    return {
+        "url": url,   # Proxy URL for immediate display
+        "path": path, # Relative path for DB storage
+        "name": original_name,
+        "size": file_size,
+        "content_type": content_type,
+        "sha256": sha256,
+        "deduplicated": bool(existing),
+    }
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"文件过大，最大允许 {settings.UPLOAD_MAX_SIZE_MB}MB")
 
 
 @router.post("/upload")
@@ -22,73 +92,25 @@ async def upload(
     file: UploadFile = File(...),
     folder: Optional[str] = Form(None),
     project_name: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
     Upload a file to MinIO storage.
     
-    File classification:
-    - If project_name is given: projects/{project_name}/{图片|文档}/{file}
-    - If folder starts with 'reports': reports/{图片|文档}/{file}
-    - Otherwise: uploads/{图片|文档}/{file}
+    Files are stored once per content (objects/{sha256[:2]}/{sha256}.ext);
+    uploading bytes that are already stored skips the storage write. Each
+    upload is recorded as an Attachment reference with its classified folder:
+    - If project_name is given: projects/{project_name}/{图片|文档}
+    - If folder starts with 'reports': reports/{user}/{图片|文档}
+    - Otherwise: uploads/{图片|文档}
     
-    Returns the public URL, original filename, and file size.
+    Returns the public URL, original filename, file size and hash.
     """
     try:
-        file_data = await file.read()
-        file_size = len(file_data)
-        
-        # Limit file size to 50MB
-        max_size = 50 * 1024 * 1024
-        if file_size > max_size:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"文件过大，最大允许 50MB，当前 {file_size / 1024 / 1024:.1f}MB"
-            )
-        
-        content_type = file.content_type or "application/octet-stream"
-        original_name = file.filename or "unnamed"
-        
-        # Auto-classify file type based on content_type
-        file_category = "图片" if content_type in IMAGE_TYPES else "文档"
-        
-        # Build folder path
-        if project_name:
-            # Sanitize project name for path safety
-            safe_name = project_name.replace(" ", "_")
-            for ch in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
-                safe_name = safe_name.replace(ch, '')
-            minio_folder = f"projects/{safe_name}/{file_category}"
-        elif folder and folder.startswith("reports"):
-            safe_user = current_user.name.replace(" ", "_")
-            for ch in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
-                safe_user = safe_user.replace(ch, '')
-            minio_folder = f"reports/{safe_user}/{file_category}"
-        elif folder:
-            minio_folder = f"{folder}/{file_category}"
-        else:
-            minio_folder = f"uploads/{file_category}"
-        
-        logger.info(f"Upload: file={original_name}, type={content_type}, category={file_category}, folder={minio_folder}")
-        
-        path = upload_file(
-            file_data=file_data,
-            original_filename=original_name,
-            content_type=content_type,
-            folder=minio_folder,
-        )
-        
-        # Construct proxy URL
-        url = f"/api/files/content/{path}"
-        
-        logger.info(f"Upload success: path={path}, url={url}")
-        return {
-            "url": url,   # Proxy URL for immediate display
-            "path": path, # Relative path for DB storage
-            "name": original_name,
-            "size": file_size,
-            "content_type": content_type,
-        }
+        return await _store_upload(db, file, folder, project_name, current_user)
+    except FileTooLargeError:
+        raise _too_large()
     except HTTPException:
         raise
     except Exception as e:
@@ -96,23 +118,339 @@ async def upload(
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 
-@router.get("/content/{file_path:path}")
-async def get_file_content(file_path: str):
+@router.post("/upload-batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    folder: Optional[str] = Form(None),
+    project_name: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Upload several files in one request, with the same classification and
+    deduplication as /upload.
+
+    Files are written to storage concurrently, at most UPLOAD_BATCH_CONCURRENCY
+    at a time. Returns {"results": [...]} in request order; each entry is the
+    /upload response, or {"name", "error", "status_code"} for a file that
+    failed, so one bad file doesn't fail the batch.
+    """
+    if len(files) > settings.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"一次最多上传 {settings.UPLOAD_BATCH_MAX_FILES} 个文件")
+    semaphore = asyncio.Semaphore(max(1, settings.UPLOAD_BATCH_CONCURRENCY))
+
+    async def store(file: UploadFile) -> dict:
+        # The DB calls in _store_upload are synchronous, so sharing the session between tasks is safe
+        async with semaphore:
+            try:
+                return await _store_upload(db, file, folder, project_name, current_user)
+            except FileTooLargeError:
+                error = _too_large()
+            except Exception as e:
+                logger.error(f"Batch upload of {file.filename} failed: {e}\n{traceback.format_exc()}")
+                db.rollback()
+                error = HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
+            return {"name": file.filename or "unnamed", "error": error.detail, "status_code": error.status_code}
+
+    results = await asyncio.gather(*(store(f) for f in files))
+    return {"results": results}
+
+
+def _attachment_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "name": row.name,
+        "url": f"/api/files/content/{row.url}",
+        "path": row.url,
+        "caption": row.caption,
+        "folder": row.folder,
+        "size": row.size,
+        "content_type": row.content_type,
+        "sha256": row.sha256,
+        "owner_id": row.owner_id,
+        "project_id": row.project_id,
+        "entity_type": row.entity_type,
+        "entity_id": row.entity_id,
+        "created_at": row.created_at,
+    }
+
+
+@router.get("/attachments")
+async def list_attachments(
+    project_id: Optional[str] = Query(None),
+    entity_type: Optional[str] = Query(None),
+    entity_id: Optional[str] = Query(None),
+    owner_id: Optional[str] = Query(None),
+    path: Optional[str] = Query(None),
+    include_unattached: bool = Query(False),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Attachments from the attachment index, newest first.
+
+    Filter by project, by referencing event/report, by owner, or by `path`
+    (object name or proxy URL) to see everywhere a file is used. Uploads not
+    yet saved with an event or report are only included on request.
+    """
+    rows = attachments.list_attachments(
+        db, project_id, entity_type, entity_id, owner_id, path, include_unattached, limit, offset
+    )
+    return [_attachment_dict(row) for row in rows]
+
+
+@router.get("/usage")
+async def get_storage_usage(
+    group_by: str = Query("project", pattern="^(project|owner)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Attachment counts and bytes per project or per owner, from the attachment index."""
+    summary = attachments.usage_summary(db, group_by)
+    keys = [g["key"] for g in summary["groups"] if g["key"]]
+    if group_by == "project":
+        names = dict(db.query(Project.id, Project.title).filter(Project.id.in_(keys)).all()) if keys else {}
+    else:
+        names = dict(db.query(User.id, User.username).filter(User.id.in_(keys)).all()) if keys else {}
+    for group in summary["groups"]:
+        group["name"] = names.get(group["key"])
+    return summary
+
+
+@router.post("/gc")
+async def run_storage_gc(
+    dry_run: bool = Query(True),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Run storage garbage collection now (admin only). Defaults to a dry run
+    reporting unreferenced objects and reclaimable bytes without deleting.
     """
-    Proxy endpoint to stream file content from MinIO.
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    from ..services import storage_gc
+    return await storage_gc.run(dry_run=dry_run)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
     """
-    from fastapi.responses import StreamingResponse
-    from ..services.minio_service import get_file_stream
-    import mimetypes
+    Parse a single-range `Range: bytes=...` header into inclusive (start, end).
 
+    Returns None for headers we don't handle (multiple ranges, other units),
+    which are answered with the full object. Raises 416 when unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
     try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = size - int(last), size - 1  # Suffix range: last N bytes
+    except ValueError:
+        return None
+    start, end = max(0, start), min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range Not Satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+class _CachedFileResponse(FileResponse):
+    """FileResponse for a disk cache hit; keeps the file pinned against eviction until sent."""
+
+    def __init__(self, cache: file_cache.DiskCache, entry: file_cache.CachedObject, **kwargs):
+        super().__init__(entry.path, **kwargs)
+        self._cache = cache
+        self._entry = entry
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._cache.unpin(self._entry)
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+@router.post("/session")
+async def open_file_session(response: Response, current_user: User = Depends(get_current_user)):
+    """
+    Set the file session cookie: a short-lived, files-only token scoped to
+    /api/files, so attachment URLs need no credentials in the query string.
+    """
+    max_age = settings.FILE_SESSION_MINUTES * 60
+    response.set_cookie(
+        FILE_SESSION_COOKIE,
+        create_file_token(current_user.id),
+        max_age=max_age,
+        path="/api/files",
+        httponly=True,
+        secure=settings.FILE_COOKIE_SECURE,
+        samesite="lax",
+    )
+    return {"expires_in": max_age}
+
+
+@router.delete("/session")
+async def close_file_session(response: Response):
+    """Clear the file session cookie (on logout)."""
+    response.delete_cookie(FILE_SESSION_COOKIE, path="/api/files")
+    return {"message": "ok"}
+
+
+def _check_file_access(request: Request):
+    """
+    With FILE_REQUIRE_AUTH, require an API access token or a file token in the
+    Authorization header, or a file token in the session cookie.
+    """
+    if not settings.FILE_REQUIRE_AUTH:
+        return
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        payload = decode_token(auth[7:])
+        allowed_scopes = (None, FILE_SCOPE)
+    else:
+        cookie = request.cookies.get(FILE_SESSION_COOKIE)
+        payload = decode_token(cookie) if cookie else None
+        allowed_scopes = (FILE_SCOPE,)
+    if payload and payload.get("scope") not in allowed_scopes:
+        payload = None
+    if not payload or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+
+@router.get("/content/{file_path:path}")
+async def get_file_content(
+    file_path: str,
+    request: Request,
+    size: Optional[str] = Query(None),
+):
+    """
+    Serve file content from MinIO according to FILE_SERVE_MODE.
+
+    - redirect: 302 to a short-lived presigned MinIO URL
+    - accel: empty response with X-Accel-Redirect for the fronting proxy
+    - proxy (default): stream through the API. Sends Content-Length, ETag and
+      Last-Modified from the object, answers conditional requests with 304
+      and single byte ranges with 206. Object names contain a UUID, so
+      responses are cacheable as immutable. With FILE_CACHE_DIR set, small
+      objects are kept on local disk and served from there.
+
+    `size` (thumb or preview) serves a resized WebP derivative of an image,
+    generated on first request; other files are served unchanged.
+    """
+    _check_file_access(request)
+    if size:
+        if size not in thumbnails.DERIVATIVE_SIZES:
+            raise HTTPException(status_code=400, detail=f"size 必须是 {', '.join(thumbnails.DERIVATIVE_SIZES)} 之一")
+        if thumbnails.is_resizable(file_path):
+            try:
+                file_path = await thumbnails.ensure_derivative(file_path, size)
+            except Exception as e:
+                logger.warning(f"Derivative {size} of {file_path} unavailable, serving original: {e}")
+    cache_scope = "private" if settings.FILE_REQUIRE_AUTH else "public"
+
+    # The API only handles metadata; MinIO (or the proxy) serves the bytes, ranges and validators
+    if settings.FILE_SERVE_MODE == "redirect":
+        url = await storage.presigned_url(file_path, settings.FILE_PRESIGN_EXPIRES_SECONDS)
+        # Let the browser reuse the redirect while the signature is still valid
+        max_age = settings.FILE_PRESIGN_EXPIRES_SECONDS // 2
+        return RedirectResponse(url, status_code=302, headers={"Cache-Control": f"private, max-age={max_age}"})
+    if settings.FILE_SERVE_MODE == "accel":
+        internal = f"{settings.FILE_ACCEL_PREFIX.rstrip('/')}/{settings.MINIO_BUCKET}/{quote(file_path)}"
+        return Response(headers={
+            "X-Accel-Redirect": internal,
+            "Cache-Control": f"{cache_scope}, max-age=31536000, immutable",
+        })
+
+    cache = file_cache.cache
+    cached = cache.get(file_path) if cache else None
+    if cached:
+        meta = cached.meta  # Object names are immutable, so a hit needs no round trip to MinIO
+    else:
+        try:
+            meta = file_cache.ObjectMeta.from_stat(await storage.stat_object(file_path))
+        except Exception as e:
+            logger.error(f"File proxy failed: {e}")
+            raise HTTPException(status_code=404, detail="File not found")
+
+    mime_type = meta.content_type
+    if not mime_type or mime_type == "application/octet-stream":
         # Get generic mime type based on extension
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if not mime_type:
-            mime_type = "application/octet-stream"
+        mime_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    etag = f'"{meta.etag}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(meta.last_modified, usegmt=True),
+        "Cache-Control": f"{cache_scope}, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if _not_modified(request, etag, meta.last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if not cached and cache and cache.cacheable(meta):
+        # Concurrent misses for the same object wait on one download; None if it failed
+        cached = await cache.fetch(file_path, meta)
+
+    size = meta.size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: only honour the range if the client's copy is still current
+    if range_header and (not if_range or if_range == etag or if_range == headers["Last-Modified"]):
+        byte_range = _parse_range(range_header, size)
+
+    # A cached file removed since the lookup is a miss and falls through to MinIO
+    if cached and byte_range:
+        cached_file = cache.open(file_path, cached)
+        if cached_file:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                file_cache.iter_file_range(cached_file, start, end - start + 1),
+                status_code=206, media_type=mime_type, headers=headers,
+            )
+    elif cached and cache.pin(file_path, cached):
+        return _CachedFileResponse(cache, cached, media_type=mime_type, headers=headers)
 
-        file_stream = get_file_stream(file_path)
-        return StreamingResponse(file_stream, media_type=mime_type)
+    try:
+        if byte_range:
+            start, end = byte_range
+            file_stream = await storage.open_object(file_path, start, end - start + 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            status_code = 206
+        else:
+            file_stream = await storage.open_object(file_path)
+            headers["Content-Length"] = str(size)
+            status_code = 200
     except Exception as e:
         logger.error(f"File proxy failed: {e}")
         raise HTTPException(status_code=404, detail="File not found")
+    return StreamingResponse(file_stream.iter_chunks(), status_code=status_code, media_type=mime_type, headers=headers)
+
+
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    """Disk cache usage and hit rate for the file proxy (admin only)."""
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if file_cache.cache is None:
+        return {"enabled": False}
+    return file_cache.cache.snapshot()
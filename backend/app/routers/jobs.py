@@ -0,0 +1,117 @@
+"""
+Background job router - enqueue long-running report generation and poll results.
+"""
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_db, SessionLocal
+from ..models.job import Job, JobStatus
+from ..models.user import User
+from ..schemas.job import ReportJobCreate, JobResponse
+from ..services.jobs import enqueue_job, cancel_job, TERMINAL_STATUSES
+from ..utils.auth import get_current_user
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+def _get_own_job(db: Session, job_id: str, current_user: User) -> Job:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.created_by != current_user.id and current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return job
+
+
+@router.post("/reports", response_model=JobResponse)
+async def create_report_job(
+    request: ReportJobCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Queue a report generation job. Returns immediately with the job id."""
+    params = dict(request.params)
+    params["report_type"] = request.report_type
+    if request.report_type == "personal":
+        params["username"] = str(current_user.username)
+    return enqueue_job(db, "report", params, current_user.id, request.max_attempts)
+
+
+@router.get("", response_model=List[JobResponse])
+async def get_jobs(
+    status: Optional[JobStatus] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List the current user's jobs, newest first."""
+    query = db.query(Job).filter(Job.created_by == current_user.id)
+    if status:
+        query = query.filter(Job.status == status)
+    return query.order_by(Job.created_at.desc()).limit(limit).all()
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get job status, progress and result."""
+    return _get_own_job(db, job_id, current_user)
+
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel a pending or running job."""
+    job = _get_own_job(db, job_id, current_user)
+    if job.status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status.value}")
+    return cancel_job(db, job)
+
+
+def _load_job_snapshot(job_id: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        return jsonable_encoder(JobResponse.model_validate(job)) if job else None
+    finally:
+        db.close()
+
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Server-Sent Events stream of job progress, closed once the job finishes."""
+    _get_own_job(db, job_id, current_user)
+
+    async def event_stream():
+        last_sent = None
+        while True:
+            snapshot = await asyncio.to_thread(_load_job_snapshot, job_id)
+            if snapshot is None:
+                return
+            key = (snapshot["status"], snapshot["progress"], snapshot["updated_at"])
+            if key != last_sent:
+                last_sent = key
+                yield f"event: progress\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if JobStatus(snapshot["status"]) in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends
+import json
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional, Literal
+from ..database import get_db
 from ..services import llm
 from ..utils.auth import get_current_user
 from ..models.user import User
@@ -13,6 +18,12 @@ class DeptMonthlyReportRequest(BaseModel):
     events: List[Dict[str, Any]]
     start_date: str
     end_date: str
+    mode: Literal["single", "hierarchical"] = "single"
+
+
+class DigestMonthlyReportRequest(BaseModel):
+    start_date: date
+    end_date: date
 
 
 class ProjectWeeklyReportRequest(BaseModel):
@@ -21,6 +32,11 @@ class ProjectWeeklyReportRequest(BaseModel):
     week_range: str
 
 
+class ProjectWeeklyBatchRequest(BaseModel):
+    week_start: Optional[date] = None  # Defaults to the current week's Monday
+    run_async: bool = False  # Queue as a background job instead of waiting
+
+
 class ProjectReportRequest(BaseModel):
     project: Dict[str, Any]
     events: List[Dict[str, Any]]
@@ -32,14 +48,24 @@ class ProjectReportRequest(BaseModel):
 class PersonalReportRequest(BaseModel):
     projects: List[Dict[str, Any]]
     inspirations: List[Dict[str, Any]]
+    refresh: bool = False  # Ignore the pre-generated draft and generate now
 
 
 class LLMResponse(BaseModel):
     content: str
+    prompt_version: Optional[str] = None  # Version of prompts.yaml used for this generation
 
 
 class PersonalReportResponse(BaseModel):
     data: Dict[str, Any]
+    draft_created_at: Optional[datetime] = None  # Set when served from a pre-generated draft
+    prompt_version: Optional[str] = None
+
+
+class PersonalDraftResponse(BaseModel):
+    project_ids: List[str]
+    inspiration_ids: List[str]
+    draft_created_at: datetime
 
 
 @router.post("/dept-monthly-report", response_model=LLMResponse)
@@ -52,9 +78,26 @@ async def generate_dept_monthly_report(
         request.projects,
         request.events,
         request.start_date,
-        request.end_date
+        request.end_date,
+        request.mode,
+        user_id=current_user.id
     )
-    return LLMResponse(content=result)
+    return LLMResponse(content=result, prompt_version=llm.current_prompt_version())
+
+
+@router.post("/dept-monthly-report/from-digests", response_model=LLMResponse)
+async def generate_dept_monthly_report_from_digests(
+    request: DigestMonthlyReportRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Generate department monthly report from the stored weekly project digests."""
+    from ..services.digest import generate_dept_monthly_report_from_digests
+    result = await generate_dept_monthly_report_from_digests(
+        request.start_date,
+        request.end_date,
+        user_id=current_user.id
+    )
+    return LLMResponse(content=result, prompt_version=llm.current_prompt_version())
 
 
 @router.post("/project-weekly-report", response_model=LLMResponse)
@@ -66,9 +109,40 @@ async def generate_project_weekly_report(
     result = await llm.generate_project_weekly_report(
         request.project,
         request.personal_reports,
-        request.week_range
+        request.week_range,
+        user_id=current_user.id
     )
-    return LLMResponse(content=result)
+    return LLMResponse(content=result, prompt_version=llm.current_prompt_version())
+
+
+@router.post("/project-weekly-report/batch")
+async def generate_project_weekly_reports_batch(
+    request: ProjectWeeklyBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Generate weekly reports for all EXECUTION projects and save them as
+    WEEKLY_REPORT timeline events (admin only).
+
+    Returns a summary of timings and failures, or the queued job when run_async is set.
+    """
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    author = {"id": current_user.id, "username": current_user.username}
+    if request.run_async:
+        from ..services.jobs import enqueue_job
+        from ..schemas.job import JobResponse
+        params = {"author": author, "week_start": request.week_start.isoformat() if request.week_start else None}
+        job = enqueue_job(db, "project_weekly_batch", params, current_user.id)
+        return JobResponse.model_validate(job)
+    
+    from ..services.report_batch import generate_all_project_weekly_reports
+    try:
+        return await generate_all_project_weekly_reports(author, request.week_start)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 
 @router.post("/project-report", response_model=LLMResponse)
@@ -82,24 +156,94 @@ async def generate_project_report(
         request.events,
         request.tasks,
         request.start_date,
-        request.end_date
+        request.end_date,
+        user_id=current_user.id
     )
-    return LLMResponse(content=result)
+    return LLMResponse(content=result, prompt_version=llm.current_prompt_version())
 
 
 @router.post("/personal-report", response_model=PersonalReportResponse)
 @router.post("/generate-personal-report", response_model=PersonalReportResponse)
 async def generate_personal_report(
     request: PersonalReportRequest,
+    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Generate personal weekly report suggestions."""
+    """
+    Generate personal weekly report suggestions, or return this week's
+    pre-generated draft when it was made for the same selection and is still current.
+    """
+    if not request.refresh:
+        from ..services.personal_drafts import get_current_draft
+        draft = get_current_draft(db, current_user.id, request.projects, request.inspirations)
+        if draft:
+            return PersonalReportResponse(data=draft.data, draft_created_at=draft.created_at)
+    
     result = await llm.generate_personal_report(
         str(current_user.username),
         request.projects,
-        request.inspirations
+        request.inspirations,
+        user_id=current_user.id
+    )
+    return PersonalReportResponse(data=result, prompt_version=llm.current_prompt_version())
+
+
+@router.get("/personal-report/draft", response_model=Optional[PersonalDraftResponse])
+async def get_personal_report_draft(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Selection of this week's pre-generated draft, or null if there is none or
+    it is out of date. Generating with exactly this selection returns the draft.
+    """
+    from ..services.personal_drafts import get_draft_for_selection
+    draft = get_draft_for_selection(db, current_user.id)
+    if draft is None:
+        return None
+    return PersonalDraftResponse(
+        project_ids=draft.selection["project_ids"],
+        inspiration_ids=draft.selection["inspiration_ids"],
+        draft_created_at=draft.created_at,
+    )
+
+
+@router.post("/personal-report/stream")
+async def stream_personal_report(
+    request: PersonalReportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-sent events version of /personal-report.
+
+    Emits `field` ({project_id, field, value}) and `summary` ({value}) as each
+    value completes, `error` for a project that could not be generated, and
+    `done` with the full result. A current pre-generated draft for the same
+    selection is sent as `done` directly.
+    """
+    draft_data = None
+    if not request.refresh:
+        from ..services.personal_drafts import get_current_draft
+        draft = get_current_draft(db, current_user.id, request.projects, request.inspirations)
+        if draft:
+            draft_data = {"data": draft.data, "draft_created_at": draft.created_at.isoformat()}
+    username, user_id = str(current_user.username), current_user.id
+    
+    async def event_stream():
+        if draft_data:
+            yield f"event: done\ndata: {json.dumps(draft_data, ensure_ascii=False)}\n\n"
+            return
+        async for event, payload in llm.stream_personal_report(
+            username, request.projects, request.inspirations, user_id=user_id
+        ):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    return PersonalReportResponse(data=result)
 
 
 # 通用报告生成端点
@@ -119,9 +263,10 @@ async def generate_report(
                 request.get("events", []),
                 request.get("tasks", []),
                 request.get("start_date", ""),
-                request.get("end_date", "")
+                request.get("end_date", ""),
+                user_id=current_user.id
             )
-            return {"content": result, "type": "project"}
+            return {"content": result, "type": "project", "prompt_version": llm.current_prompt_version()}
             
         elif report_type == "dept_monthly":
             # 部门月报
@@ -129,38 +274,75 @@ async def generate_report(
                 request.get("projects", []),
                 request.get("events", []),
                 request.get("start_date", ""),
-                request.get("end_date", "")
+                request.get("end_date", ""),
+                request.get("mode", "single"),
+                user_id=current_user.id
             )
-            return {"content": result, "type": "dept_monthly"}
+            return {"content": result, "type": "dept_monthly", "prompt_version": llm.current_prompt_version()}
             
         elif report_type == "project_weekly":
             # 项目周报
             result = await llm.generate_project_weekly_report(
                 request.get("project", {}),
                 request.get("personal_reports", []),
-                request.get("week_range", "")
+                request.get("week_range", ""),
+                user_id=current_user.id
             )
-            return {"content": result, "type": "project_weekly"}
+            return {"content": result, "type": "project_weekly", "prompt_version": llm.current_prompt_version()}
             
         elif report_type == "personal":
             # 个人报告
             result = await llm.generate_personal_report(
                 str(current_user.username),
                 request.get("projects", []),
-                request.get("inspirations", [])
+                request.get("inspirations", []),
+                user_id=current_user.id
             )
-            return {"data": result, "type": "personal"}
+            return {"data": result, "type": "personal", "prompt_version": llm.current_prompt_version()}
             
         else:
-            from fastapi import HTTPException
             raise HTTPException(
                 status_code=400,
                 detail=f"不支持的报告类型: {report_type}。支持的类型: project, dept_monthly, project_weekly, personal"
             )
             
     except Exception as e:
-        from fastapi import HTTPException
         raise HTTPException(
             status_code=500,
             detail=f"生成报告时出错: {str(e)}"
         )
+
+
+@router.get("/metrics")
+async def get_llm_metrics(current_user: User = Depends(get_current_user)):
+    """
+    In-process LLM metrics (admin only): limiter queue depth, in-flight calls,
+    coalescing and wait times, per endpoint breaker state, timeouts, hedging
+    and latency, plus per prompt key call totals since start.
+    """
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    from ..services.llm_limiter import limiter
+    from ..services.llm_router import router as model_router
+    from ..services import llm_metrics
+    return {"limiter": limiter.snapshot(), "endpoints": model_router.snapshot(), "calls": llm_metrics.snapshot()}
+
+
+@router.get("/usage")
+async def get_llm_usage(
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """LLM usage from the llm_calls table, per report type and per user (admin only)."""
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    from ..services.llm_metrics import usage_summary
+    summary = usage_summary(db, start_date, end_date)
+    
+    user_ids = [row["key"] for row in summary["by_user"] if row["key"]]
+    names = dict(db.query(User.id, User.username).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+    for row in summary["by_user"]:
+        row["username"] = names.get(row["key"], "系统任务" if not row["key"] else None)
+    return summary
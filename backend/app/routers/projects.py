@@ -8,6 +8,7 @@ from ..models.project import Project
 from ..schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse
 from ..utils.auth import get_current_user
 from ..models.user import User
+from ..services import attachments
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
@@ -76,6 +77,7 @@ async def delete_project(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
+    attachments.release_project(db, project.id)
     db.delete(project)
     db.commit()
     return {"message": "Project deleted"}
@@ -95,6 +97,8 @@ async def export_project_timeline(
     """
     from fastapi.responses import StreamingResponse
     from ..services.docx_service import generate_timeline_docx
+    from ..services.docx_pool import ExportBusyError, pool as docx_pool
+    from io import BytesIO
     from ..models.event import TimelineEvent
     from ..schemas.event import EventResponse
     from datetime import datetime
@@ -115,9 +119,12 @@ async def export_project_timeline(
         raise HTTPException(status_code=404, detail="No events found to export")
         
     # Serialize events
-    events_data = [EventResponse.model_validate(e).model_dump() for e in events]
+    events_data = [EventResponse.model_validate(e).model_dump(mode="json") for e in events]
     
-    file_stream = generate_timeline_docx(project.title, events_data)
+    try:
+        file_stream = BytesIO(await docx_pool.render(generate_timeline_docx, project.title, events_data))
+    except ExportBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
     date_str = datetime.now().strftime('%Y%m%d')
     filename = f"timeline_{project.title}_{date_str}.docx"
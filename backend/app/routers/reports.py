@@ -1,6 +1,7 @@
 import uuid
+from io import BytesIO
 from urllib.parse import quote
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database import get_db
@@ -9,6 +10,8 @@ from ..models.report import WeeklyReport, WeeklyReportDetail
 from ..schemas.report import ReportCreate, ReportResponse
 from ..utils.auth import get_current_user
 from ..models.user import User
+from ..services import attachments
+from ..services.docx_pool import ExportBusyError, pool as docx_pool
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
@@ -51,6 +54,9 @@ async def create_report(
         created_at=now_beijing()
     )
     db.add(db_report)
+    attachments.sync_entity(
+        db, attachments.ENTITY_REPORT, report_id, None, db_report.attachments, current_user.id
+    )
     
     # Add details
     for detail in report.details:
@@ -69,6 +75,61 @@ async def create_report(
     return db_report
 
 
+TEMPLATE_MAX_SIZE = 5 * 1024 * 1024
+
+
+@router.get("/export-template")
+async def get_export_template(current_user: User = Depends(get_current_user)):
+    """Download the DOCX template exports are built on: the custom one if set, else the built-in one."""
+    from fastapi.responses import Response
+    from ..services import docx_service, docx_templates
+    
+    data = await docx_templates.current()
+    filename = "export_template.docx"
+    if data is None:
+        data = docx_service.default_template()
+        filename = "export_template_default.docx"
+    return Response(
+        content=data,
+        media_type=docx_templates.TEMPLATE_CONTENT_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@router.put("/export-template")
+async def upload_export_template(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload a corporate .docx template for all exports (admin only). Its
+    styles, page setup, headers and footers are kept; its body is ignored.
+    """
+    from ..services import docx_templates
+    
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    data = await file.read(TEMPLATE_MAX_SIZE + 1)
+    if len(data) > TEMPLATE_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="模板文件过大，最大允许 5MB")
+    try:
+        await docx_templates.save(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Template updated", "size": len(data)}
+
+
+@router.delete("/export-template")
+async def reset_export_template(current_user: User = Depends(get_current_user)):
+    """Go back to the built-in export template (admin only)."""
+    from ..services import docx_templates
+    
+    if current_user.role.value != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin only")
+    await docx_templates.reset()
+    return {"message": "Template reset"}
+
+
 @router.delete("/{report_id}")
 async def delete_report(
     report_id: str, 
@@ -80,6 +141,7 @@ async def delete_report(
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     
+    attachments.release_entity(db, attachments.ENTITY_REPORT, report.id)
     db.delete(report)
     db.commit()
     return {"message": "Report deleted"}
@@ -101,9 +163,12 @@ async def export_report(
     
     # Serialize via Pydantic to ensure all fields/relationships are loaded
     report_dto = ReportResponse.model_validate(report)
-    report_data = report_dto.model_dump()
+    report_data = report_dto.model_dump(mode="json")
     
-    file_stream = generate_report_docx(report_data)
+    try:
+        file_stream = BytesIO(await docx_pool.render(generate_report_docx, report_data))
+    except ExportBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
     # Safe filename
     date_str = report.created_at.strftime('%Y%m%d')
@@ -120,40 +185,24 @@ async def export_report(
 @router.post("/batch-export")
 async def batch_export_reports(
     report_ids: List[str],
-    db: Session = Depends(get_db),
     # current_user: User = Depends(get_current_user)
 ):
-    """Export multiple reports as a ZIP file containing DOCX files."""
+    """
+    Export multiple reports as a ZIP file containing DOCX files.
+
+    The archive is streamed: documents are rendered in parallel in the DOCX
+    process pool and each is sent as soon as it is ready, stored without
+    recompression.
+    """
     from fastapi.responses import StreamingResponse
-    from ..services.docx_service import generate_report_docx
-    import zipfile
-    from io import BytesIO
-    from fastapi.encoders import jsonable_encoder
+    from ..services.report_export import existing_report_ids, stream_reports_zip
     
-    reports = db.query(WeeklyReport).filter(WeeklyReport.id.in_(report_ids)).all()
-    if not reports:
+    report_ids = existing_report_ids(report_ids)
+    if not report_ids:
         raise HTTPException(status_code=404, detail="No reports found")
-        
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for report in reports:
-            report_dto = ReportResponse.model_validate(report)
-            report_data = report_dto.model_dump()
-            
-            docx_stream = generate_report_docx(report_data)
-            
-            date_str = report.created_at.strftime('%Y%m%d')
-            filename = f"report_{report.username}_{date_str}.docx"
-            
-            # Handle duplicate filenames
-            if filename in zip_file.namelist():
-                filename = f"report_{report.username}_{date_str}_{report.id[:4]}.docx"
-
-            zip_file.writestr(filename, docx_stream.getvalue())
-            
-    zip_buffer.seek(0)
+    
     return StreamingResponse(
-        zip_buffer,
+        stream_reports_zip(report_ids),
         media_type="application/zip",
         headers={"Content-Disposition": "attachment; filename=reports_batch.zip"}
     )
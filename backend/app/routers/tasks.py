@@ -8,6 +8,7 @@ from ..models.task import TaskAssignment
 from ..schemas.task import TaskCreate, TaskUpdate, TaskResponse
 from ..utils.auth import get_current_user
 from ..models.user import User
+from ..services import digest
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
@@ -46,6 +47,10 @@ async def create_task(
         **task.model_dump()
     )
     db.add(db_task)
+    digest.record_task_change(
+        db, db_task.project_id,
+        new_status=db_task.status, new_progress=db_task.progress or 0, created=True
+    )
     db.commit()
     db.refresh(db_task)
     return db_task
@@ -79,8 +84,14 @@ async def update_task(
                 except ValueError:
                     pass # Keep original if parsing fails
 
+    old_status, old_progress = task.status, task.progress or 0
     for key, value in update_data.items():
         setattr(task, key, value)
+    digest.record_task_change(
+        db, task.project_id,
+        old_status=old_status, new_status=task.status,
+        old_progress=old_progress, new_progress=task.progress or 0
+    )
     
     db.commit()
     db.refresh(task)
@@ -98,6 +109,7 @@ async def delete_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    digest.record_task_change(db, task.project_id, old_status=task.status, new_status=task.status, deleted=True)
     db.delete(task)
     db.commit()
     return {"message": "Task deleted"}
@@ -0,0 +1,143 @@
+"""
+Resumable upload sessions for large files (see services/upload_sessions.py).
+
+    POST   /api/files/upload-sessions                  start a session
+    GET    /api/files/upload-sessions/{id}             status and received parts (resume)
+    PUT    /api/files/upload-sessions/{id}/parts/{n}   upload chunk n (raw body, 1-based)
+    POST   /api/files/upload-sessions/{id}/complete    assemble the file
+    DELETE /api/files/upload-sessions/{id}             abort
+"""
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import get_db
+from ..models.upload_session import UploadSession, UploadSessionStatus
+from ..models.user import User
+from ..schemas.upload_session import UploadSessionCreate, UploadSessionResponse, UploadPartResponse
+from ..services import attachments, upload_sessions
+from ..utils.auth import get_current_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/files/upload-sessions", tags=["files"])
+
+
+def _get_own_session(db: Session, session_id: str, current_user: User, active: bool = True) -> UploadSession:
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    if active and session.status != UploadSessionStatus.ACTIVE:
+        raise HTTPException(status_code=409, detail=f"Upload session already {session.status.value}")
+    return session
+
+
+def _session_response(db: Session, session: UploadSession) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        id=session.id,
+        filename=session.filename,
+        content_type=session.content_type,
+        size=session.size,
+        chunk_size=session.chunk_size,
+        part_count=upload_sessions.part_count(session),
+        status=session.status,
+        uploaded_parts=[p.part_number for p in upload_sessions.uploaded_parts(db, session.id)],
+        expires_at=session.expires_at,
+    )
+
+
+@router.post("", response_model=UploadSessionResponse)
+async def create_upload_session(
+    request: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Start a resumable upload. The response gives the chunk size and number of parts to send."""
+    max_size = settings.UPLOAD_SESSION_MAX_SIZE_MB * 1024 * 1024
+    if request.size > max_size:
+        raise HTTPException(status_code=413, detail=f"文件过大，最大允许 {settings.UPLOAD_SESSION_MAX_SIZE_MB}MB")
+    content_type = request.content_type or "application/octet-stream"
+    folder = attachments.classify_folder(content_type, request.folder, request.project_name, current_user.name)
+    session = await upload_sessions.create_session(
+        db, current_user.id, request.filename or "unnamed", content_type, folder, request.size
+    )
+    logger.info(f"Upload session {session.id}: file={session.filename}, size={session.size}, folder={folder}")
+    return _session_response(db, session)
+
+
+@router.get("/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Session status; uploaded_parts tells an interrupted client which chunks it can skip."""
+    return _session_response(db, _get_own_session(db, session_id, current_user, active=False))
+
+
+@router.put("/{session_id}/parts/{part_number}", response_model=UploadPartResponse)
+async def upload_session_part(
+    session_id: str,
+    part_number: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload one chunk as the raw request body. Chunks may be sent in parallel and re-sent."""
+    session = _get_own_session(db, session_id, current_user)
+    if not 1 <= part_number <= upload_sessions.part_count(session):
+        raise HTTPException(status_code=400, detail="Invalid part number")
+    expected = upload_sessions.expected_part_size(session, part_number)
+
+    # At most one chunk (UPLOAD_CHUNK_SIZE_MB) is held in memory per request
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > expected:
+            raise HTTPException(status_code=413, detail=f"分片 {part_number} 应为 {expected} 字节")
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"分片 {part_number} 应为 {expected} 字节，实际 {len(data)} 字节")
+
+    etag = await upload_sessions.store_part(db, session, part_number, bytes(data))
+    return UploadPartResponse(part_number=part_number, etag=etag, size=len(data))
+
+
+@router.post("/{session_id}/complete")
+async def complete_upload_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Assemble the uploaded chunks. Returns the same fields as POST /api/files/upload;
+    completing an already completed session returns the same file again.
+    """
+    session = _get_own_session(db, session_id, current_user, active=False)
+    try:
+        attachment = await upload_sessions.complete_session(db, session)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Upload session {session.id} completed: path={attachment.url}")
+    return {
+        "url": f"/api/files/content/{attachment.url}",
+        "path": attachment.url,
+        "name": attachment.name,
+        "size": attachment.size,
+        "content_type": attachment.content_type,
+        "sha256": None,
+        "deduplicated": False,
+    }
+
+
+@router.delete("/{session_id}")
+async def abort_upload_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Abort the session and discard any uploaded chunks."""
+    session = _get_own_session(db, session_id, current_user)
+    await upload_sessions.abort_session(db, session)
+    return {"message": "Upload session aborted"}
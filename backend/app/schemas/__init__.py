@@ -6,3 +6,5 @@ from .event import *
 from .inspiration import *
 from .report import *
 from .auth import *
+from .job import *
+from .digest import *
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, Dict
+from datetime import date, datetime
+
+
+class ProjectWeekDigestResponse(BaseModel):
+    project_id: str
+    iso_year: int
+    iso_week: int
+    week_start: date
+    event_counts: Dict[str, int] = {}
+    tasks_created: int = 0
+    tasks_completed: int = 0
+    tasks_deleted: int = 0
+    progress_delta: int = 0
+    summary: Optional[str] = None
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, Literal
+from datetime import datetime
+from ..models.job import JobStatus
+
+# Retries back off exponentially (JOB_RETRY_BACKOFF_SECONDS doubled per attempt), so keep it bounded
+MAX_ATTEMPTS_LIMIT = 10
+
+
+class ReportJobCreate(BaseModel):
+    report_type: Literal["project", "dept_monthly", "project_weekly", "personal"]
+    params: Dict[str, Any] = {}
+    max_attempts: Optional[int] = Field(None, ge=1, le=MAX_ATTEMPTS_LIMIT)  # Defaults to JOB_MAX_ATTEMPTS
+
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    params: Dict[str, Any] = {}
+    status: JobStatus
+    progress: int = 0
+    message: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 0
+    cancel_requested: bool = False
+    created_by: str
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+from ..models.upload_session import UploadSessionStatus
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    content_type: Optional[str] = None
+    folder: Optional[str] = None
+    project_name: Optional[str] = None
+
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    filename: str
+    content_type: str
+    size: int
+    chunk_size: int
+    part_count: int
+    status: UploadSessionStatus
+    uploaded_parts: List[int] = []  # Part numbers already received, for resuming
+    expires_at: datetime
+
+
+class UploadPartResponse(BaseModel):
+    part_number: int
+    etag: str
+    size: int
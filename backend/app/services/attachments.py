@@ -0,0 +1,334 @@
+"""
+Content-addressed attachment storage and the attachment index.
+
+Uploaded files are stored once under a key derived from their SHA-256.
+Each upload adds an Attachment row (a reference) pointing at that object,
+so uploading the same bytes again only costs a hash and a DB insert.
+
+When an event or report is saved, sync_entity() makes its Attachment rows
+match its attachments JSON, claiming the rows its uploads created. The
+table then answers "files of project X", storage usage and "where is this
+file used" without scanning JSON columns or listing the bucket.
+"""
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from sqlalchemy import func, null
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.event import TimelineEvent
+from ..models.project import Project
+from ..models.report import Attachment, WeeklyReport
+from ..utils import now_beijing
+from .minio_service import safe_filename
+
+logger = logging.getLogger(__name__)
+
+CONTENT_PREFIX = "objects"
+PROXY_PREFIX = "/api/files/content/"
+
+ENTITY_EVENT = "event"
+ENTITY_REPORT = "report"
+
+# Image MIME types for auto-classification
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/svg+xml', 'image/bmp', 'image/x-icon'}
+
+
+def _sanitize(name: str) -> str:
+    """Make a name safe for use as a path segment."""
+    safe = name.replace(" ", "_")
+    for ch in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
+        safe = safe.replace(ch, '')
+    return safe
+
+
+def classify_folder(content_type: str, folder: Optional[str], project_name: Optional[str], user_name: str) -> str:
+    """
+    Folder an upload is filed under:
+    - If project_name is given: projects/{project_name}/{图片|文档}
+    - If folder starts with 'reports': reports/{user}/{图片|文档}
+    - Otherwise: {folder or 'uploads'}/{图片|文档}
+    """
+    # Auto-classify file type based on content_type
+    file_category = "图片" if content_type in IMAGE_TYPES else "文档"
+    if project_name:
+        return f"projects/{_sanitize(project_name)}/{file_category}"
+    if folder and folder.startswith("reports"):
+        return f"reports/{_sanitize(user_name)}/{file_category}"
+    if folder:
+        return f"{folder}/{file_category}"
+    return f"uploads/{file_category}"
+
+
+def content_key(sha256: str, filename: str) -> str:
+    """Object name for content: objects/ab/abcdef….ext (the extension keeps mimetype guessing working)."""
+    ext = os.path.splitext(safe_filename(filename))[1].lower()
+    return f"{CONTENT_PREFIX}/{sha256[:2]}/{sha256}{ext}"
+
+
+def find_by_hash(db: Session, sha256: str) -> Optional[Attachment]:
+    return db.query(Attachment).filter(Attachment.sha256 == sha256).first()
+
+
+def reference_count(db: Session, sha256: str) -> int:
+    return db.query(func.count(Attachment.id)).filter(Attachment.sha256 == sha256).scalar() or 0
+
+
+def add_reference(
+    db: Session,
+    object_name: str,
+    name: str,
+    sha256: Optional[str],
+    size: int,
+    content_type: str,
+    folder: Optional[str],
+    owner_id: Optional[str],
+) -> Attachment:
+    attachment = Attachment(
+        id=str(uuid.uuid4()),
+        name=name,
+        url=object_name,
+        folder=folder,
+        sha256=sha256,
+        size=size,
+        content_type=content_type,
+        owner_id=owner_id,
+        created_at=now_beijing(),
+    )
+    db.add(attachment)
+    db.commit()
+    return attachment
+
+
+def _minio_hosts() -> Tuple[str, ...]:
+    return tuple(h.lower() for h in (settings.MINIO_ENDPOINT, settings.MINIO_PUBLIC_ENDPOINT) if h)
+
+
+def object_name(url: Optional[str]) -> Optional[str]:
+    """
+    Object name behind an attachment URL; None for external or inline (data:) URLs.
+
+    Besides bare object names and proxy paths, absolute URLs are mapped back
+    when they point at the proxy (any host) or at the bucket on the MinIO
+    endpoint (http://<MINIO_ENDPOINT or MINIO_PUBLIC_ENDPOINT>/<bucket>/<object>,
+    as saved by older clients or copied from presigned links).
+    """
+    if not url:
+        return None
+    if url.startswith(PROXY_PREFIX):
+        return url[len(PROXY_PREFIX):]
+    if url.startswith(("http://", "https://")):
+        parts = urlsplit(url)
+        if parts.path.startswith(PROXY_PREFIX):
+            return unquote(parts.path[len(PROXY_PREFIX):]) or None
+        bucket_prefix = f"/{settings.MINIO_BUCKET}/"
+        if parts.netloc.lower() in _minio_hosts() and parts.path.startswith(bucket_prefix):
+            return unquote(parts.path[len(bucket_prefix):]) or None
+        return None
+    if url.startswith(("http", "data:", "/")):
+        return None
+    return url
+
+
+def sync_entity(
+    db: Session,
+    entity_type: str,
+    entity_id: str,
+    project_id: Optional[str],
+    items: Iterable[Dict[str, Any]],
+    owner_id: Optional[str],
+):
+    """
+    Make the Attachment rows of an event or report match its attachments JSON.
+
+    Rows no longer referenced are dropped. New references claim an
+    unattached upload row for the same object (the uploader's first), or get
+    a new row copying the object's metadata. Does not commit.
+    """
+    wanted = [(object_name(item.get("url")), item) for item in items or []]
+    wanted = [(name, item) for name, item in wanted if name]
+    current = db.query(Attachment).filter(
+        Attachment.entity_type == entity_type, Attachment.entity_id == entity_id
+    ).all()
+
+    available: Dict[str, List[Attachment]] = {}
+    for row in current:
+        available.setdefault(row.url, []).append(row)
+    missing: List[Tuple[str, Dict[str, Any]]] = []
+    for name, item in wanted:
+        rows = available.get(name)
+        if rows:
+            _describe(rows.pop(), item, project_id)
+        else:
+            missing.append((name, item))
+    for rows in available.values():
+        for row in rows:
+            db.delete(row)
+
+    for name, item in missing:
+        row = (
+            db.query(Attachment)
+            .filter(Attachment.url == name, Attachment.entity_id.is_(None))
+            .order_by((Attachment.owner_id == owner_id).desc(), Attachment.created_at)
+            .first()
+        )
+        if row is None:
+            template = db.query(Attachment).filter(Attachment.url == name).first()
+            row = Attachment(
+                id=str(uuid.uuid4()),
+                url=name,
+                folder=item.get("folder") or (template.folder if template else None),
+                sha256=template.sha256 if template else None,
+                size=template.size if template else None,
+                content_type=template.content_type if template else None,
+                owner_id=owner_id,
+                created_at=now_beijing(),
+            )
+            db.add(row)
+        row.entity_type = entity_type
+        row.entity_id = entity_id
+        _describe(row, item, project_id)
+        db.flush()  # Claimed rows must not be claimed again for a duplicate reference
+
+
+def _describe(row: Attachment, item: Dict[str, Any], project_id: Optional[str]):
+    row.name = (item.get("name") or row.name or "unnamed")[:500]
+    row.caption = item.get("caption")
+    row.project_id = project_id
+
+
+def release_entity(db: Session, entity_type: str, entity_id: str):
+    """Drop the references of a deleted event or report. Does not commit."""
+    db.query(Attachment).filter(
+        Attachment.entity_type == entity_type, Attachment.entity_id == entity_id
+    ).delete(synchronize_session=False)
+
+
+def release_project(db: Session, project_id: str):
+    """
+    Drop the references of a deleted project's events, which are no longer
+    reachable, so storage GC can reclaim their files. Does not commit.
+    """
+    event_ids = db.query(TimelineEvent.id).filter(TimelineEvent.project_id == project_id)
+    db.query(Attachment).filter(
+        Attachment.entity_type == ENTITY_EVENT, Attachment.entity_id.in_(event_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+
+
+def backfill_index(batch_size: int = 500) -> int:
+    """
+    Index attachments of events and reports saved before the index existed,
+    or by code paths that bypass the routers. Idempotent: entities whose row
+    count already matches their stored attachments are skipped. Returns the
+    number of entities indexed.
+    """
+    db = SessionLocal()
+    try:
+        indexed: Dict[Tuple[str, str], int] = {
+            (entity_type, entity_id): count
+            for entity_type, entity_id, count in db.query(
+                Attachment.entity_type, Attachment.entity_id, func.count(Attachment.id)
+            )
+            .filter(Attachment.entity_id.isnot(None))
+            .group_by(Attachment.entity_type, Attachment.entity_id)
+            .all()
+        }
+        sources = [
+            # Events of deleted projects stay unindexed (see release_project)
+            (ENTITY_EVENT, db.query(
+                TimelineEvent.id, TimelineEvent.project_id, TimelineEvent.author_id, TimelineEvent.attachments
+            ).filter(
+                func.json_length(TimelineEvent.attachments) > 0,
+                TimelineEvent.project_id.in_(db.query(Project.id).scalar_subquery()),
+            )),
+            (ENTITY_REPORT, db.query(
+                WeeklyReport.id, null(), WeeklyReport.user_id, WeeklyReport.attachments
+            ).filter(func.json_length(WeeklyReport.attachments) > 0)),
+        ]
+        count = 0
+        for entity_type, query in sources:
+            # Rows are only read here; writes go through a second session so the stream isn't disturbed
+            for entity_id, project_id, owner_id, items in query.yield_per(batch_size):
+                stored = sum(1 for item in items if object_name(item.get("url")))
+                if indexed.get((entity_type, entity_id), 0) == stored:
+                    continue
+                writer = SessionLocal()
+                try:
+                    sync_entity(writer, entity_type, entity_id, project_id, items, owner_id)
+                    writer.commit()
+                finally:
+                    writer.close()
+                count += 1
+        if count:
+            logger.info(f"Indexed attachments of {count} events and reports")
+        return count
+    finally:
+        db.close()
+
+
+def list_attachments(
+    db: Session,
+    project_id: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    owner_id: Optional[str] = None,
+    path: Optional[str] = None,
+    include_unattached: bool = False,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Attachment]:
+    query = db.query(Attachment)
+    if project_id:
+        query = query.filter(Attachment.project_id == project_id)
+    if entity_type:
+        query = query.filter(Attachment.entity_type == entity_type)
+    if entity_id:
+        query = query.filter(Attachment.entity_id == entity_id)
+    if owner_id:
+        query = query.filter(Attachment.owner_id == owner_id)
+    if path:
+        query = query.filter(Attachment.url == (object_name(path) or path))
+    if not include_unattached:
+        query = query.filter(Attachment.entity_id.isnot(None))
+    return query.order_by(Attachment.created_at.desc()).offset(offset).limit(limit).all()
+
+
+def usage_summary(db: Session, group_by: str) -> Dict[str, Any]:
+    """
+    Attachment counts and bytes per project or per owner.
+
+    `bytes` counts every reference; `stored_bytes` counts each object once,
+    which is what deduplicated storage actually holds.
+    """
+    column = Attachment.project_id if group_by == "project" else Attachment.owner_id
+    attached = Attachment.entity_id.isnot(None)
+    rows = (
+        db.query(column, func.count(Attachment.id), func.sum(Attachment.size))
+        .filter(attached)
+        .group_by(column)
+        .all()
+    )
+    per_object = (
+        db.query(column.label("key"), Attachment.url, func.max(Attachment.size).label("size"))
+        .filter(attached)
+        .group_by(column, Attachment.url)
+        .subquery()
+    )
+    stored = dict(db.query(per_object.c.key, func.sum(per_object.c.size)).group_by(per_object.c.key).all())
+    groups = [
+        {"key": key, "count": count, "bytes": int(size or 0), "stored_bytes": int(stored.get(key) or 0)}
+        for key, count, size in rows
+    ]
+    groups.sort(key=lambda g: g["bytes"], reverse=True)
+
+    objects = db.query(Attachment.url, func.max(Attachment.size).label("size")).group_by(Attachment.url).subquery()
+    total_objects, total_stored = db.query(func.count(), func.sum(objects.c.size)).select_from(objects).one()
+    return {
+        "group_by": group_by,
+        "groups": groups,
+        "objects": total_objects or 0,
+        "stored_bytes": int(total_stored or 0),
+    }
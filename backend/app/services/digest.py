@@ -0,0 +1,285 @@
+"""
+Incremental per-project weekly digests (project_week_digest).
+
+Event and task writes call the record_* helpers inside their own
+transaction, so each digest row always matches the raw data. Monthly
+reports read the digest rows and their cached LLM summaries, and only
+summarise weeks whose events changed since the last run.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.digest import ProjectWeekDigest
+from ..models.event import TimelineEvent
+from ..models.project import Project
+from ..models.task import TaskStatus
+from ..utils import now_beijing
+from . import llm
+
+logger = logging.getLogger(__name__)
+
+
+def _type_value(event_type) -> str:
+    return event_type.value if hasattr(event_type, "value") else str(event_type or "UPDATE")
+
+
+def _lock_week(db: Session, project_id: str, day) -> ProjectWeekDigest:
+    """Get the digest row for the ISO week containing `day`, creating it if needed, locked for update."""
+    day = day.date() if isinstance(day, datetime) else day
+    iso_year, iso_week, _ = day.isocalendar()
+    # Insert-or-ignore first so concurrent writers never race on the unique key
+    db.execute(
+        mysql_insert(ProjectWeekDigest.__table__)
+        .values(
+            id=str(uuid.uuid4()),
+            project_id=project_id,
+            iso_year=iso_year,
+            iso_week=iso_week,
+            week_start=date.fromisocalendar(iso_year, iso_week, 1),
+            event_counts={},
+            tasks_created=0,
+            tasks_completed=0,
+            tasks_deleted=0,
+            progress_delta=0,
+            updated_at=now_beijing(),
+        )
+        .on_duplicate_key_update(project_id=project_id)
+    )
+    return (
+        db.query(ProjectWeekDigest)
+        .filter(
+            ProjectWeekDigest.project_id == project_id,
+            ProjectWeekDigest.iso_year == iso_year,
+            ProjectWeekDigest.iso_week == iso_week,
+        )
+        .with_for_update()
+        .one()
+    )
+
+
+def _bump_event(db: Session, project_id: str, day, event_type, delta: int):
+    digest = _lock_week(db, project_id, day)
+    counts = dict(digest.event_counts or {})
+    key = _type_value(event_type)
+    counts[key] = max(0, counts.get(key, 0) + delta)
+    if counts[key] == 0:
+        del counts[key]
+    digest.event_counts = counts  # Reassign so the JSON column is flagged dirty
+    digest.summary = None
+    digest.updated_at = now_beijing()
+
+
+def record_event_created(db: Session, event: TimelineEvent):
+    _bump_event(db, event.project_id, event.date, event.type, 1)
+
+
+def record_event_deleted(db: Session, event: TimelineEvent):
+    _bump_event(db, event.project_id, event.date, event.type, -1)
+
+
+def record_event_updated(db: Session, event: TimelineEvent, old_type):
+    """Content or type changed: move the count if needed and invalidate the summary."""
+    if _type_value(old_type) != _type_value(event.type):
+        _bump_event(db, event.project_id, event.date, old_type, -1)
+        _bump_event(db, event.project_id, event.date, event.type, 1)
+    else:
+        digest = _lock_week(db, event.project_id, event.date)
+        digest.summary = None
+        digest.updated_at = now_beijing()
+
+
+def record_task_change(
+    db: Session,
+    project_id: str,
+    old_status: Optional[TaskStatus] = None,
+    new_status: Optional[TaskStatus] = None,
+    old_progress: int = 0,
+    new_progress: int = 0,
+    created: bool = False,
+    deleted: bool = False
+):
+    """Record a task write in the current week's digest."""
+    if not (created or deleted) and old_status == new_status and old_progress == new_progress:
+        return
+    digest = _lock_week(db, project_id, now_beijing())
+    if created:
+        digest.tasks_created += 1
+    if deleted:
+        digest.tasks_deleted += 1
+    if new_status == TaskStatus.COMPLETED and old_status != TaskStatus.COMPLETED:
+        digest.tasks_completed += 1
+    elif old_status == TaskStatus.COMPLETED and new_status not in (None, TaskStatus.COMPLETED):
+        digest.tasks_completed -= 1  # Reopened within the week
+    digest.progress_delta += (new_progress or 0) - (old_progress or 0)
+    digest.updated_at = now_beijing()
+
+
+def get_digests(db: Session, start: date, end: date, project_ids: Optional[List[str]] = None) -> List[ProjectWeekDigest]:
+    """Digest rows for weeks overlapping [start, end]."""
+    query = db.query(ProjectWeekDigest).filter(
+        ProjectWeekDigest.week_start > start - timedelta(days=7),
+        ProjectWeekDigest.week_start <= end,
+    )
+    if project_ids:
+        query = query.filter(ProjectWeekDigest.project_id.in_(project_ids))
+    return query.order_by(ProjectWeekDigest.project_id, ProjectWeekDigest.week_start).all()
+
+
+def rebuild_event_counts(db: Session, project_id: Optional[str] = None) -> int:
+    """
+    Recompute event counts from the events table (backfill after upgrading).
+
+    Task deltas cannot be reconstructed from current task state and are kept.
+    Returns the number of digest rows written.
+    """
+    query = db.query(TimelineEvent.project_id, TimelineEvent.date, TimelineEvent.type)
+    if project_id:
+        query = query.filter(TimelineEvent.project_id == project_id)
+
+    counts: Dict[tuple, Dict[str, int]] = {}
+    for pid, day, event_type in query.yield_per(1000):
+        iso_year, iso_week, _ = day.date().isocalendar()
+        week = counts.setdefault((pid, iso_year, iso_week), {})
+        key = _type_value(event_type)
+        week[key] = week.get(key, 0) + 1
+
+    existing = db.query(ProjectWeekDigest)
+    if project_id:
+        existing = existing.filter(ProjectWeekDigest.project_id == project_id)
+    for digest in existing.all():
+        if (digest.project_id, digest.iso_year, digest.iso_week) not in counts and digest.event_counts:
+            digest.event_counts = {}
+            digest.summary = None
+
+    for (pid, iso_year, iso_week), week_counts in counts.items():
+        digest = _lock_week(db, pid, date.fromisocalendar(iso_year, iso_week, 1))
+        if digest.event_counts != week_counts:
+            digest.event_counts = week_counts
+            digest.summary = None
+            digest.updated_at = now_beijing()
+    db.commit()
+    return len(counts)
+
+
+# --- Monthly report from digests ---
+
+def _load_missing_summaries(start: date, end: date):
+    """Projects, digests, and the raw events of the weeks whose summary is missing."""
+    db = SessionLocal()
+    try:
+        projects = {p.id: p for p in db.query(Project).all()}
+        digests = get_digests(db, start, end, list(projects.keys()))
+        todo = []
+        for d in digests:
+            if d.summary is None and d.event_counts:
+                week_start = datetime.combine(d.week_start, datetime.min.time())
+                events = (
+                    db.query(TimelineEvent)
+                    .filter(
+                        TimelineEvent.project_id == d.project_id,
+                        TimelineEvent.date >= week_start,
+                        TimelineEvent.date < week_start + timedelta(days=7),
+                    )
+                    .order_by(TimelineEvent.date)
+                    .all()
+                )
+                todo.append((d.id, d.project_id, d.week_start, [
+                    {"date": e.date.isoformat(), "type": _type_value(e.type), "author_name": e.author_name, "content": e.content}
+                    for e in events
+                ]))
+        project_dicts = {
+            pid: {
+                "id": p.id,
+                "title": p.title,
+                "status": p.status.value if p.status else "",
+                "description": p.description or "",
+                "customer_name": p.customer_name or "内部",
+            }
+            for pid, p in projects.items()
+        }
+        digest_dicts = [
+            {
+                "id": d.id,
+                "project_id": d.project_id,
+                "week_start": d.week_start,
+                "event_counts": d.event_counts or {},
+                "tasks_created": d.tasks_created,
+                "tasks_completed": d.tasks_completed,
+                "progress_delta": d.progress_delta,
+                "summary": d.summary,
+            }
+            for d in digests
+        ]
+        return project_dicts, digest_dicts, todo
+    finally:
+        db.close()
+
+
+def _store_summary(digest_id: str, summary: str):
+    db = SessionLocal()
+    try:
+        digest = db.query(ProjectWeekDigest).filter(ProjectWeekDigest.id == digest_id).first()
+        if digest:
+            digest.summary = summary
+            db.commit()
+    finally:
+        db.close()
+
+
+async def generate_dept_monthly_report_from_digests(start: date, end: date, user_id: Optional[str] = None) -> str:
+    """
+    Department report built from weekly digests.
+
+    Weeks without a cached summary are summarised concurrently (project_report
+    prompt, LLM_MAP_CONCURRENCY) and written back, then the dept_monthly_report
+    prompt combines the per-week summaries and counts.
+    """
+    chat = llm.get_llm()
+    if not chat:
+        return "缺少 API Key。"
+
+    projects, digests, todo = await asyncio.to_thread(_load_missing_summaries, start, end)
+    semaphore = asyncio.Semaphore(max(1, settings.LLM_MAP_CONCURRENCY))
+
+    async def summarize(digest_id: str, project_id: str, week_start: date, events: List[Dict[str, Any]]):
+        week_end = week_start + timedelta(days=6)
+        async with semaphore:
+            try:
+                summary = await llm.summarize_project_period(
+                    chat, projects[project_id], events, week_start.isoformat(), week_end.isoformat(), user_id
+                )
+            except Exception as e:
+                logger.warning(f"Digest summary failed for {project_id} {week_start}: {e}")
+                return digest_id, None
+        await asyncio.to_thread(_store_summary, digest_id, summary)
+        return digest_id, summary
+
+    fresh = dict(await asyncio.gather(*[summarize(*item) for item in todo if item[1] in projects]))
+
+    context = f"报告周期: {start.isoformat()} 至 {end.isoformat()}\n以下为各项目按周汇总的动态与摘要。\n\n"
+    by_project: Dict[str, List[Dict[str, Any]]] = {}
+    for d in digests:
+        by_project.setdefault(d["project_id"], []).append(d)
+    for pid, p in projects.items():
+        weeks = by_project.get(pid, [])
+        if not weeks:
+            continue
+        context += f"项目: {p['title']} (状态: {p['status']})\n"
+        for d in weeks:
+            counts = "，".join(f"{k} {v}" for k, v in sorted(d["event_counts"].items())) or "无动态"
+            context += (
+                f"- {d['week_start'].isoformat()} 当周: 动态 {counts}; 新增任务 {d['tasks_created']}，"
+                f"完成任务 {d['tasks_completed']}，进度变化 {d['progress_delta']:+d}%\n"
+            )
+            summary = fresh.get(d["id"]) or d["summary"]
+            if summary:
+                context += f"  摘要: {summary}\n"
+        context += "\n"
+
+    return await llm.invoke_dept_monthly_chain(chat, context, user_id)
@@ -0,0 +1,108 @@
+"""
+Process pool for DOCX rendering.
+
+python-docx is CPU-bound and holds the GIL, so rendering a large timeline on
+the event loop (or on a thread) stalls every other request the worker is
+serving. Exports are rendered in DOCX_WORKERS separate processes instead:
+plain JSON-mode dicts go in, the finished document comes back as bytes.
+
+At most DOCX_WORKERS renders run at once and up to DOCX_MAX_QUEUE more wait
+for a slot; beyond that, ExportBusyError is raised (503 in the routers)
+rather than letting a burst of exports queue without bound.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExportBusyError(RuntimeError):
+    """Every render slot is busy and the wait queue is full."""
+
+
+def _render(generator: Callable[..., BytesIO], args: tuple, template: Optional[bytes]) -> bytes:
+    # Runs in the worker process; the generator is pickled by reference
+    from . import docx_service
+    docx_service.set_template(template)
+    return generator(*args).getvalue()
+
+
+class RenderPool:
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+
+        # Metrics
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._render_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and thread pools is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def render(self, generator: Callable[..., BytesIO], *args: Any, wait: bool = False) -> bytes:
+        """
+        Run a docx_service generator in the pool and return the document bytes.
+
+        wait=True queues even past DOCX_MAX_QUEUE, for callers that already
+        bound how many renders they keep in flight (batch export).
+        """
+        if not wait and self.active >= self.workers and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ExportBusyError("导出任务繁忙，请稍后重试")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        started = time.monotonic()
+        try:
+            from . import docx_templates
+            template = await docx_templates.current()
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self._get_executor(), _render, generator, args, template)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self._slots.release()
+        self.completed += 1
+        self._render_seconds += time.monotonic() - started
+        return data
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_render_ms": int(self._render_seconds / self.completed * 1000) if self.completed else None,
+        }
+
+
+pool = RenderPool(settings.DOCX_WORKERS, settings.DOCX_MAX_QUEUE)
@@ -1,3 +1,4 @@
+import copy
 import re
 from io import BytesIO
 from docx import Document
@@ -5,6 +6,7 @@ from docx.shared import Pt, RGBColor
 from docx.oxml.ns import qn
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from datetime import datetime
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -92,10 +94,69 @@ def _set_default_font(doc):
         except Exception:
             pass
 
+# Base document every export starts from, as .docx bytes. Opening a saved,
+# already styled document is cheaper than restyling a fresh Document() each time.
+_default_template: Optional[bytes] = None
+_custom_template: Optional[bytes] = None  # Admin-uploaded template, as uploaded
+_custom_base: Optional[bytes] = None  # Same, with its body cleared
+
+# Styles the generators use. Templates saved by Word often leave some of them
+# latent (undefined until used), so they are copied in from the built-in template.
+REQUIRED_STYLES = ['Normal', 'Title', 'List Bullet'] + [f'Heading {i}' for i in range(1, 5)]
+
+
+def _build_default_template() -> bytes:
+    doc = Document()
+    _set_default_font(doc)
+    return _save_doc(doc).getvalue()
+
+
+def prepare_template(data: bytes) -> bytes:
+    """
+    Turn an uploaded .docx into a base document: keep its styles, page
+    setup, headers and footers, drop its body content, and add any required
+    style it lacks. Raises ValueError if the file is not a Word document.
+    """
+    try:
+        doc = Document(BytesIO(data))
+    except Exception as e:
+        raise ValueError(f"无法解析模板文件，请上传 .docx 格式的 Word 文档: {e}")
+    missing = [name for name in REQUIRED_STYLES if name not in doc.styles]
+    if missing:
+        builtin = Document(BytesIO(default_template()))
+        for name in missing:
+            doc.styles.element.append(copy.deepcopy(builtin.styles[name].element))
+    body = doc.element.body
+    for child in list(body):
+        if child.tag != qn('w:sectPr'):
+            body.remove(child)
+    return _save_doc(doc).getvalue()
+
+
+def set_template(data: Optional[bytes]):
+    """Use a custom template for new documents (None: the built-in one). Cheap to repeat with the same bytes."""
+    global _custom_template, _custom_base
+    if data != _custom_template:
+        _custom_base = prepare_template(data) if data else None
+        _custom_template = data
+
+
+def default_template() -> bytes:
+    """The built-in template (Microsoft YaHei for body text and headings), built once per process."""
+    global _default_template
+    if _default_template is None:
+        _default_template = _build_default_template()
+    return _default_template
+
+
+def new_document():
+    """A new, styled document to render an export into."""
+    return Document(BytesIO(_custom_base or default_template()))
+
+
 def generate_report_docx(report_data: dict) -> BytesIO:
     try:
-        doc = Document()
-        _set_default_font(doc)
+        doc = new_document()
         
         # Title
         username = report_data.get('username', 'Unknown')
@@ -138,8 +199,7 @@ def generate_report_docx(report_data: dict) -> BytesIO:
 
 def generate_timeline_docx(project_title: str, events: list) -> BytesIO:
     try:
-        doc = Document()
-        _set_default_font(doc)
+        doc = new_document()
         
         doc.add_heading(f"项目时间轴 - {project_title}", 0)
         doc.add_paragraph(f"导出时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
@@ -159,8 +219,7 @@ def generate_event_docx(event: dict) -> BytesIO:
     """
     try:
         logger.info(f"Generating event docx for event: {event.get('id')}")
-        doc = Document()
-        _set_default_font(doc)
+        doc = new_document()
         
         # Only export content for single event
         content = event.get('content', '')
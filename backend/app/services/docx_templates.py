@@ -0,0 +1,70 @@
+"""
+Custom corporate template for DOCX exports.
+
+An admin can upload a .docx whose styles, page setup, headers and footers
+every export then uses (see docx_service.prepare_template). It is stored in
+MinIO so every API process sees it; each process re-checks its ETag at most
+every REFRESH_SECONDS and passes the bytes to the render pool. Without one,
+exports use the built-in Microsoft YaHei template.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+from minio.error import S3Error
+from . import docx_service, storage
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_OBJECT = "_templates/export.docx"
+TEMPLATE_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+REFRESH_SECONDS = 60
+
+_data: Optional[bytes] = None
+_etag: Optional[str] = None
+_checked_at: Optional[float] = None
+_lock = asyncio.Lock()
+
+
+async def current() -> Optional[bytes]:
+    """The custom template's bytes, or None for the built-in template."""
+    global _data, _etag, _checked_at
+    if _checked_at is not None and time.monotonic() - _checked_at < REFRESH_SECONDS:
+        return _data
+    async with _lock:
+        if _checked_at is not None and time.monotonic() - _checked_at < REFRESH_SECONDS:
+            return _data
+        try:
+            stat = await storage.stat_object(TEMPLATE_OBJECT)
+            if stat.etag != _etag:
+                _data = await storage.read_file(TEMPLATE_OBJECT)
+                _etag = stat.etag
+                logger.info("✓ Loaded custom DOCX export template")
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                logger.warning(f"Failed to check DOCX export template, keeping the current one: {e}")
+            else:
+                _data, _etag = None, None
+        except Exception as e:
+            logger.warning(f"Failed to check DOCX export template, keeping the current one: {e}")
+        _checked_at = time.monotonic()
+        return _data
+
+
+async def save(data: bytes):
+    """Validate and store a new template. Raises ValueError if it can't be used."""
+    global _checked_at
+    await asyncio.to_thread(docx_service.prepare_template, data)
+    await storage.upload_bytes(TEMPLATE_OBJECT, data, TEMPLATE_CONTENT_TYPE)
+    _checked_at = None  # Pick it up on the next render
+
+
+async def reset():
+    """Go back to the built-in template."""
+    global _checked_at
+    try:
+        await storage.delete_file(TEMPLATE_OBJECT)
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+    _checked_at = None
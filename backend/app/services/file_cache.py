@@ -0,0 +1,250 @@
+"""
+Local disk cache for hot objects served by the file proxy.
+
+Enabled by setting FILE_CACHE_DIR. Objects up to FILE_CACHE_MAX_OBJECT_MB
+are copied to disk on their first request, then served from there (with
+FileResponse) without contacting MinIO. Object names never change content
+(they embed a UUID or the content hash), so entries only leave the cache
+through LRU eviction once FILE_CACHE_SIZE_MB is exceeded, or when the object
+is deleted. Concurrent misses for one object share a single download.
+
+The index lives in memory, so each process caches into its own subdirectory
+of FILE_CACHE_DIR, held by a lock file for the life of the process. At
+startup a process only removes subdirectories whose lock is free, i.e. ones
+left behind by processes that have exited. A cached file that disappears
+(removed externally) is a miss: the caller pins it (or opens it, for
+ranges) first and falls back to MinIO when it is gone. Eviction leaves the
+file of a pinned entry on disk until its last response has been sent.
+"""
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+from ..config import settings
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ObjectMeta:
+    size: int
+    etag: str
+    last_modified: datetime
+    content_type: Optional[str]
+
+    @classmethod
+    def from_stat(cls, stat) -> "ObjectMeta":
+        return cls(stat.size, stat.etag, stat.last_modified, stat.content_type)
+
+
+@dataclass
+class CachedObject:
+    path: str
+    meta: ObjectMeta
+    readers: int = 0  # Responses currently sending the file (see DiskCache.pin)
+    evicted: bool = False
+
+
+class DiskCache:
+    def __init__(self, root: str, max_bytes: int, max_object_bytes: int):
+        os.makedirs(root, exist_ok=True)
+        _remove_orphans(root)
+        self.directory, self._lock = _claim_directory(root)
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self._entries: "OrderedDict[str, CachedObject]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.bytes = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.errors = 0
+        self.vanished = 0  # Entries whose file was gone when served
+
+    def _path(self, object_name: str) -> str:
+        digest = hashlib.sha256(object_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, object_name: str) -> Optional[CachedObject]:
+        entry = self._entries.get(object_name)
+        if entry is None:
+            return None
+        self._entries.move_to_end(object_name)
+        self.hits += 1
+        return entry
+
+    def pin(self, object_name: str, entry: CachedObject) -> bool:
+        """
+        Keep the entry's file on disk until unpin(), so it can be served by
+        path. False (and the entry is dropped) if the file is already gone.
+        """
+        if not os.path.exists(entry.path):
+            self._vanish(object_name, entry)
+            return False
+        entry.readers += 1
+        return True
+
+    def unpin(self, entry: CachedObject):
+        entry.readers -= 1
+        if entry.readers == 0 and entry.evicted:
+            self._delete_file(entry)
+
+    def open(self, object_name: str, entry: CachedObject) -> Optional[BinaryIO]:
+        """
+        Open a cached file for serving a range, or None if it is gone. The open
+        handle keeps the data readable even if the entry is evicted meanwhile.
+        """
+        try:
+            return open(entry.path, "rb")
+        except FileNotFoundError:
+            self._vanish(object_name, entry)
+            return None
+
+    def _vanish(self, object_name: str, entry: CachedObject):
+        if self._entries.get(object_name) is entry:
+            del self._entries[object_name]
+            self.bytes -= entry.meta.size
+        self.vanished += 1
+
+    def cacheable(self, meta: ObjectMeta) -> bool:
+        return meta.size <= self.max_object_bytes
+
+    async def fetch(self, object_name: str, meta: ObjectMeta) -> Optional[CachedObject]:
+        """Download the object into the cache, sharing one download between concurrent callers."""
+        self.misses += 1
+        task = self._inflight.get(object_name)
+        if task is None:
+            task = asyncio.ensure_future(self._download(object_name, meta))
+            self._inflight[object_name] = task
+            task.add_done_callback(lambda t, k=object_name: self._inflight.pop(k, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _download(self, object_name: str, meta: ObjectMeta) -> Optional[CachedObject]:
+        path = self._path(object_name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            await storage.download_file(object_name, tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"File cache download of '{object_name}' failed: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+        entry = CachedObject(path, meta)
+        self._entries[object_name] = entry
+        self.bytes += meta.size
+        self._evict()
+        return entry
+
+    def _evict(self):
+        # The newest entry is last, so it is never evicted while anything older remains
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            object_name, entry = self._entries.popitem(last=False)
+            self._remove(entry)
+            self.evictions += 1
+
+    def _remove(self, entry: CachedObject):
+        self.bytes -= entry.meta.size
+        entry.evicted = True
+        if entry.readers == 0:
+            self._delete_file(entry)
+
+    @staticmethod
+    def _delete_file(entry: CachedObject):
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def invalidate(self, object_name: str):
+        entry = self._entries.pop(object_name, None)
+        if entry:
+            self._remove(entry)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced_misses": self.coalesced,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "vanished": self.vanished,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _claim_directory(root: str):
+    """Create this process's cache subdirectory and its lock file, locked until the process exits."""
+    while True:
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        lock_path = os.path.join(root, f"{name}.lock")
+        lock = open(lock_path, "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Another process's cleanup may have taken the lock and removed the file before we locked it
+        if os.path.exists(lock_path) and os.path.samestat(os.fstat(lock.fileno()), os.stat(lock_path)):
+            directory = os.path.join(root, name)
+            os.makedirs(directory, exist_ok=True)
+            return directory, lock
+        lock.close()
+
+
+def _remove_orphans(root: str):
+    """Remove cache subdirectories of processes that have exited (their lock file is no longer held)."""
+    for entry in os.listdir(root):
+        if not entry.endswith(".lock"):
+            continue
+        lock_path = os.path.join(root, entry)
+        try:
+            with open(lock_path, "a") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Owned by a running process
+                shutil.rmtree(lock_path[:-len(".lock")], ignore_errors=True)
+                os.remove(lock_path)
+        except OSError as e:
+            logger.warning(f"File cache cleanup of '{lock_path}' failed: {e}")
+
+
+def iter_file_range(f: BinaryIO, start: int, length: int, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """Read part of an opened cached file and close it; run via StreamingResponse's thread pool."""
+    with f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+cache: Optional[DiskCache] = None
+if settings.FILE_CACHE_DIR:
+    cache = DiskCache(
+        settings.FILE_CACHE_DIR,
+        settings.FILE_CACHE_SIZE_MB * 1024 * 1024,
+        settings.FILE_CACHE_MAX_OBJECT_MB * 1024 * 1024,
+    )
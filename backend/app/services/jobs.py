@@ -0,0 +1,375 @@
+"""
+Durable background job queue backed by the `jobs` table.
+
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of API
+workers can share the queue without an external broker. A RUNNING job holds a
+lease that its worker keeps extending; if the process dies the lease expires
+and another worker picks the job up again, so queued work survives restarts.
+"""
+import asyncio
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from sqlalchemy import or_, and_
+from ..config import settings
+from ..database import SessionLocal
+from ..models.job import Job, JobStatus
+from ..utils import now_beijing
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+JobHandler = Callable[[Dict[str, Any], "JobContext"], Awaitable[Any]]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(job_type: str):
+    """Register an async handler for a job type."""
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when the job was cancelled."""
+
+
+class JobContext:
+    """Handle given to job handlers for reporting progress."""
+
+    def __init__(self, job_id: str, user_id: Optional[str] = None):
+        self.job_id = job_id
+        self.user_id = user_id  # Creator, used for per-user LLM limits
+
+    async def set_progress(self, progress: int, message: Optional[str] = None):
+        await asyncio.to_thread(_update_progress, self.job_id, progress, message)
+
+
+def enqueue_job(db, job_type: str, params: Dict[str, Any], created_by: str, max_attempts: Optional[int] = None) -> Job:
+    """Insert a PENDING job. Workers pick it up on their next poll."""
+    now = now_beijing()
+    job = Job(
+        id=str(uuid.uuid4()),
+        type=job_type,
+        params=params,
+        status=JobStatus.PENDING,
+        progress=0,
+        attempts=0,
+        max_attempts=max_attempts if max_attempts is not None else settings.JOB_MAX_ATTEMPTS,
+        cancel_requested=False,
+        created_by=created_by,
+        run_after=now,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def cancel_job(db, job: Job) -> Job:
+    """Cancel a job. PENDING jobs stop immediately, RUNNING ones at the next heartbeat."""
+    now = now_beijing()
+    if job.status == JobStatus.PENDING:
+        job.status = JobStatus.CANCELLED
+        job.finished_at = now
+    elif job.status == JobStatus.RUNNING:
+        job.cancel_requested = True
+    job.updated_at = now
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+# --- DB operations (blocking, run via asyncio.to_thread) ---
+
+def _claim_next_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        now = now_beijing()
+        job = (
+            db.query(Job)
+            .filter(or_(
+                and_(Job.status == JobStatus.PENDING, Job.run_after <= now),
+                and_(Job.status == JobStatus.RUNNING, Job.lease_expires_at < now),
+            ))
+            .order_by(Job.created_at)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if not job:
+            db.rollback()
+            return None
+        if job.status == JobStatus.RUNNING:
+            if job.attempts >= job.max_attempts:
+                # Every attempt died with its worker (e.g. the job crashes the process): stop retrying
+                logger.error(f"Job {job.id} lost its worker on the last of {job.attempts} attempts, marking it failed")
+                job.status = JobStatus.FAILED
+                job.error = f"Worker {job.worker_id} stopped responding on attempt {job.attempts}"
+                job.finished_at = now
+                job.worker_id = None
+                job.lease_expires_at = None
+                job.updated_at = now
+                db.commit()
+                return None
+            logger.warning(f"Reclaiming job {job.id} from expired worker {job.worker_id}")
+        job.status = JobStatus.RUNNING
+        job.worker_id = worker_id
+        job.attempts = (job.attempts or 0) + 1
+        job.lease_expires_at = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        job.updated_at = now
+        db.commit()
+        return {
+            "id": job.id,
+            "type": job.type,
+            "params": job.params or {},
+            "attempts": job.attempts,
+            "created_by": job.created_by,
+        }
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: str, worker_id: str) -> bool:
+    """Extend the lease. Returns True if cancellation was requested."""
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id, Job.worker_id == worker_id).first()
+        if not job:
+            return True
+        job.lease_expires_at = now_beijing() + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        db.commit()
+        return bool(job.cancel_requested)
+    finally:
+        db.close()
+
+
+def _update_progress(job_id: str, progress: int, message: Optional[str]):
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job:
+            job.progress = max(0, min(100, int(progress)))
+            if message is not None:
+                job.message = message[:500]
+            job.updated_at = now_beijing()
+            db.commit()
+    finally:
+        db.close()
+
+
+def _finish_job(job_id: str, worker_id: str, status: JobStatus, result: Any = None, error: Optional[str] = None):
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id, Job.worker_id == worker_id).first()
+        if not job:
+            # Lease was lost and the job reclaimed by another worker
+            return
+        now = now_beijing()
+        if status == JobStatus.FAILED and job.attempts < job.max_attempts and not job.cancel_requested:
+            # Retry with exponential backoff
+            delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+            job.status = JobStatus.PENDING
+            job.run_after = now + timedelta(seconds=delay)
+            job.message = f"第 {job.attempts} 次执行失败，{delay} 秒后重试"
+        else:
+            job.status = status
+            job.finished_at = now
+            if status == JobStatus.SUCCEEDED:
+                job.progress = 100
+                job.result = result
+        job.error = error[:2000] if error else None
+        job.worker_id = None
+        job.lease_expires_at = None
+        job.updated_at = now
+        db.commit()
+    finally:
+        db.close()
+
+
+# --- Worker ---
+
+class JobWorker:
+    """Runs up to `concurrency` jobs at a time inside the API process."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        for i in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._loop(), name=f"job-worker-{i}"))
+        logger.info(f"✓ Job worker {self.worker_id} started ({self.concurrency} slots)")
+
+    async def stop(self):
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = await asyncio.to_thread(_claim_next_job, self.worker_id)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                claimed = None
+            if not claimed:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(claimed)
+            except Exception as e:
+                # e.g. the DB write recording the outcome failed; the lease expires and the job is reclaimed
+                logger.error(f"Job {claimed['id']} worker error: {e}")
+
+    async def _run(self, claimed: Dict[str, Any]):
+        job_id = claimed["id"]
+        handler = _handlers.get(claimed["type"])
+        if handler is None:
+            await asyncio.to_thread(_finish_job, job_id, self.worker_id, JobStatus.FAILED, None, f"Unknown job type: {claimed['type']}")
+            return
+
+        logger.info(f"Job {job_id} ({claimed['type']}) started, attempt {claimed['attempts']}")
+        task = asyncio.create_task(handler(claimed["params"], JobContext(job_id, claimed["created_by"])))
+        cancelled = False
+        try:
+            while not task.done():
+                done, _ = await asyncio.wait({task}, timeout=settings.JOB_LEASE_SECONDS / 3)
+                if done:
+                    break
+                try:
+                    cancelled = await asyncio.to_thread(_heartbeat, job_id, self.worker_id)
+                except Exception as e:
+                    logger.error(f"Job {job_id} heartbeat failed: {e}")
+                if cancelled:
+                    task.cancel()
+                    break
+        except asyncio.CancelledError:
+            # Shutting down: leave the job RUNNING so its lease expires and it is retried
+            task.cancel()
+            raise
+
+        try:
+            result = await task
+        except (asyncio.CancelledError, JobCancelled):
+            await asyncio.to_thread(_finish_job, job_id, self.worker_id, JobStatus.CANCELLED)
+            logger.info(f"Job {job_id} cancelled")
+            return
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}\n{traceback.format_exc()}")
+            await asyncio.to_thread(_finish_job, job_id, self.worker_id, JobStatus.FAILED, None, str(e))
+            return
+        await asyncio.to_thread(_finish_job, job_id, self.worker_id, JobStatus.SUCCEEDED, result)
+        logger.info(f"Job {job_id} succeeded")
+
+
+_worker: Optional[JobWorker] = None
+
+
+def start_worker():
+    global _worker
+    if _worker is None and settings.JOB_WORKER_CONCURRENCY > 0:
+        _worker = JobWorker(settings.JOB_WORKER_CONCURRENCY)
+        _worker.start()
+
+
+async def stop_worker():
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
+
+
+# --- Handlers ---
+
+@job_handler("report")
+async def _run_report_job(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """
+    Run one of the services/llm generators, same parameters as /api/llm/generate-report.
+
+    Uses the raising variants, so an upstream failure fails the attempt and
+    is retried instead of being stored as the report text.
+    """
+    from . import llm
+
+    report_type = params.get("report_type", "")
+    if report_type not in ("project", "dept_monthly", "project_weekly", "personal"):
+        raise ValueError(f"不支持的报告类型: {report_type}")
+    chat = llm.get_llm()
+    if not chat:
+        raise RuntimeError("缺少 API Key。")
+
+    await ctx.set_progress(10, "正在生成报告")
+    if report_type == "project":
+        content = await llm.draft_project_report(
+            chat,
+            params.get("project", {}),
+            params.get("events", []),
+            params.get("tasks", []),
+            params.get("start_date", ""),
+            params.get("end_date", ""),
+            user_id=ctx.user_id
+        )
+        return {"content": content, "type": report_type, "prompt_version": llm.current_prompt_version()}
+    if report_type == "dept_monthly":
+        content = await llm.draft_dept_monthly_report(
+            chat,
+            params.get("projects", []),
+            params.get("events", []),
+            params.get("start_date", ""),
+            params.get("end_date", ""),
+            params.get("mode", "single"),
+            user_id=ctx.user_id
+        )
+        return {"content": content, "type": report_type, "prompt_version": llm.current_prompt_version()}
+    if report_type == "project_weekly":
+        project = params.get("project", {})
+        team_updates = llm.build_team_updates(project, params.get("personal_reports", []))
+        if not team_updates:
+            content = "本周团队成员未提交相关周报，无法自动汇总。"
+        else:
+            content = await llm.summarize_project_week(
+                chat, project, team_updates, params.get("week_range", ""), user_id=ctx.user_id
+            )
+        return {"content": content, "type": report_type, "prompt_version": llm.current_prompt_version()}
+    data = await llm.draft_personal_report(
+        chat,
+        params.get("username", ""),
+        params.get("projects", []),
+        params.get("inspirations", []),
+        user_id=ctx.user_id
+    )
+    return {"data": data, "type": report_type, "prompt_version": llm.current_prompt_version()}
+
+
+@job_handler("project_weekly_batch")
+async def _run_project_weekly_batch_job(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """Generate weekly reports for all EXECUTION projects (see services/report_batch.py)."""
+    from datetime import date
+    from .report_batch import generate_all_project_weekly_reports
+
+    week_start = date.fromisoformat(params["week_start"]) if params.get("week_start") else None
+    return await generate_all_project_weekly_reports(params["author"], week_start, ctx.set_progress)
+
+
+@job_handler("personal_report_draft")
+async def _run_personal_report_draft_job(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """Pre-generate one user's personal report draft (queued by the scheduler)."""
+    from datetime import datetime
+    from .personal_drafts import generate_draft_for_user
+
+    return await generate_draft_for_user(params["user_id"], datetime.fromisoformat(params["week_start"]))
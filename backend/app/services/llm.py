@@ -2,77 +2,268 @@
 LLM Service using LangChain with OpenAI-compatible API
 Migrated from frontend gemini.ts
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.runnables import Runnable
+from langchain_core.utils.json import parse_partial_json
 from ..config import settings, prompts
+from .llm_limiter import limiter, request_key
+from .llm_metrics import LLMCallRecorder, record_call
+from .llm_router import ModelEndpoint, build_client, estimate_tokens, router
+
+logger = logging.getLogger(__name__)
+
+# Per-project summaries for hierarchical dept reports, keyed by content fingerprint
+_project_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+_llm: Optional[ChatOpenAI] = None
+
+# Compiled (prompt | llm | parser) chains, keyed by prompt key, parser and endpoint, for the active prompt version
+_chain_cache: Dict[Tuple[str, str, str], Runnable] = {}
+_chain_cache_version: Optional[str] = None
+
+# Prompt version used by the most recent generation in the current context
+_prompt_version: ContextVar[Optional[str]] = ContextVar("prompt_version", default=None)
+
+_PARSERS = {"str": StrOutputParser, "json": JsonOutputParser}
 
 
 def get_llm() -> Optional[ChatOpenAI]:
-    """Get LangChain ChatOpenAI instance."""
+    """Get the shared LangChain ChatOpenAI instance."""
+    global _llm
     if not settings.OPENAI_API_KEY:
         return None
+    if _llm is not None:
+        return _llm
     
-    kwargs = {
-        "model": settings.OPENAI_MODEL,
-        "api_key": settings.OPENAI_API_KEY,
-        "temperature": 0.7,
-    }
-    if settings.OPENAI_API_BASE:
-        kwargs["base_url"] = settings.OPENAI_API_BASE
+    _llm = build_client(settings.OPENAI_MODEL, settings.OPENAI_API_BASE, settings.OPENAI_API_KEY)
+    return _llm
+
+
+def _get_chain(llm: ChatOpenAI, prompt_key: str, parser: str = "str", endpoint: str = "default") -> Tuple[Runnable, str]:
+    """Compiled chain for a prompt key, rebuilt only when prompts.yaml changes."""
+    global _chain_cache_version
+    prompt_config, version = prompts.get_prompt_with_version(prompt_key)
+    if version != _chain_cache_version:
+        _chain_cache.clear()
+        _chain_cache_version = version
+    chain = _chain_cache.get((prompt_key, parser, endpoint))
+    if chain is None:
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", prompt_config["system"]),
+            ("user", prompt_config["user"])
+        ])
+        chain = _chain_cache[(prompt_key, parser, endpoint)] = prompt | llm | _PARSERS[parser]()
+    return chain, version
+
+
+def current_prompt_version() -> Optional[str]:
+    """Prompt version used by the last generation awaited in this context."""
+    return _prompt_version.get()
+
+
+async def _ainvoke(
+    llm: ChatOpenAI,
+    prompt_key: str,
+    inputs: Dict[str, Any],
+    user_id: Optional[str] = None,
+    parser: str = "str"
+):
+    """
+    Invoke a cached chain through the shared upstream limiter.
+
+    The model endpoint is picked by the router from the estimated prompt
+    size; `llm` is the client used for the default endpoint.
+    """
+    _, version = _get_chain(llm, prompt_key, parser)
+    _prompt_version.set(version)
+    key = request_key(prompt_key, inputs, f"{settings.OPENAI_MODEL}:{version}")
+    tokens = estimate_tokens(inputs)
+    
+    async def call(endpoint: ModelEndpoint):
+        chain, _ = _get_chain(endpoint.client(llm), prompt_key, parser, endpoint.name)
+        recorder = LLMCallRecorder()
+        error = None
+        try:
+            return await chain.ainvoke(inputs, config={"callbacks": [recorder]})
+        except BaseException as e:  # Includes CancelledError: deadline, hedge loser, disconnect
+            error = e
+            raise
+        finally:
+            record_call(recorder, prompt_key, version, endpoint.model, user_id, error)
     
-    return ChatOpenAI(**kwargs)
+    return await limiter.run(key, user_id, lambda: router.run(tokens, call))
+
+
+def _format_event_date(e: Dict[str, Any]) -> str:
+    return e['date'].split('T')[0] if isinstance(e['date'], str) else str(e['date'])[:10]
+
+
+def _build_project_context(p: Dict[str, Any], proj_events: List[Dict[str, Any]]) -> str:
+    """Raw event listing of one project, as used by the single-prompt dept report."""
+    context = f"项目: {p['title']} (状态: {p['status']})\n"
+    if proj_events:
+        context += "本周期动态:\n"
+        for e in proj_events:
+            context += f"- [{_format_event_date(e)}] {e['type']}: {e['content']}\n"
+    else:
+        context += "本周期无重大更新记录。\n"
+    return context + "\n"
+
+
+async def invoke_dept_monthly_chain(llm: ChatOpenAI, context: str, user_id: Optional[str] = None) -> str:
+    try:
+        return await _ainvoke(llm, "dept_monthly_report", {"context": context}, user_id)
+    except Exception as e:
+        return f"AI 服务暂时不可用: {str(e)}"
 
 
 async def generate_dept_monthly_report(
     projects: List[Dict[str, Any]],
     events: List[Dict[str, Any]],
     start_date: str,
-    end_date: str
+    end_date: str,
+    mode: str = "single",
+    user_id: Optional[str] = None
 ) -> str:
-    """Generate department monthly report (3.7.3)."""
+    """Generate department monthly report (3.7.3).
+
+    mode="single" sends every project's raw events in one prompt.
+    mode="hierarchical" summarises each project concurrently first (map) and
+    then writes the department report from those summaries (reduce).
+    """
     llm = get_llm()
     if not llm:
         return "缺少 API Key。"
     
-    # Build context
-    context = f"报告周期: {start_date} 至 {end_date}\n\n"
-    for p in projects:
-        context += f"项目: {p['title']} (状态: {p['status']})\n"
-        proj_events = [e for e in events if e.get('project_id') == p['id']]
-        if proj_events:
-            context += "本周期动态:\n"
-            for e in proj_events:
-                date_str = e['date'].split('T')[0] if isinstance(e['date'], str) else str(e['date'])[:10]
-                context += f"- [{date_str}] {e['type']}: {e['content']}\n"
-        else:
-            context += "本周期无重大更新记录。\n"
-        context += "\n"
-    
-    prompt_config = prompts.get_prompt("dept_monthly_report")
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", prompt_config.get("system", "你是一个部门项目管理专家。请使用中文输出。")),
-        ("user", prompt_config.get("user", "请根据以下数据撰写报告:\n{context}"))
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
     try:
-        return await chain.ainvoke({"context": context})
+        return await draft_dept_monthly_report(llm, projects, events, start_date, end_date, mode, user_id)
     except Exception as e:
         return f"AI 服务暂时不可用: {str(e)}"
 
 
-async def generate_project_weekly_report(
+async def draft_dept_monthly_report(
+    llm: ChatOpenAI,
+    projects: List[Dict[str, Any]],
+    events: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str,
+    mode: str = "single",
+    user_id: Optional[str] = None
+) -> str:
+    """Run the dept_monthly_report prompt in the given mode. Raises on upstream errors."""
+    if mode == "hierarchical":
+        context = await _build_dept_monthly_context_hierarchical(llm, projects, events, start_date, end_date, user_id)
+    else:
+        context = f"报告周期: {start_date} 至 {end_date}\n\n"
+        for p in projects:
+            proj_events = [e for e in events if e.get('project_id') == p['id']]
+            context += _build_project_context(p, proj_events)
+    
+    return await _ainvoke(llm, "dept_monthly_report", {"context": context}, user_id)
+
+
+def _project_summary_key(
     project: Dict[str, Any],
-    personal_reports: List[Dict[str, Any]],
-    week_range: str
+    proj_events: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str
 ) -> str:
-    """Generate project weekly report from personal reports (3.7.2)."""
-    llm = get_llm()
-    if not llm:
-        return "缺少 API Key。"
+    """Fingerprint of everything that feeds a per-project summary."""
+    payload = {
+        "project": [project.get(k) for k in ("id", "title", "status", "description", "customer_name")],
+        "events": sorted(
+            [_format_event_date(e), str(e.get('type')), e.get('author_name', ''), e.get('content', '')]
+            for e in proj_events
+        ),
+        "period": [start_date, end_date],
+        "prompt": prompts.version,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _summarize_project(
+    llm: ChatOpenAI,
+    semaphore: asyncio.Semaphore,
+    project: Dict[str, Any],
+    proj_events: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str,
+    user_id: Optional[str] = None
+) -> str:
+    """Map step: summarise one project with the project_report prompt, using the cache."""
+    if not proj_events:
+        # Nothing to summarise, don't spend a model call on it
+        return "本周期无重大更新记录。"
+    
+    key = _project_summary_key(project, proj_events, start_date, end_date)
+    cached = _project_summary_cache.get(key)
+    if cached is not None:
+        _project_summary_cache.move_to_end(key)
+        return cached
+    
+    async with semaphore:
+        try:
+            summary = await summarize_project_period(llm, project, proj_events, start_date, end_date, user_id)
+        except Exception as e:
+            # Fall back to the raw events so the reduce step still sees this project
+            logger.warning(f"Project summary failed for {project.get('id')}: {e}")
+            return _build_project_context(project, proj_events)
+    
+    _project_summary_cache[key] = summary
+    while len(_project_summary_cache) > settings.LLM_SUMMARY_CACHE_SIZE:
+        _project_summary_cache.popitem(last=False)
+    return summary
+
+
+async def summarize_project_period(
+    llm: ChatOpenAI,
+    project: Dict[str, Any],
+    events: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str,
+    user_id: Optional[str] = None
+) -> str:
+    """Summarise one project's events with the project_report prompt. Raises on upstream errors."""
+    return await draft_project_report(llm, project, events, [], start_date, end_date, user_id)
+
+
+async def _build_dept_monthly_context_hierarchical(
+    llm: ChatOpenAI,
+    projects: List[Dict[str, Any]],
+    events: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str,
+    user_id: Optional[str] = None
+) -> str:
+    events_by_project: Dict[str, List[Dict[str, Any]]] = {}
+    for e in events:
+        events_by_project.setdefault(e.get('project_id'), []).append(e)
     
+    semaphore = asyncio.Semaphore(max(1, settings.LLM_MAP_CONCURRENCY))
+    summaries = await asyncio.gather(*[
+        _summarize_project(llm, semaphore, p, events_by_project.get(p['id'], []), start_date, end_date, user_id)
+        for p in projects
+    ])
+    
+    context = f"报告周期: {start_date} 至 {end_date}\n以下为各项目本周期进度摘要。\n\n"
+    for p, summary in zip(projects, summaries):
+        context += f"项目: {p['title']} (状态: {p['status']})\n{summary}\n\n"
+    return context
+
+
+def build_team_updates(project: Dict[str, Any], personal_reports: List[Dict[str, Any]]) -> str:
+    """Collect each member's update for this project from their personal reports."""
     team_updates = ""
     for r in personal_reports:
         details = r.get('details', [])
@@ -81,41 +272,54 @@ async def generate_project_weekly_report(
             team_updates += f"- 成员 {r['username']}: {detail.get('content', '')} (计划: {detail.get('plan', '')})\n"
         elif project['id'] in r.get('linked_project_ids', []):
             team_updates += f"- 成员 {r['username']}: {r.get('content', '')}\n"
+    return team_updates
+
+
+async def summarize_project_week(
+    llm: ChatOpenAI,
+    project: Dict[str, Any],
+    team_updates: str,
+    week_range: str,
+    user_id: Optional[str] = None
+) -> str:
+    """Run the project_weekly_report prompt. Raises on upstream errors."""
+    return await _ainvoke(llm, "project_weekly_report", {
+        "project_title": project['title'],
+        "week_range": week_range,
+        "team_updates": team_updates
+    }, user_id)
+
+
+async def generate_project_weekly_report(
+    project: Dict[str, Any],
+    personal_reports: List[Dict[str, Any]],
+    week_range: str,
+    user_id: Optional[str] = None
+) -> str:
+    """Generate project weekly report from personal reports (3.7.2)."""
+    llm = get_llm()
+    if not llm:
+        return "缺少 API Key。"
     
+    team_updates = build_team_updates(project, personal_reports)
     if not team_updates:
         return "本周团队成员未提交相关周报，无法自动汇总。"
     
-    prompt_config = prompts.get_prompt("project_weekly_report")
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", prompt_config.get("system", "你是项目负责人。请使用中文输出。")),
-        ("user", prompt_config.get("user", ""))
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
     try:
-        return await chain.ainvoke({
-            "project_title": project['title'],
-            "week_range": week_range,
-            "team_updates": team_updates
-        })
+        return await summarize_project_week(llm, project, team_updates, week_range, user_id)
     except Exception as e:
         return f"AI 服务异常: {str(e)}"
 
 
-async def generate_project_report(
+def _build_project_report_inputs(
     project: Dict[str, Any],
     events: List[Dict[str, Any]],
     tasks: List[Dict[str, Any]],
     start_date: str,
     end_date: str
-) -> str:
-    """Generate project progress report."""
-    llm = get_llm()
-    if not llm:
-        return "缺少 API Key。请配置环境变量。"
-    
+) -> Dict[str, Any]:
     event_text = "\n".join([
-        f"- [{e['date'].split('T')[0] if isinstance(e['date'], str) else str(e['date'])[:10]}] ({e['type']}) {e['author_name']}: {e['content']}"
+        f"- [{_format_event_date(e)}] ({e['type']}) {e.get('author_name', '')}: {e['content']}"
         for e in events
     ]) or "此期间无时间线更新记录。"
     
@@ -127,38 +331,56 @@ async def generate_project_report(
     else:
         task_text = "暂无任务进度数据。"
     
-    prompt_config = prompts.get_prompt("project_report")
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", prompt_config.get("system", "你是一个专业的项目管理助手。请使用中文输出Markdown格式。")),
-        ("user", prompt_config.get("user", ""))
-    ])
+    return {
+        "project_title": project['title'],
+        "start_date": start_date,
+        "end_date": end_date,
+        "description": project.get('description', ''),
+        "status": project.get('status', ''),
+        "customer": project.get('customer_name', '内部'),
+        "event_text": event_text,
+        "task_text": task_text
+    }
+
+
+async def generate_project_report(
+    project: Dict[str, Any],
+    events: List[Dict[str, Any]],
+    tasks: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str,
+    user_id: Optional[str] = None
+) -> str:
+    """Generate project progress report."""
+    llm = get_llm()
+    if not llm:
+        return "缺少 API Key。请配置环境变量。"
     
-    chain = prompt | llm | StrOutputParser()
     try:
-        return await chain.ainvoke({
-            "project_title": project['title'],
-            "start_date": start_date,
-            "end_date": end_date,
-            "description": project.get('description', ''),
-            "status": project.get('status', ''),
-            "customer": project.get('customer_name', '内部'),
-            "event_text": event_text,
-            "task_text": task_text
-        })
+        return await draft_project_report(llm, project, events, tasks, start_date, end_date, user_id)
     except Exception as e:
         return f"由于 API 错误，生成报告失败: {str(e)}"
 
 
-async def generate_personal_report(
+async def draft_project_report(
+    llm: ChatOpenAI,
+    project: Dict[str, Any],
+    events: List[Dict[str, Any]],
+    tasks: List[Dict[str, Any]],
+    start_date: str,
+    end_date: str,
+    user_id: Optional[str] = None
+) -> str:
+    """Run the project_report prompt. Raises on upstream errors."""
+    inputs = _build_project_report_inputs(project, events, tasks, start_date, end_date)
+    return await _ainvoke(llm, "project_report", inputs, user_id)
+
+
+def _build_personal_report_inputs(
     username: str,
     projects: List[Dict[str, Any]],
     inspirations: List[Dict[str, Any]]
 ) -> Dict[str, Any]:
-    """Generate personal weekly report suggestions."""
-    llm = get_llm()
-    if not llm:
-        return {"generalSummary": "Mock Summary: No API Key."}
-    
     project_context = ""
     for p in projects:
         project_context += f"\nProject ID: {p['id']}\nTitle: {p['title']}\nRecent Activity:\n"
@@ -173,18 +395,204 @@ async def generate_personal_report(
     
     inspiration_context = "\n".join([f"- Shared Idea: {i['content']}" for i in inspirations])
     
-    prompt_config = prompts.get_prompt("personal_report")
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", prompt_config.get("system", "You are an AI assistant that outputs valid JSON only.")),
-        ("user", prompt_config.get("user", ""))
-    ])
+    return {
+        "username": username,
+        "project_context": project_context,
+        "inspiration_context": inspiration_context
+    }
+
+
+async def draft_personal_report(
+    llm: ChatOpenAI,
+    username: str,
+    projects: List[Dict[str, Any]],
+    inspirations: List[Dict[str, Any]],
+    user_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Run the personal_report prompt. Raises on upstream or parse errors."""
+    inputs = _build_personal_report_inputs(username, projects, inspirations)
+    return await _ainvoke(llm, "personal_report", inputs, user_id, parser="json")
+
+
+async def generate_personal_report(
+    username: str,
+    projects: List[Dict[str, Any]],
+    inspirations: List[Dict[str, Any]],
+    user_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Generate personal weekly report suggestions."""
+    llm = get_llm()
+    if not llm:
+        return {"generalSummary": "Mock Summary: No API Key."}
     
-    chain = prompt | llm | JsonOutputParser()
     try:
-        return await chain.ainvoke({
-            "username": username,
-            "project_context": project_context,
-            "inspiration_context": inspiration_context
-        })
+        return await draft_personal_report(llm, username, projects, inspirations, user_id)
     except Exception as e:
         return {"generalSummary": f"生成失败: {str(e)}"}
+
+
+# --- Streaming personal report ---
+
+_PERSONAL_FIELDS = ("content", "plan")
+
+
+def _parse_json_text(text: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Parse model output as a JSON object, dropping markdown fences.
+
+    Truncated output is closed up by parse_partial_json; the flag tells
+    whether the text was complete JSON.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.rstrip().endswith("```"):
+        text = text.rstrip()[:-3]
+    try:
+        data, complete = json.loads(text), True
+    except json.JSONDecodeError:
+        data, complete = parse_partial_json(text), False
+    return (data if isinstance(data, dict) else None), complete
+
+
+def _drop_last_value(data: Dict[str, Any]):
+    """Remove the innermost last value, which may have been cut off mid-string."""
+    if not data:
+        return
+    key = next(reversed(data))
+    if isinstance(data[key], dict) and data[key]:
+        data[key].pop(next(reversed(data[key])))
+    else:
+        data.pop(key)
+
+
+def _settled_personal_fields(data: Dict[str, Any], final: bool):
+    """
+    (key, field, value) for values that can no longer change.
+
+    Keys arrive in document order, so every value except the innermost last
+    one is complete; with `final` the whole object is. `field` is None for
+    top-level strings such as generalSummary.
+    """
+    items = list(data.items())
+    for i, (key, value) in enumerate(items):
+        streaming = not final and i == len(items) - 1
+        if isinstance(value, dict):
+            fields = list(value.items())
+            for j, (field, field_value) in enumerate(fields):
+                if not (streaming and j == len(fields) - 1):
+                    yield key, field, field_value
+        elif not streaming:
+            yield key, None, value
+
+
+def _personal_field_events(data: Dict[str, Any], project_ids: set, emitted: set, final: bool):
+    for key, field, value in _settled_personal_fields(data, final):
+        if not isinstance(value, str) or (key, field) in emitted:
+            continue
+        if field is None and key == "generalSummary":
+            emitted.add((key, field))
+            yield "summary", {"value": value}
+        elif key in project_ids and field in _PERSONAL_FIELDS:
+            emitted.add((key, field))
+            yield "field", {"project_id": key, "field": field, "value": value}
+
+
+def _missing_personal_fields(entry: Any) -> List[str]:
+    if not isinstance(entry, dict):
+        return list(_PERSONAL_FIELDS)
+    return [f for f in _PERSONAL_FIELDS if not isinstance(entry.get(f), str) or not entry[f].strip()]
+
+
+async def stream_personal_report(
+    username: str,
+    projects: List[Dict[str, Any]],
+    inspirations: List[Dict[str, Any]],
+    user_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Generate personal report suggestions as (event, payload) pairs.
+
+    "field" and "summary" events are yielded as soon as each value is
+    complete in the streamed output. Projects whose entry is malformed or
+    missing are then regenerated one by one ("field" events with
+    repaired=True, or "error" for that project), and "done" carries the
+    assembled result.
+    """
+    llm = get_llm()
+    if not llm:
+        yield "done", {"data": {"generalSummary": "Mock Summary: No API Key."}}
+        return
+    
+    inputs = _build_personal_report_inputs(username, projects, inspirations)
+    _, version = _get_chain(llm, "personal_report", "str")
+    _prompt_version.set(version)
+    updates: asyncio.Queue = asyncio.Queue()
+    
+    async def call(endpoint: ModelEndpoint) -> str:
+        chain, _ = _get_chain(endpoint.client(llm), "personal_report", "str", endpoint.name)
+        recorder = LLMCallRecorder()
+        text = ""
+        error = None
+        try:
+            async for chunk in chain.astream(inputs, config={"callbacks": [recorder]}):
+                text += chunk
+                updates.put_nowait(text)
+        except BaseException as e:  # Includes CancelledError: deadline or client disconnect
+            error = e
+            raise
+        finally:
+            record_call(recorder, "personal_report", version, endpoint.model, user_id, error)
+        return text
+    
+    tokens = estimate_tokens(inputs)
+    # Not hedged or coalesced: the call feeds this request's queue
+    task = asyncio.ensure_future(limiter.run_exclusive(user_id, lambda: router.run(tokens, call, hedge=False)))
+    task.add_done_callback(lambda _: updates.put_nowait(None))
+    project_ids = {p["id"] for p in projects}
+    emitted: set = set()
+    try:
+        while (text := await updates.get()) is not None:
+            partial, _ = _parse_json_text(text)
+            if partial:
+                for event in _personal_field_events(partial, project_ids, emitted, final=False):
+                    yield event
+        
+        try:
+            data, complete = _parse_json_text(task.result())
+        except Exception as e:
+            yield "done", {"data": {"generalSummary": f"生成失败: {str(e)}"}, "prompt_version": version}
+            return
+        data = data or {}
+        if not complete:
+            _drop_last_value(data)
+        for event in _personal_field_events(data, project_ids, emitted, final=True):
+            yield event
+        
+        # Retry only the projects whose entry could not be used
+        for p in projects:
+            missing = _missing_personal_fields(data.get(p["id"]))
+            if not missing:
+                continue
+            logger.warning(f"Personal report for {username}: regenerating {p['id']} (missing {missing})")
+            entry = dict(data[p["id"]]) if isinstance(data.get(p["id"]), dict) else {}
+            try:
+                retried = await draft_personal_report(llm, username, [p], inspirations, user_id)
+                fixed = retried.get(p["id"]) if isinstance(retried, dict) else None
+                still_missing = _missing_personal_fields(fixed)
+                for field in missing:
+                    if field not in still_missing:
+                        entry[field] = fixed[field]
+                        yield "field", {"project_id": p["id"], "field": field, "value": fixed[field], "repaired": True}
+                if any(f in still_missing for f in missing):
+                    raise ValueError("模型输出缺少字段")
+            except Exception as e:
+                yield "error", {"project_id": p["id"], "detail": f"生成失败: {str(e)}"}
+            data[p["id"]] = entry
+        
+        if not isinstance(data.get("generalSummary"), str):
+            data["generalSummary"] = ""
+        yield "done", {"data": data, "prompt_version": version}
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,208 @@
+"""
+Concurrency limiter for upstream LLM calls.
+
+Every call made through services/llm goes through `limiter.run`, which:
+- coalesces identical concurrent requests into one upstream call (singleflight),
+- caps in-flight calls per user and globally,
+- paces call starts with a token bucket.
+Rate-limit waits happen before taking a global slot, so a paced call never
+holds a slot other callers could use. Hedged duplicates (see llm_router)
+need a slot of their own and are only sent when one is free right away.
+Queue depth and wait times are kept for the /api/llm/metrics endpoint.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from ..config import settings
+
+T = TypeVar("T")
+
+
+def request_key(prompt_key: str, inputs: Dict[str, Any], model: str = "") -> str:
+    """Identity of an upstream request, used for coalescing."""
+    raw = json.dumps([prompt_key, model, inputs], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """Token bucket: `rate` tokens per second, holding at most `burst` tokens."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available now and nobody is waiting for one."""
+        if self.rate <= 0:
+            return True
+        if self._lock.locked():
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+class LLMLimiter:
+    def __init__(self, max_in_flight: int, max_per_user: int, rate: float, burst: int):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_per_user = max(1, max_per_user)
+        self._global = asyncio.Semaphore(self.max_in_flight)
+        self._user_slots: Dict[str, asyncio.Semaphore] = {}
+        self._user_waiters: Dict[str, int] = {}
+        self._bucket = TokenBucket(rate, burst)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        # Metrics
+        self.queued = 0
+        self.running = 0
+        self.total_requests = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.hedge_slots = 0
+        self.hedges_denied = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+
+    @asynccontextmanager
+    async def _user_slot(self, user_id: Optional[str]):
+        if not user_id:
+            yield
+            return
+        sem = self._user_slots.get(user_id)
+        if sem is None:
+            sem = self._user_slots[user_id] = asyncio.Semaphore(self.max_per_user)
+        self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        try:
+            async with sem:
+                yield
+        finally:
+            self._user_waiters[user_id] -= 1
+            if self._user_waiters[user_id] == 0:
+                # Drop idle per-user state so the dicts don't grow with every user ever seen
+                del self._user_waiters[user_id]
+                del self._user_slots[user_id]
+
+    async def _execute(self, user_id: Optional[str], factory: Callable[[], Awaitable[T]]) -> T:
+        queued_at = time.monotonic()
+        started = False
+        self.queued += 1
+        try:
+            async with self._user_slot(user_id):
+                await self._bucket.acquire()
+                async with self._global:
+                    started = True
+                    self.queued -= 1
+                    waited = time.monotonic() - queued_at
+                    self.wait_seconds_total += waited
+                    self.wait_seconds_max = max(self.wait_seconds_max, waited)
+                    self._recent_waits.append(waited)
+                    self.running += 1
+                    self.upstream_calls += 1
+                    try:
+                        return await factory()
+                    finally:
+                        self.running -= 1
+        finally:
+            if not started:
+                self.queued -= 1
+
+    async def run(self, key: str, user_id: Optional[str], factory: Callable[[], Awaitable[T]]) -> T:
+        """Run `factory()` under the limits, sharing the result with identical in-flight calls."""
+        self.total_requests += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._execute(user_id, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+        # Shield so one caller disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def run_exclusive(self, user_id: Optional[str], factory: Callable[[], Awaitable[T]]) -> T:
+        """Run `factory()` under the limits without coalescing, e.g. for streamed responses."""
+        self.total_requests += 1
+        return await self._execute(user_id, factory)
+
+    async def try_acquire_hedge_slot(self) -> bool:
+        """
+        Take a global slot (and a rate token) for a hedged duplicate request
+        without waiting. False when the limiter is saturated or has a queue;
+        on True, call release_hedge_slot() once the hedge finishes.
+        """
+        if self._global.locked() or not self._bucket.try_acquire():
+            self.hedges_denied += 1
+            return False
+        await self._global.acquire()  # Not locked, so this returns without waiting
+        self.hedge_slots += 1
+        self.running += 1
+        self.upstream_calls += 1
+        return True
+
+    def release_hedge_slot(self):
+        self.running -= 1
+        self._global.release()
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved; callers re-raise it themselves
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self._recent_waits)
+
+        def pct(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 3) if waits else 0.0
+
+        return {
+            "queue_depth": self.queued,
+            "in_flight": self.running,
+            "in_flight_keys": len(self._inflight),
+            "max_in_flight": self.max_in_flight,
+            "max_in_flight_per_user": self.max_per_user,
+            "total_requests": self.total_requests,
+            "coalesced_requests": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "hedge_slots": self.hedge_slots,
+            "hedges_denied": self.hedges_denied,
+            "wait_seconds": {
+                "avg": round(self.wait_seconds_total / self.upstream_calls, 3) if self.upstream_calls else 0.0,
+                "max": round(self.wait_seconds_max, 3),
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+            },
+        }
+
+
+limiter = LLMLimiter(
+    settings.LLM_MAX_IN_FLIGHT,
+    settings.LLM_MAX_IN_FLIGHT_PER_USER,
+    settings.LLM_RATE_PER_SECOND,
+    settings.LLM_RATE_BURST,
+)
@@ -0,0 +1,213 @@
+"""
+Instrumentation for upstream LLM calls.
+
+Each call made by services/llm records prompt key, model, token usage, time
+to first token, total latency and outcome (success, error, timeout, or
+cancelled for hedge losers and disconnected clients). Rows go to the `llm_calls` table
+(written off the request path), and running totals per prompt key are kept
+in memory for /api/llm/metrics.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.llm_call import LLMCall
+from ..utils import now_beijing
+from .llm_router import call_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCallRecorder(AsyncCallbackHandler):
+    """Callback handler that captures first-token time and token usage for one call."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        if usage:
+            self.prompt_tokens += usage.get("input_tokens", 0)
+            self.completion_tokens += usage.get("output_tokens", 0)
+        elif response.llm_output and response.llm_output.get("token_usage"):
+            token_usage = response.llm_output["token_usage"]
+            self.prompt_tokens += token_usage.get("prompt_tokens", 0)
+            self.completion_tokens += token_usage.get("completion_tokens", 0)
+
+    @property
+    def ttft_ms(self) -> Optional[int]:
+        if self.first_token_at is None:
+            return None
+        return int((self.first_token_at - self.started) * 1000)
+
+    @property
+    def elapsed_ms(self) -> int:
+        return int((time.perf_counter() - self.started) * 1000)
+
+
+# In-memory totals per prompt key since process start
+_totals: Dict[str, Dict[str, Any]] = {}
+_pending_writes: Set[asyncio.Task] = set()
+
+
+def _insert_call(row: Dict[str, Any]):
+    db = SessionLocal()
+    try:
+        db.add(LLMCall(**row))
+        db.commit()
+    except Exception as e:
+        logger.warning(f"Failed to record LLM call: {e}")
+    finally:
+        db.close()
+
+
+def call_outcome(error: Optional[BaseException]) -> str:
+    """success, error, timeout, or cancelled (hedge loser, client gone, shutdown)."""
+    if error is None:
+        return "success"
+    if isinstance(error, asyncio.CancelledError):
+        # The router's deadline cancels the call rather than raising inside it
+        deadline = call_deadline()
+        return "timeout" if deadline is not None and time.monotonic() >= deadline else "cancelled"
+    if isinstance(error, asyncio.TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    return "error"
+
+
+def record_call(
+    recorder: LLMCallRecorder,
+    prompt_key: str,
+    prompt_version: Optional[str],
+    model: str,
+    user_id: Optional[str],
+    error: Optional[BaseException] = None
+):
+    """
+    Aggregate one finished call and persist it in the background.
+
+    Call it from a finally block with the exception being raised, if any,
+    so cancelled and timed out calls are recorded too.
+    """
+    latency_ms = recorder.elapsed_ms
+    outcome = call_outcome(error)
+    if outcome == "cancelled":
+        logger.info(f"LLM call {prompt_key} cancelled after {latency_ms}ms")
+    elif error:
+        logger.error(f"LLM call {prompt_key} {outcome} after {latency_ms}ms: {type(error).__name__}: {error}")
+
+    totals = _totals.setdefault(prompt_key, {
+        "calls": 0, "errors": 0, "timeouts": 0, "cancelled": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        "latency_ms_total": 0, "ttft_ms_total": 0, "ttft_samples": 0,
+    })
+    totals["calls"] += 1
+    totals["errors"] += 1 if outcome == "error" else 0
+    totals["timeouts"] += 1 if outcome == "timeout" else 0
+    totals["cancelled"] += 1 if outcome == "cancelled" else 0
+    totals["prompt_tokens"] += recorder.prompt_tokens
+    totals["completion_tokens"] += recorder.completion_tokens
+    totals["latency_ms_total"] += latency_ms
+    if recorder.ttft_ms is not None:
+        totals["ttft_ms_total"] += recorder.ttft_ms
+        totals["ttft_samples"] += 1
+
+    row = {
+        "id": str(uuid.uuid4()),
+        "prompt_key": prompt_key,
+        "prompt_version": prompt_version,
+        "model": model,
+        "user_id": user_id,
+        "prompt_tokens": recorder.prompt_tokens,
+        "completion_tokens": recorder.completion_tokens,
+        "ttft_ms": recorder.ttft_ms,
+        "latency_ms": latency_ms,
+        "outcome": outcome,
+        "error_type": type(error).__name__ if error else None,
+        "error": str(error)[:500] if error else None,
+        "created_at": now_beijing(),
+    }
+    task = asyncio.get_running_loop().create_task(asyncio.to_thread(_insert_call, row))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return round(
+        prompt_tokens / 1000 * settings.LLM_PRICE_PROMPT_PER_1K
+        + completion_tokens / 1000 * settings.LLM_PRICE_COMPLETION_PER_1K,
+        4,
+    )
+
+
+def snapshot() -> Dict[str, Any]:
+    """Per prompt key totals since process start."""
+    result = {}
+    for key, t in _totals.items():
+        result[key] = {
+            "calls": t["calls"],
+            "errors": t["errors"],
+            "timeouts": t["timeouts"],
+            "cancelled": t["cancelled"],
+            "prompt_tokens": t["prompt_tokens"],
+            "completion_tokens": t["completion_tokens"],
+            "avg_latency_ms": int(t["latency_ms_total"] / t["calls"]) if t["calls"] else 0,
+            "avg_ttft_ms": int(t["ttft_ms_total"] / t["ttft_samples"]) if t["ttft_samples"] else None,
+            "estimated_cost": estimate_cost(t["prompt_tokens"], t["completion_tokens"]),
+        }
+    return result
+
+
+def usage_summary(db: Session, start: Optional[datetime], end: Optional[datetime]) -> Dict[str, List[Dict[str, Any]]]:
+    """Usage grouped by report type (prompt key) and by user from the llm_calls table."""
+    def grouped(column):
+        query = db.query(
+            column,
+            func.count(LLMCall.id),
+            func.sum(case((LLMCall.outcome == "error", 1), else_=0)),
+            func.sum(case((LLMCall.outcome == "timeout", 1), else_=0)),
+            func.sum(case((LLMCall.outcome == "cancelled", 1), else_=0)),
+            func.coalesce(func.sum(LLMCall.prompt_tokens), 0),
+            func.coalesce(func.sum(LLMCall.completion_tokens), 0),
+            func.avg(LLMCall.latency_ms),
+            func.avg(LLMCall.ttft_ms),
+        )
+        if start:
+            query = query.filter(LLMCall.created_at >= start)
+        if end:
+            query = query.filter(LLMCall.created_at <= end)
+        rows = query.group_by(column).all()
+        return [
+            {
+                "key": key,
+                "calls": calls,
+                "errors": int(errors or 0),
+                "timeouts": int(timeouts or 0),
+                "cancelled": int(cancelled or 0),
+                "prompt_tokens": int(prompt_tokens),
+                "completion_tokens": int(completion_tokens),
+                "avg_latency_ms": int(avg_latency or 0),
+                "avg_ttft_ms": int(avg_ttft) if avg_ttft is not None else None,
+                "estimated_cost": estimate_cost(int(prompt_tokens), int(completion_tokens)),
+            }
+            for key, calls, errors, timeouts, cancelled, prompt_tokens, completion_tokens, avg_latency, avg_ttft in rows
+        ]
+
+    return {"by_report_type": grouped(LLMCall.prompt_key), "by_user": grouped(LLMCall.user_id)}
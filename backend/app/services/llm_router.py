@@ -0,0 +1,290 @@
+"""
+Model routing, deadlines, hedging and circuit breaking for upstream LLM calls.
+
+Up to three endpoints are configured in Settings: the default (OPENAI_*), an
+optional fast model for small prompts (LLM_FAST_*) and an optional
+long-context model for large ones (LLM_LONG_*). Each call is routed by its
+estimated prompt size and bounded by LLM_TIMEOUT_SECONDS. It can be hedged
+with a second request once it runs past the endpoint's LLM_HEDGE_PERCENTILE
+latency, when the limiter has a slot free for it. While an endpoint's circuit
+breaker is open, calls fail over to the next candidate or fail immediately
+instead of queueing behind a dead upstream.
+Only transport, timeout, 5xx and rate-limit errors count as breaker failures.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+from ..config import settings
+from .llm_limiter import limiter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Monotonic deadline of the routed call running in this context; calls started
+# by _call (and their hedges) inherit it, so a cancelled call can tell a timeout
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_call_deadline", default=None)
+
+
+def call_deadline() -> Optional[float]:
+    """time.monotonic() deadline of the current routed call, or None without a timeout."""
+    return _deadline.get()
+
+
+class CircuitOpenError(RuntimeError):
+    """Every endpoint that could serve the call is currently rejecting calls."""
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Whether an error means the endpoint is unhealthy: connection or timeout
+    errors, 5xx and rate limiting. Errors about the response itself (such as
+    malformed JSON from the output parser) or the request do not count
+    toward the circuit breaker.
+    """
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def build_client(model: str, api_base: Optional[str], api_key: str) -> ChatOpenAI:
+    kwargs = {
+        "model": model,
+        "api_key": api_key,
+        "temperature": 0.7,
+        # Stream internally so time-to-first-token and usage can be recorded
+        "streaming": True,
+        "stream_usage": True,
+    }
+    if api_base:
+        kwargs["base_url"] = api_base
+    return ChatOpenAI(**kwargs)
+
+
+def estimate_tokens(inputs: Dict[str, Any]) -> int:
+    """Rough prompt size: about 4 ASCII characters or 1 CJK character per token."""
+    text = "".join(str(v) for v in inputs.values())
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, then allows one trial call every `cooldown` seconds."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._trial or self.consecutive_failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def release_trial(self):
+        """The trial call was cancelled before it finished; let the next call try."""
+        self._trial = False
+
+
+class ModelEndpoint:
+    def __init__(self, name: str, model: str, api_base: Optional[str], api_key: str):
+        self.name = name
+        self.model = model
+        self.api_base = api_base
+        self.api_key = api_key
+        self.breaker = CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_COOLDOWN_SECONDS)
+        self._client: Optional[ChatOpenAI] = None
+        self._latencies: Deque[float] = deque(maxlen=500)
+
+        # Metrics
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def client(self, default: ChatOpenAI) -> ChatOpenAI:
+        """LangChain client for this endpoint; the default endpoint shares services.llm's client."""
+        if self.name == "default":
+            return default
+        if self._client is None:
+            self._client = build_client(self.model, self.api_base, self.api_key)
+        return self._client
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def hedge_delay(self) -> Optional[float]:
+        if settings.LLM_HEDGE_PERCENTILE <= 0 or len(self._latencies) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency_percentile(settings.LLM_HEDGE_PERCENTILE)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(0.50)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "model": self.model,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50_ms": int(p50 * 1000) if p50 is not None else None,
+            "latency_p95_ms": int(p95 * 1000) if p95 is not None else None,
+        }
+
+
+class ModelRouter:
+    def __init__(self):
+        self.default = ModelEndpoint("default", settings.OPENAI_MODEL, settings.OPENAI_API_BASE, settings.OPENAI_API_KEY)
+        self.fast = self._optional_endpoint(
+            "fast", settings.LLM_FAST_MODEL, settings.LLM_FAST_API_BASE, settings.LLM_FAST_API_KEY
+        )
+        self.long = self._optional_endpoint(
+            "long", settings.LLM_LONG_MODEL, settings.LLM_LONG_API_BASE, settings.LLM_LONG_API_KEY
+        )
+
+    @staticmethod
+    def _optional_endpoint(name: str, model: Optional[str], api_base: Optional[str], api_key: Optional[str]):
+        if not model:
+            return None
+        return ModelEndpoint(name, model, api_base or settings.OPENAI_API_BASE, api_key or settings.OPENAI_API_KEY)
+
+    def candidates(self, tokens: int) -> List[ModelEndpoint]:
+        """Endpoints able to serve a prompt of `tokens` estimated tokens, in order of preference."""
+        if self.long and tokens >= settings.LLM_LONG_MIN_TOKENS:
+            return [self.long]  # Too large for the other models
+        if self.fast and tokens <= settings.LLM_FAST_MAX_TOKENS:
+            return [self.fast, self.default]
+        return [self.default] + ([self.long] if self.long else [])
+
+    async def run(self, tokens: int, call: Callable[[ModelEndpoint], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        Run `call` against the first candidate endpoint whose breaker admits it.
+
+        Errors from the chosen endpoint are raised, not retried elsewhere;
+        callers already fall back (error text, job retries). Pass hedge=False
+        for calls with side effects, such as streaming into a queue.
+        """
+        candidates = self.candidates(tokens)
+        for endpoint in candidates:
+            if endpoint.breaker.allow():
+                return await self._call(endpoint, call, hedge)
+            endpoint.rejected += 1
+        raise CircuitOpenError(f"模型服务熔断中，请稍后重试 ({', '.join(e.model for e in candidates)})")
+
+    async def _call(self, endpoint: ModelEndpoint, call: Callable[[ModelEndpoint], Awaitable[T]], hedge: bool) -> T:
+        endpoint.calls += 1
+        started = time.monotonic()
+        timeout = settings.LLM_TIMEOUT_SECONDS if settings.LLM_TIMEOUT_SECONDS > 0 else None
+        token = _deadline.set(started + timeout if timeout else None)
+        try:
+            attempt = self._hedged(endpoint, call) if hedge else call(endpoint)
+            result = await asyncio.wait_for(attempt, timeout)
+        except asyncio.CancelledError:
+            endpoint.breaker.release_trial()
+            raise
+        except asyncio.TimeoutError:
+            endpoint.failures += 1
+            endpoint.timeouts += 1
+            self._record_failure(endpoint)
+            raise asyncio.TimeoutError(f"{endpoint.model} 响应超时 ({timeout:.0f}s)") from None
+        except Exception as e:
+            if not is_upstream_failure(e):
+                # The endpoint answered; the problem is the content
+                endpoint.breaker.record_success()
+                raise
+            endpoint.failures += 1
+            self._record_failure(endpoint)
+            raise
+        finally:
+            _deadline.reset(token)
+        endpoint._latencies.append(time.monotonic() - started)
+        endpoint.breaker.record_success()
+        return result
+
+    @staticmethod
+    def _record_failure(endpoint: ModelEndpoint):
+        was_open = endpoint.breaker.opened_at is not None
+        endpoint.breaker.record_failure()
+        if not was_open and endpoint.breaker.opened_at is not None:
+            logger.warning(
+                f"LLM circuit breaker opened for {endpoint.name} ({endpoint.model}) after "
+                f"{endpoint.breaker.consecutive_failures} consecutive failures"
+            )
+
+    async def _hedged(self, endpoint: ModelEndpoint, call: Callable[[ModelEndpoint], Awaitable[T]]) -> T:
+        """Start a second identical request if the first runs past the hedge delay; first success wins."""
+        delay = endpoint.hedge_delay()
+        if delay is None:
+            return await call(endpoint)
+
+        tasks = [asyncio.ensure_future(call(endpoint))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # The primary holds the caller's limiter slot; the hedge needs one of its own
+            if not done and await limiter.try_acquire_hedge_slot():
+                endpoint.hedged += 1
+                hedge = asyncio.ensure_future(call(endpoint))
+                hedge.add_done_callback(lambda _: limiter.release_hedge_slot())
+                tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            endpoint.hedge_wins += 1
+                        return task.result()
+            return tasks[0].result()  # Every attempt failed: raise the original error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        endpoints = [e for e in (self.default, self.fast, self.long) if e]
+        return {e.name: e.snapshot() for e in endpoints}
+
+
+router = ModelRouter()
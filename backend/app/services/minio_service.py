@@ -2,16 +2,26 @@
 MinIO Object Storage Service
 Handles file upload, download URL generation, and deletion.
 """
+import hashlib
+import os
+import re
+import shutil
+import unicodedata
 import uuid
 import logging
+from datetime import timedelta
 from io import BytesIO
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
 from minio import Minio
+from minio.datatypes import Object, Part
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 _client: Minio | None = None
+_public_client: Minio | None = None
 
 
 def get_minio_client() -> Minio:
@@ -29,6 +39,31 @@ def get_minio_client() -> Minio:
     return _client
 
 
+def get_public_client() -> Minio:
+    """
+    Client addressed by the browser-facing endpoint, used only to sign URLs.
+
+    The region is fixed so presigning never makes a network call.
+    """
+    global _public_client
+    if _public_client is None:
+        _public_client = Minio(
+            settings.MINIO_PUBLIC_ENDPOINT or settings.MINIO_ENDPOINT,
+            access_key=settings.MINIO_ACCESS_KEY,
+            secret_key=settings.MINIO_SECRET_KEY,
+            secure=settings.MINIO_PUBLIC_SECURE if settings.MINIO_PUBLIC_ENDPOINT else settings.MINIO_SECURE,
+            region=settings.MINIO_REGION,
+        )
+    return _public_client
+
+
+def presigned_url(object_name: str, expires_seconds: int) -> str:
+    """Short-lived GET URL for an object on the public endpoint."""
+    return get_public_client().presigned_get_object(
+        settings.MINIO_BUCKET, object_name, expires=timedelta(seconds=expires_seconds)
+    )
+
+
 def ensure_bucket():
     """Ensure the configured bucket exists. Create it if not."""
     client = get_minio_client()
@@ -40,6 +75,21 @@ def ensure_bucket():
         else:
             logger.info(f"✓ MinIO bucket '{bucket}' already exists")
 
+        if settings.FILE_REQUIRE_AUTH and settings.FILE_SERVE_MODE != "accel":
+            # Files are only served through the API (or presigned URLs); no anonymous reads
+            try:
+                client.delete_bucket_policy(bucket)
+                logger.info(f"✓ MinIO bucket '{bucket}' public read policy removed (FILE_REQUIRE_AUTH)")
+            except S3Error as e:
+                if e.code != "NoSuchBucketPolicy":
+                    raise
+            return
+        if settings.FILE_REQUIRE_AUTH:
+            logger.warning(
+                "FILE_REQUIRE_AUTH with FILE_SERVE_MODE=accel keeps the bucket publicly readable for the "
+                "fronting proxy; make sure the MinIO endpoint itself is not reachable by clients"
+            )
+
         # Set bucket policy to allow public read
         import json
         policy = {
@@ -60,59 +110,179 @@ def ensure_bucket():
         raise
 
 
+class FileTooLargeError(ValueError):
+    """Raised while streaming an upload once it exceeds the allowed size."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"file exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
+class _HashingReader:
+    """File-like wrapper that hashes and counts bytes as put_object reads them, enforcing a size limit."""
+
+    def __init__(self, stream: BinaryIO, max_size: Optional[int]):
+        self._stream = stream
+        self._max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self.size += len(chunk)
+        if self._max_size is not None and self.size > self._max_size:
+            raise FileTooLargeError(self._max_size)
+        self.sha256.update(chunk)
+        return chunk
+
+
+_UNSAFE_NAME_CHARS = re.compile(r'[/\\:*?"<>|]')
+
+
+def safe_filename(filename: str, max_length: int = 150) -> str:
+    """
+    Client filename reduced to one safe object key segment: no directory
+    part, path separators, control or format characters (e.g. RTL
+    overrides), spaces as underscores, at most max_length characters with
+    the extension kept.
+    """
+    name = re.split(r"[/\\]", filename or "")[-1]
+    name = "".join(c for c in name if unicodedata.category(c)[0] != "C")
+    name = _UNSAFE_NAME_CHARS.sub("", name).replace(" ", "_").lstrip(".")
+    if len(name) > max_length:
+        stem, ext = os.path.splitext(name)
+        ext = ext[:16]
+        name = stem[:max_length - len(ext)] + ext
+    return name or "file"
+
+
 def upload_file(
-    file_data: bytes,
+    stream: BinaryIO,
     original_filename: str,
     content_type: str = "application/octet-stream",
     folder: str = "uploads",
-) -> str:
+    max_size: Optional[int] = None,
+    object_name: Optional[str] = None,
+) -> Dict[str, Any]:
     """
-    Upload a file to MinIO and return its public URL.
+    Stream a file into MinIO.
+
+    The stream is read one multipart part at a time (MINIO_PART_SIZE_MB), so
+    memory use does not depend on the file size. Size and SHA-256 are
+    computed while reading.
 
     Args:
-        file_data: Raw file bytes
+        stream: Readable binary file object
         original_filename: Original filename for naming
         content_type: MIME type of the file
         folder: Folder/prefix within the bucket
+        max_size: Maximum size in bytes; FileTooLargeError is raised (and the
+            multipart upload aborted) as soon as it is exceeded
+        object_name: Exact key to store under, instead of folder/uuid_filename
 
     Returns:
-        Public URL string to access the file
+        Dict with the object name ("path"), "size" and hex "sha256"
     """
     client = get_minio_client()
     bucket = settings.MINIO_BUCKET
 
-    # Generate unique object name: folder/uuid_originalname
-    file_uuid = uuid.uuid4().hex[:12]
-    # Sanitize filename
-    safe_name = original_filename.replace(" ", "_")
-    object_name = f"{folder}/{file_uuid}_{safe_name}"
+    if object_name is None:
+        # Generate unique object name: folder/uuid_originalname
+        file_uuid = uuid.uuid4().hex[:12]
+        object_name = f"{folder}/{file_uuid}_{safe_filename(original_filename)}"
 
-    # Upload
-    data_stream = BytesIO(file_data)
+    # Unknown length: minio reads and uploads part_size chunks
+    reader = _HashingReader(stream, max_size)
     client.put_object(
         bucket,
         object_name,
-        data_stream,
-        length=len(file_data),
+        reader,
+        length=-1,
+        part_size=max(5, settings.MINIO_PART_SIZE_MB) * 1024 * 1024,
         content_type=content_type,
     )
 
-    logger.info(f"✓ Uploaded '{original_filename}' -> {object_name}")
+    logger.info(f"✓ Uploaded '{original_filename}' -> {object_name} ({reader.size} bytes)")
     # Return relative path (object_name) instead of full URL
-    return object_name
+    return {"path": object_name, "size": reader.size, "sha256": reader.sha256.hexdigest()}
+
+
+def upload_bytes(object_name: str, data: bytes, content_type: str):
+    """Store a small generated object (e.g. a thumbnail) under an exact key."""
+    client = get_minio_client()
+    client.put_object(settings.MINIO_BUCKET, object_name, BytesIO(data), length=len(data), content_type=content_type)
+
 
+def read_file(object_name: str) -> bytes:
+    """Read a whole object into memory. Only for objects known to be small enough."""
+    response = get_minio_client().get_object(settings.MINIO_BUCKET, object_name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def download_file(object_name: str, path: str):
+    """Copy an object to a local file (e.g. the file proxy's disk cache)."""
+    response = get_minio_client().get_object(settings.MINIO_BUCKET, object_name)
+    try:
+        with open(path, "wb") as f:
+            shutil.copyfileobj(response, f, 1024 * 1024)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+# --- Multipart uploads driven by the client (upload sessions) ---
+# minio-py only exposes these as private methods; put_object uses them internally.
+
+def create_multipart_upload(object_name: str, content_type: str) -> str:
+    client = get_minio_client()
+    return client._create_multipart_upload(settings.MINIO_BUCKET, object_name, {"Content-Type": content_type})
+
+
+def upload_part(object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+    """Upload one part and return its ETag."""
+    client = get_minio_client()
+    return client._upload_part(settings.MINIO_BUCKET, object_name, data, None, upload_id, part_number)
+
+
+def complete_multipart_upload(object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+    """Assemble the object from (part_number, etag) pairs, in ascending order."""
+    client = get_minio_client()
+    client._complete_multipart_upload(
+        settings.MINIO_BUCKET, object_name, upload_id, [Part(number, etag) for number, etag in parts]
+    )
 
-def get_file_stream(object_name: str):
+
+def abort_multipart_upload(object_name: str, upload_id: str):
+    client = get_minio_client()
+    client._abort_multipart_upload(settings.MINIO_BUCKET, object_name, upload_id)
+
+
+def stat_file(object_name: str):
+    """Object metadata (size, etag, last_modified, content_type)."""
+    client = get_minio_client()
+    return client.stat_object(settings.MINIO_BUCKET, object_name)
+
+
+def get_file_stream(object_name: str, offset: int = 0, length: int = 0):
     """
     Get a file stream from MinIO.
     
+    Args:
+        object_name: Object to read
+        offset: First byte to return
+        length: Number of bytes to return, 0 for the rest of the object
+    
     Returns:
         MinIO response object (which is a stream)
     """
     client = get_minio_client()
     bucket = settings.MINIO_BUCKET
     try:
-        response = client.get_object(bucket, object_name)
+        response = client.get_object(bucket, object_name, offset=offset, length=length)
         return response
     except S3Error as e:
         logger.error(f"✗ Failed to get '{object_name}': {e}")
@@ -129,3 +299,20 @@ def delete_file(object_name: str):
     except S3Error as e:
         logger.error(f"✗ Failed to delete '{object_name}': {e}")
         raise
+
+
+def iter_objects(prefix: Optional[str] = None) -> Iterator[Object]:
+    """Every object in the bucket, fetched lazily one listing page (1000 keys) at a time."""
+    client = get_minio_client()
+    return client.list_objects(settings.MINIO_BUCKET, prefix=prefix, recursive=True)
+
+
+def remove_objects(object_names: Iterable[str]) -> List[str]:
+    """Delete up to 1000 objects in one request. Returns the names that failed."""
+    client = get_minio_client()
+    errors = client.remove_objects(settings.MINIO_BUCKET, (DeleteObject(name) for name in object_names))
+    failed = []
+    for error in errors:  # Lazy: the request is only sent while iterating
+        logger.error(f"✗ Failed to delete '{error.name}': {error.code} {error.message}")
+        failed.append(error.name)
+    return failed
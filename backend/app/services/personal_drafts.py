@@ -0,0 +1,257 @@
+"""
+Pre-generated personal report drafts.
+
+Thursday night the scheduler queues one job per user, spread evenly over an
+off-peak window. Each job builds the user's week from events, tasks and
+inspirations and stores the LLM draft, so Friday's "generate" click can
+return it instantly.
+
+A draft is only served for the same selection it was generated from
+(projects and inspirations, see input_fingerprint), and only while the
+user's own events and open tasks in those projects are unchanged (see
+activity_fingerprint); other members' activity does not invalidate it.
+The draft's selection is returned by get_draft_for_selection so the UI can
+preselect it, which makes the generate click hit the draft.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from ..config import settings
+from ..database import SessionLocal
+from ..models.event import TimelineEvent
+from ..models.inspiration import Inspiration
+from ..models.job import Job, JobStatus
+from ..models.project import Project
+from ..models.report import PersonalReportDraft
+from ..models.task import TaskAssignment, TaskStatus
+from ..models.user import User
+from ..utils import now_beijing
+from . import llm
+
+logger = logging.getLogger(__name__)
+
+_DRAFT_JOB_NAMESPACE = uuid.UUID("6f1c7a52-3b1e-4d1a-9a57-2f0d8b0c1e44")
+
+
+def week_start_of(day: date) -> datetime:
+    monday = day - timedelta(days=day.weekday())
+    return datetime.combine(monday, datetime.min.time())
+
+
+def input_fingerprint(projects: List[Dict[str, Any]], inspirations: List[Dict[str, Any]]) -> str:
+    """Fingerprint of a personal report selection: project ids and inspiration texts."""
+    payload = {
+        "projects": sorted(str(p.get("id")) for p in projects),
+        "inspirations": sorted(str(i.get("content", "")) for i in inspirations),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def activity_fingerprint(events: Iterable[TimelineEvent], tasks: Iterable[TaskAssignment], project_ids: Iterable[str]) -> str:
+    """Fingerprint of the user's own events and open tasks in the given projects."""
+    wanted = set(project_ids)
+    payload = {
+        "events": sorted([e.id, e.content] for e in events if e.project_id in wanted),
+        "tasks": sorted(
+            [t.id, t.title, t.status.value, t.progress] for t in tasks if t.project_id in wanted
+        ),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _user_activity(db, user_id: str, week_start: datetime) -> Tuple[List[TimelineEvent], List[TaskAssignment]]:
+    """The user's events this week and open task assignments."""
+    week_end = week_start + timedelta(days=7)
+    events = (
+        db.query(TimelineEvent)
+        .filter(
+            TimelineEvent.author_id == user_id,
+            TimelineEvent.date >= week_start,
+            TimelineEvent.date < week_end,
+        )
+        .all()
+    )
+    # assignee_ids is a JSON list, so filter assignments in Python
+    tasks = [
+        t for t in db.query(TaskAssignment).filter(TaskAssignment.status != TaskStatus.COMPLETED).all()
+        if user_id in (t.assignee_ids or [])
+    ]
+    return events, tasks
+
+
+def get_draft_for_selection(db, user_id: str) -> Optional[PersonalReportDraft]:
+    """
+    The current week's draft while the user's events and tasks in its projects
+    are unchanged. Its `selection` holds the project and inspiration ids it was
+    generated for.
+    """
+    week_start = week_start_of(now_beijing().date())
+    draft = (
+        db.query(PersonalReportDraft)
+        .filter(PersonalReportDraft.user_id == user_id, PersonalReportDraft.week_start_date == week_start)
+        .first()
+    )
+    if draft is None or not draft.selection:
+        return None
+    events, tasks = _user_activity(db, user_id, week_start)
+    if activity_fingerprint(events, tasks, draft.selection["project_ids"]) != draft.selection.get("activity"):
+        return None
+    return draft
+
+
+def get_current_draft(
+    db,
+    user_id: str,
+    projects: List[Dict[str, Any]],
+    inspirations: List[Dict[str, Any]]
+) -> Optional[PersonalReportDraft]:
+    """The current week's draft, if it was pre-generated for this selection and is still current."""
+    draft = get_draft_for_selection(db, user_id)
+    if draft is None or draft.input_fingerprint != input_fingerprint(projects, inspirations):
+        return None
+    return draft
+
+
+def _load_user_week(user_id: str, week_start: datetime):
+    """
+    Collect the inputs generate_personal_report expects, from the DB, plus the
+    selection they correspond to (see PersonalReportDraft.selection).
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return None, [], [], None
+        week_end = week_start + timedelta(days=7)
+
+        events, tasks = _user_activity(db, user_id, week_start)
+        project_ids = {e.project_id for e in events} | {t.project_id for t in tasks}
+        projects = db.query(Project).filter(Project.id.in_(project_ids)).all() if project_ids else []
+
+        project_dicts: List[Dict[str, Any]] = []
+        for p in projects:
+            project_dicts.append({
+                "id": p.id,
+                "title": p.title,
+                "events": [{"content": e.content} for e in events if e.project_id == p.id],
+                "tasks": [
+                    {"title": t.title, "status": t.status.value, "progress": t.progress}
+                    for t in tasks if t.project_id == p.id
+                ],
+            })
+
+        inspirations = (
+            db.query(Inspiration)
+            .filter(
+                Inspiration.author_id == user_id,
+                Inspiration.created_at >= week_start,
+                Inspiration.created_at < week_end,
+            )
+            .all()
+        )
+        selection = {
+            "project_ids": [p.id for p in projects],
+            "inspiration_ids": [i.id for i in inspirations],
+            "activity": activity_fingerprint(events, tasks, [p.id for p in projects]),
+        }
+        return user.username, project_dicts, [{"content": i.content} for i in inspirations], selection
+    finally:
+        db.close()
+
+
+def _save_draft(
+    user_id: str, week_start: datetime, data: Dict[str, Any], fingerprint: str, selection: Dict[str, Any]
+):
+    db = SessionLocal()
+    try:
+        draft = (
+            db.query(PersonalReportDraft)
+            .filter(PersonalReportDraft.user_id == user_id, PersonalReportDraft.week_start_date == week_start)
+            .first()
+        )
+        if draft is None:
+            draft = PersonalReportDraft(id=str(uuid.uuid4()), user_id=user_id, week_start_date=week_start)
+            db.add(draft)
+        draft.data = data
+        draft.input_fingerprint = fingerprint
+        draft.selection = selection
+        draft.created_at = now_beijing()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def generate_draft_for_user(user_id: str, week_start: datetime) -> Dict[str, Any]:
+    """Generate and store one user's draft. Raises on failure so the job is retried."""
+    chat = llm.get_llm()
+    if not chat:
+        raise RuntimeError("缺少 API Key。")
+
+    username, projects, inspirations, selection = await asyncio.to_thread(_load_user_week, user_id, week_start)
+    if username is None:
+        return {"skipped": "user not found"}
+    if not projects and not inspirations:
+        return {"skipped": "no activity this week"}
+
+    data = await llm.draft_personal_report(chat, username, projects, inspirations)
+    fingerprint = input_fingerprint(projects, inspirations)
+    await asyncio.to_thread(_save_draft, user_id, week_start, data, fingerprint, selection)
+    return {"projects": len(projects), "inspirations": len(inspirations)}
+
+
+def enqueue_weekly_drafts() -> int:
+    """
+    Queue draft jobs for every user once the draft window has opened.
+
+    Job ids are derived from (user, week), so calling this repeatedly is
+    harmless. Returns the number of newly queued jobs.
+    """
+    now = now_beijing()
+    week_start = week_start_of(now.date())
+    window_start = week_start + timedelta(days=settings.PERSONAL_DRAFT_WEEKDAY, hours=settings.PERSONAL_DRAFT_HOUR)
+    window_end = window_start + timedelta(hours=settings.PERSONAL_DRAFT_WINDOW_HOURS)
+    if not (window_start <= now < window_end):
+        return 0
+
+    db = SessionLocal()
+    try:
+        user_ids = [u.id for u in db.query(User.id).all()]
+        if not user_ids:
+            return 0
+        job_ids = {
+            uid: str(uuid.uuid5(_DRAFT_JOB_NAMESPACE, f"{uid}:{week_start.date().isoformat()}"))
+            for uid in user_ids
+        }
+        existing = {j.id for j in db.query(Job.id).filter(Job.id.in_(list(job_ids.values()))).all()}
+
+        # Spread the remaining jobs evenly over what is left of the window
+        pending = [uid for uid in user_ids if job_ids[uid] not in existing]
+        if not pending:
+            return 0
+        step = (window_end - now) / len(pending)
+        for i, uid in enumerate(pending):
+            db.add(Job(
+                id=job_ids[uid],
+                type="personal_report_draft",
+                params={"user_id": uid, "week_start": week_start.isoformat()},
+                status=JobStatus.PENDING,
+                progress=0,
+                attempts=0,
+                max_attempts=settings.JOB_MAX_ATTEMPTS,
+                cancel_requested=False,
+                created_by=uid,
+                run_after=now + step * i,
+                created_at=now,
+                updated_at=now,
+            ))
+        db.commit()
+        logger.info(f"Queued {len(pending)} personal report draft jobs for week {week_start.date()}")
+        return len(pending)
+    finally:
+        db.close()
@@ -0,0 +1,166 @@
+"""
+Batch generation of project weekly reports for every active project.
+
+Each project's report is saved under an event id derived from (project,
+week), so a retried or re-run batch skips projects that already have their
+report instead of saving it twice.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+from ..config import settings
+from ..database import SessionLocal
+from ..models.project import Project, ProjectStatus
+from ..models.report import WeeklyReport
+from ..models.event import TimelineEvent, EventType
+from ..utils import now_beijing
+from . import digest, llm
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, str], Awaitable[None]]
+
+_WEEKLY_EVENT_NAMESPACE = uuid.UUID("04111651-9f6f-4d19-bb90-7d25e17e0621")
+
+
+def current_week_start() -> date:
+    """Monday of the current week (Beijing time)."""
+    today = now_beijing().date()
+    return today - timedelta(days=today.weekday())
+
+
+def weekly_event_id(project_id: str, week_start: date) -> str:
+    """Id of the WEEKLY_REPORT event the batch saves for a project and week."""
+    return str(uuid.uuid5(_WEEKLY_EVENT_NAMESPACE, f"{project_id}:{week_start.isoformat()}"))
+
+
+def _load_week_inputs(week_start: date):
+    """Load EXECUTION projects, the personal reports submitted for the week and the reports already saved."""
+    db = SessionLocal()
+    try:
+        projects = db.query(Project).filter(Project.status == ProjectStatus.EXECUTION).all()
+        start = datetime.combine(week_start, datetime.min.time())
+        reports = (
+            db.query(WeeklyReport)
+            .filter(WeeklyReport.week_start_date >= start, WeeklyReport.week_start_date < start + timedelta(days=7))
+            .all()
+        )
+        event_ids = [weekly_event_id(p.id, week_start) for p in projects]
+        saved = {
+            eid for eid, in db.query(TimelineEvent.id).filter(TimelineEvent.id.in_(event_ids)).all()
+        } if event_ids else set()
+        project_dicts = [{"id": p.id, "title": p.title} for p in projects]
+        report_dicts = [
+            {
+                "username": r.username,
+                "content": r.content or "",
+                "linked_project_ids": r.linked_project_ids or [],
+                "details": [
+                    {"project_id": d.project_id, "content": d.content or "", "plan": d.plan or ""}
+                    for d in r.details
+                ],
+            }
+            for r in reports
+        ]
+        return project_dicts, report_dicts, saved
+    finally:
+        db.close()
+
+
+def _save_weekly_event(event_id: str, project_id: str, author: Dict[str, str], content: str) -> str:
+    db = SessionLocal()
+    try:
+        if db.query(TimelineEvent.id).filter(TimelineEvent.id == event_id).first():
+            # Saved meanwhile by another run of the same week
+            return event_id
+        event = TimelineEvent(
+            id=event_id,
+            project_id=project_id,
+            author_id=author["id"],
+            author_name=author["username"],
+            content=content,
+            date=now_beijing(),
+            type=EventType.WEEKLY_REPORT,
+            attachments=[]
+        )
+        db.add(event)
+        digest.record_event_created(db, event)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return event_id
+        return event.id
+    finally:
+        db.close()
+
+
+async def generate_all_project_weekly_reports(
+    author: Dict[str, str],
+    week_start: Optional[date] = None,
+    progress: Optional[ProgressCallback] = None
+) -> Dict[str, Any]:
+    """
+    Generate a weekly report for every EXECUTION project and save each one as a
+    WEEKLY_REPORT timeline event authored by `author` ({id, username}).
+
+    LLM calls fan out concurrently, limited by LLM_BATCH_CONCURRENCY.
+    Returns per-project timings and failures.
+    """
+    started = time.perf_counter()
+    week_start = week_start or current_week_start()
+    week_end = week_start + timedelta(days=6)
+    week_range = f"{week_start.isoformat()} 至 {week_end.isoformat()}"
+
+    chat = llm.get_llm()
+    if not chat:
+        raise RuntimeError("缺少 API Key。")
+
+    projects, personal_reports, saved = await asyncio.to_thread(_load_week_inputs, week_start)
+    semaphore = asyncio.Semaphore(max(1, settings.LLM_BATCH_CONCURRENCY))
+    done_count = 0
+
+    async def run_one(project: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal done_count
+        item: Dict[str, Any] = {"project_id": project["id"], "title": project["title"]}
+        item_started = time.perf_counter()
+        event_id = weekly_event_id(project["id"], week_start)
+        team_updates = llm.build_team_updates(project, personal_reports)
+        if event_id in saved:
+            item["status"] = "skipped"
+            item["error"] = "本周项目周报已生成"
+            item["event_id"] = event_id
+        elif not team_updates:
+            item["status"] = "skipped"
+            item["error"] = "本周团队成员未提交相关周报"
+        else:
+            try:
+                async with semaphore:
+                    content = await llm.summarize_project_week(chat, project, team_updates, week_range)
+                item["event_id"] = await asyncio.to_thread(_save_weekly_event, event_id, project["id"], author, content)
+                item["status"] = "succeeded"
+            except Exception as e:
+                logger.error(f"Weekly report for project {project['id']} failed: {e}")
+                item["status"] = "failed"
+                item["error"] = str(e)
+        item["duration_ms"] = int((time.perf_counter() - item_started) * 1000)
+        done_count += 1
+        if progress:
+            await progress(int(done_count * 100 / len(projects)), f"{done_count}/{len(projects)} 个项目已处理")
+        return item
+
+    items: List[Dict[str, Any]] = await asyncio.gather(*[run_one(p) for p in projects])
+
+    return {
+        "week_range": week_range,
+        "total": len(items),
+        "succeeded": sum(1 for i in items if i["status"] == "succeeded"),
+        "skipped": sum(1 for i in items if i["status"] == "skipped"),
+        "failed": sum(1 for i in items if i["status"] == "failed"),
+        "duration_ms": int((time.perf_counter() - started) * 1000),
+        "items": items,
+    }
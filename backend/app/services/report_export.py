@@ -0,0 +1,103 @@
+"""
+Streaming batch export of weekly reports as a ZIP of DOCX files.
+
+Reports are loaded from the database REPORT_BATCH at a time and rendered in
+the DOCX process pool, keeping at most one render per worker in flight.
+Each document is added to the archive and sent as soon as it is ready, so
+memory holds one batch of report data plus the documents being rendered,
+however many reports the export covers.
+"""
+import asyncio
+import logging
+import zipfile
+from typing import AsyncIterator, Dict, List, Set, Tuple
+from ..database import SessionLocal
+from ..models.report import WeeklyReport
+from ..schemas.report import ReportResponse
+from .docx_pool import pool as docx_pool
+from .docx_service import generate_report_docx
+from .zip_stream import ZipStream
+
+logger = logging.getLogger(__name__)
+
+REPORT_BATCH = 50
+
+
+def existing_report_ids(report_ids: List[str]) -> List[str]:
+    """The requested ids that exist, in request order without duplicates."""
+    db = SessionLocal()
+    try:
+        found = {
+            rid for rid, in db.query(WeeklyReport.id).filter(WeeklyReport.id.in_(report_ids)).all()
+        }
+    finally:
+        db.close()
+    return [rid for rid in dict.fromkeys(report_ids) if rid in found]
+
+
+def _load_batch(report_ids: List[str]) -> List[Tuple[WeeklyReport, Dict]]:
+    db = SessionLocal()
+    try:
+        reports = {r.id: r for r in db.query(WeeklyReport).filter(WeeklyReport.id.in_(report_ids)).all()}
+        return [
+            (reports[rid], ReportResponse.model_validate(reports[rid]).model_dump(mode="json"))
+            for rid in report_ids if rid in reports
+        ]
+    finally:
+        db.close()
+
+
+def _entry_name(report: WeeklyReport, names: Set[str]) -> str:
+    date_str = report.created_at.strftime('%Y%m%d')
+    filename = f"report_{report.username}_{date_str}.docx"
+    # Handle duplicate filenames
+    if filename in names:
+        filename = f"report_{report.username}_{date_str}_{report.id[:4]}.docx"
+    names.add(filename)
+    return filename
+
+
+async def stream_reports_zip(report_ids: List[str]) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of the reports' DOCX exports, entry by entry as renders finish."""
+    archive = ZipStream()
+    names: Set[str] = set()
+    pending: Dict[asyncio.Task, Tuple[str, WeeklyReport]] = {}
+    window = docx_pool.workers
+
+    async def finished(block: bool) -> List[bytes]:
+        """Archive bytes for the renders that are done, waiting for at least one if block."""
+        if block and pending:
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        done = [task for task in pending if task.done()]
+        chunks = []
+        for task in done:
+            name, report = pending.pop(task)
+            try:
+                chunks.append(archive.add(name, task.result(), report.created_at))
+            except Exception as e:
+                # Headers are already sent, so a failed document becomes a note in the archive
+                logger.error(f"Batch export of report {report.id} failed: {e}")
+                chunks.append(archive.add(
+                    f"{name[:-len('.docx')]}.error.txt", f"导出失败: {e}".encode("utf-8"),
+                    report.created_at, zipfile.ZIP_DEFLATED,
+                ))
+        return chunks
+
+    try:
+        for start in range(0, len(report_ids), REPORT_BATCH):
+            batch = await asyncio.to_thread(_load_batch, report_ids[start:start + REPORT_BATCH])
+            for report, data in batch:
+                while len(pending) >= window:
+                    for chunk in await finished(block=True):
+                        yield chunk
+                task = asyncio.ensure_future(docx_pool.render(generate_report_docx, data, wait=True))
+                pending[task] = (_entry_name(report, names), report)
+            for chunk in await finished(block=False):
+                yield chunk
+        while pending:
+            for chunk in await finished(block=True):
+                yield chunk
+        yield archive.close()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,168 @@
+"""
+In-process periodic task scheduler.
+
+Every API process runs the scheduler loop, but only the one holding the
+MySQL named lock (GET_LOCK) executes tasks. The lock belongs to a dedicated
+connection, so if the leader dies MySQL releases it and another process
+takes over on its next tick.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import text
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = "deptsync_scheduler"
+
+
+@dataclass
+class ScheduledTask:
+    name: str
+    interval: float  # Seconds between runs
+    func: Callable[[], Awaitable[object]]
+    last_run: float = field(default=0.0)
+
+
+_tasks: Dict[str, ScheduledTask] = {}
+
+
+def scheduled(name: str, interval: float):
+    """Register an async function to run every `interval` seconds on the leader."""
+    def decorator(func: Callable[[], Awaitable[object]]):
+        _tasks[name] = ScheduledTask(name, interval, func)
+        return func
+    return decorator
+
+
+class LeaderLock:
+    """MySQL named lock held on a dedicated connection."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._conn = None
+
+    def try_acquire(self) -> bool:
+        if self._conn is not None:
+            try:
+                # Still leader as long as our connection is alive
+                self._conn.execute(text("SELECT 1"))
+                return True
+            except Exception as e:
+                logger.warning(f"Scheduler lost leader connection: {e}")
+                self._discard()
+        conn = engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": self.name}).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if acquired == 1:
+            self._conn = conn
+            logger.info("✓ Scheduler leadership acquired")
+            return True
+        conn.close()
+        return False
+
+    def release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": self.name})
+        except Exception:
+            pass
+        self._discard()
+
+    def _discard(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+class Scheduler:
+    def __init__(self, tick: float):
+        self.tick = tick
+        self.lock = LeaderLock(LOCK_NAME)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop(), name="scheduler")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.lock.release)
+
+    async def _loop(self):
+        while True:
+            try:
+                if await asyncio.to_thread(self.lock.try_acquire):
+                    await self._run_due_tasks()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler tick failed: {e}")
+            await asyncio.sleep(self.tick)
+
+    async def _run_due_tasks(self):
+        now = time.monotonic()
+        due: List[ScheduledTask] = [t for t in _tasks.values() if now - t.last_run >= t.interval]
+        for task in due:
+            task.last_run = now
+            try:
+                await task.func()
+            except Exception as e:
+                logger.error(f"Scheduled task {task.name} failed: {e}")
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def start_scheduler():
+    global _scheduler
+    if _scheduler is None and settings.SCHEDULER_ENABLED:
+        _scheduler = Scheduler(settings.SCHEDULER_TICK_SECONDS)
+        _scheduler.start()
+
+
+async def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
+
+
+# --- Tasks ---
+
+@scheduled("personal_report_drafts", 300)
+async def _queue_personal_report_drafts():
+    from .personal_drafts import enqueue_weekly_drafts
+    await asyncio.to_thread(enqueue_weekly_drafts)
+
+
+@scheduled("upload_session_cleanup", 600)
+async def _cleanup_upload_sessions():
+    from .upload_sessions import cleanup_expired_sessions
+    await cleanup_expired_sessions()
+
+
+@scheduled("attachment_index_backfill", 6 * 3600)
+async def _backfill_attachment_index():
+    from .attachments import backfill_index
+    await asyncio.to_thread(backfill_index)
+
+
+@scheduled("storage_gc", settings.STORAGE_GC_INTERVAL_HOURS * 3600)
+async def _collect_storage_garbage():
+    if not settings.STORAGE_GC_ENABLED:
+        return
+    from . import storage_gc
+    await storage_gc.run(dry_run=settings.STORAGE_GC_DRY_RUN)
@@ -0,0 +1,155 @@
+"""
+Async object storage layer.
+
+The minio client is synchronous, so every call from an async route runs on
+a dedicated thread pool (MINIO_MAX_WORKERS threads) instead of blocking the
+event loop. File routes use this module rather than minio_service directly.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, Optional, Tuple, TypeVar
+from ..config import settings
+from . import minio_service
+from .minio_service import FileTooLargeError, safe_filename  # noqa: F401  (re-exported for routers and services)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# minio's urllib3 pool keeps 10 connections per host, so more threads would only queue on it
+_executor = ThreadPoolExecutor(max_workers=max(1, settings.MINIO_MAX_WORKERS), thread_name_prefix="storage")
+
+
+async def _run(func: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def ensure_bucket():
+    await _run(minio_service.ensure_bucket)
+
+
+async def upload_file(
+    stream: BinaryIO,
+    original_filename: str,
+    content_type: str = "application/octet-stream",
+    folder: str = "uploads",
+    max_size: Optional[int] = None,
+    object_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Stream a file into MinIO; see minio_service.upload_file."""
+    return await _run(
+        minio_service.upload_file, stream, original_filename, content_type, folder, max_size, object_name
+    )
+
+
+def _hash_stream(stream: BinaryIO, max_size: Optional[int]) -> Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := stream.read(1024 * 1024):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise FileTooLargeError(max_size)
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+async def hash_stream(stream: BinaryIO, max_size: Optional[int] = None) -> Tuple[str, int]:
+    """
+    SHA-256 and size of a local (spooled) file, read in chunks, then rewound.
+
+    Lets uploads look up existing content before writing anything to MinIO.
+    """
+    return await _run(_hash_stream, stream, max_size)
+
+
+async def upload_bytes(object_name: str, data: bytes, content_type: str):
+    await _run(minio_service.upload_bytes, object_name, data, content_type)
+
+
+async def read_file(object_name: str) -> bytes:
+    return await _run(minio_service.read_file, object_name)
+
+
+async def delete_file(object_name: str):
+    await _run(minio_service.delete_file, object_name)
+
+
+class ObjectStream:
+    """
+    An open MinIO object read in chunks on the storage pool.
+
+    The HTTP connection goes back to minio's pool when iteration finishes,
+    fails or is cancelled (client disconnect), or on aclose().
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self._closed = False
+
+    async def iter_chunks(self, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                chunk = await _run(self._response.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await _run(self._release)
+        except Exception as e:
+            logger.warning(f"Failed to release MinIO connection: {e}")
+
+    def _release(self):
+        self._response.close()
+        self._response.release_conn()
+
+
+async def stat_object(object_name: str):
+    return await _run(minio_service.stat_file, object_name)
+
+
+async def open_object(object_name: str, offset: int = 0, length: int = 0) -> ObjectStream:
+    """
+    Open an object (or the byte range offset..offset+length) for streaming.
+
+    Raises S3Error (e.g. NoSuchKey) before any bytes are sent.
+    """
+    response = await _run(minio_service.get_file_stream, object_name, offset, length)
+    return ObjectStream(response)
+
+
+async def download_file(object_name: str, path: str):
+    await _run(minio_service.download_file, object_name, path)
+
+
+async def presigned_url(object_name: str, expires_seconds: int) -> str:
+    return await _run(minio_service.presigned_url, object_name, expires_seconds)
+
+
+async def create_multipart_upload(object_name: str, content_type: str) -> str:
+    return await _run(minio_service.create_multipart_upload, object_name, content_type)
+
+
+async def upload_part(object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+    return await _run(minio_service.upload_part, object_name, upload_id, part_number, data)
+
+
+async def complete_multipart_upload(object_name: str, upload_id: str, parts):
+    await _run(minio_service.complete_multipart_upload, object_name, upload_id, parts)
+
+
+async def abort_multipart_upload(object_name: str, upload_id: str):
+    await _run(minio_service.abort_multipart_upload, object_name, upload_id)
@@ -0,0 +1,213 @@
+"""
+Garbage collection of unreferenced bucket objects.
+
+Deleting events or reports only drops their Attachment rows, and uploads
+that are never saved with an event or report keep an unattached row. A run
+walks the bucket listing in pages of OBJECT_BATCH keys and checks each page
+against the attachments table, so memory stays bounded by the page size.
+
+An object counts as referenced while an attached row points at it, or an
+unattached row younger than the grace period (an upload still being
+edited). Derivatives (_derived/...) follow their source object. An
+unreferenced object is first marked (orphan_marks) and deleted, with
+remove_objects in batches, only once its mark is older than
+STORAGE_GC_GRACE_DAYS; a reference showing up again clears the mark.
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.report import Attachment
+from ..models.storage_gc import OrphanMark
+from ..utils import now_beijing
+from . import attachments, minio_service, thumbnails
+
+logger = logging.getLogger(__name__)
+
+OBJECT_BATCH = 1000  # One listing page, and the most remove_objects accepts per request
+# Objects the application keeps without attachment references
+PROTECTED_PREFIXES = ("_templates/",)
+
+
+def _mark_id(object_name: str) -> str:
+    return hashlib.sha256(object_name.encode("utf-8")).hexdigest()
+
+
+def source_object(object_name: str) -> str:
+    """The object a derivative was rendered from; other objects are their own source."""
+    prefix = f"{thumbnails.DERIVED_PREFIX}/"
+    if object_name.startswith(prefix) and object_name.endswith(".webp"):
+        _, _, rest = object_name[len(prefix):].partition("/")
+        if rest:
+            return rest[:-len(".webp")]
+    return object_name
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _referenced(db: Session, names: Iterable[str], cutoff: datetime) -> set:
+    rows = (
+        db.query(Attachment.url)
+        .filter(
+            Attachment.url.in_(set(names)),
+            or_(Attachment.entity_id.isnot(None), Attachment.created_at >= cutoff),
+        )
+        .distinct()
+        .all()
+    )
+    return {url for url, in rows}
+
+
+def collect_garbage(
+    dry_run: bool = False,
+    on_deleted: Optional[Callable[[List[str]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Run one GC pass. With dry_run nothing is marked or deleted; the report
+    then shows what is unreferenced and what a real run would delete.
+    """
+    started = now_beijing()
+    cutoff = started - timedelta(days=settings.STORAGE_GC_GRACE_DAYS)
+    report = {
+        "dry_run": dry_run,
+        "scanned": 0,
+        "scanned_bytes": 0,
+        "unreferenced": 0,
+        "unreferenced_bytes": 0,  # Reclaimable once the grace period has passed
+        "eligible": 0,
+        "eligible_bytes": 0,  # Past the grace period: deleted now (or would be, in a dry run)
+        "deleted": 0,
+        "deleted_bytes": 0,
+        "failed": 0,
+        "abandoned_uploads": 0,
+    }
+
+    if not dry_run:
+        # References saved before the attachment index existed must be indexed before anything is judged orphaned
+        attachments.backfill_index()
+
+    db = SessionLocal()
+    try:
+        objects = (o for o in minio_service.iter_objects() if not o.object_name.startswith(PROTECTED_PREFIXES))
+        for batch in _batched(objects, OBJECT_BATCH):
+            _collect_batch(db, batch, started, cutoff, dry_run, report, on_deleted)
+
+        abandoned = db.query(Attachment).filter(Attachment.entity_id.is_(None), Attachment.created_at < cutoff)
+        if dry_run:
+            report["abandoned_uploads"] = abandoned.count()
+        else:
+            report["abandoned_uploads"] = abandoned.delete(synchronize_session=False)
+            # Marks not refreshed by this run belong to objects that no longer exist
+            db.query(OrphanMark).filter(OrphanMark.last_seen < started).delete(synchronize_session=False)
+            db.commit()
+    finally:
+        db.close()
+
+    logger.info(
+        f"Storage GC{' (dry run)' if dry_run else ''}: scanned {report['scanned']} objects, "
+        f"{report['unreferenced']} unreferenced ({report['unreferenced_bytes']} bytes), "
+        f"{report['eligible']} past grace, deleted {report['deleted']} ({report['deleted_bytes']} bytes)"
+    )
+    return report
+
+
+def _collect_batch(
+    db: Session,
+    batch: List[Any],
+    started: datetime,
+    cutoff: datetime,
+    dry_run: bool,
+    report: Dict[str, Any],
+    on_deleted: Optional[Callable[[List[str]], None]],
+):
+    sources = {obj.object_name: source_object(obj.object_name) for obj in batch}
+    referenced = _referenced(db, sources.values(), cutoff)
+    ids = {obj.object_name: _mark_id(obj.object_name) for obj in batch}
+    marks = {m.id: m for m in db.query(OrphanMark).filter(OrphanMark.id.in_(ids.values())).all()}
+
+    cleared, seen, eligible = [], [], []
+    for obj in batch:
+        size = obj.size or 0
+        report["scanned"] += 1
+        report["scanned_bytes"] += size
+        mark = marks.get(ids[obj.object_name])
+        if sources[obj.object_name] in referenced:
+            if mark:
+                cleared.append(mark.id)
+            continue
+        report["unreferenced"] += 1
+        report["unreferenced_bytes"] += size
+        if mark is None:
+            if not dry_run:
+                db.add(OrphanMark(
+                    id=ids[obj.object_name], object_name=obj.object_name, size=size,
+                    first_seen=started, last_seen=started,
+                ))
+        elif mark.first_seen < cutoff:
+            eligible.append(obj)
+        else:
+            seen.append(mark.id)
+    report["eligible"] += len(eligible)
+    report["eligible_bytes"] += sum(obj.size or 0 for obj in eligible)
+    if dry_run:
+        return
+
+    if cleared:
+        db.query(OrphanMark).filter(OrphanMark.id.in_(cleared)).delete(synchronize_session=False)
+    if seen:
+        db.query(OrphanMark).filter(OrphanMark.id.in_(seen)).update(
+            {OrphanMark.last_seen: started}, synchronize_session=False
+        )
+    db.commit()
+    if eligible:
+        # An upload deduplicated onto one of these objects since the check above keeps it.
+        # The commit above starts a new transaction, so this read sees rows added meanwhile.
+        revived = _referenced(db, (sources[obj.object_name] for obj in eligible), cutoff)
+        eligible = [obj for obj in eligible if sources[obj.object_name] not in revived]
+    if eligible:
+        failed = set(minio_service.remove_objects(obj.object_name for obj in eligible))
+        deleted = [obj for obj in eligible if obj.object_name not in failed]
+        report["failed"] += len(failed)
+        report["deleted"] += len(deleted)
+        report["deleted_bytes"] += sum(obj.size or 0 for obj in deleted)
+        if deleted:
+            db.query(OrphanMark).filter(
+                OrphanMark.id.in_([ids[obj.object_name] for obj in deleted])
+            ).delete(synchronize_session=False)
+            if on_deleted:
+                on_deleted([obj.object_name for obj in deleted])
+        if failed:
+            # Keep their marks current so the next run retries them
+            db.query(OrphanMark).filter(
+                OrphanMark.id.in_([ids[name] for name in failed])
+            ).update({OrphanMark.last_seen: started}, synchronize_session=False)
+    db.commit()
+
+
+def _forget(object_names: List[str]):
+    """Drop deleted objects from this process's caches (runs on the event loop)."""
+    from . import file_cache
+    for name in object_names:
+        if file_cache.cache:
+            file_cache.cache.invalidate(name)
+        thumbnails.forget(name)
+
+
+async def run(dry_run: bool = False) -> Dict[str, Any]:
+    """Run collect_garbage in a thread, invalidating local caches for deleted objects."""
+    loop = asyncio.get_running_loop()
+
+    def on_deleted(object_names: List[str]):
+        loop.call_soon_threadsafe(_forget, object_names)
+
+    return await asyncio.to_thread(collect_garbage, dry_run, on_deleted)
@@ -0,0 +1,133 @@
+"""
+Image derivatives: thumbnails and web-sized previews.
+
+A derivative is generated the first time `?size=` asks for it, and in the
+background right after an image upload. It is stored in MinIO under
+`_derived/{size}/{object_name}.webp` and then served like any other object.
+Resizing runs on its own small thread pool (THUMBNAIL_WORKERS), so a burst of
+new photos cannot starve the storage pool or the event loop.
+
+Sources larger than UPLOAD_MAX_SIZE_MB or THUMBNAIL_MAX_PIXELS are not
+resized (the caller serves the original): upload sessions accept much larger
+files, and the type is only guessed from the extension.
+"""
+import asyncio
+import logging
+import mimetypes
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Set
+from minio.error import S3Error
+from PIL import Image, ImageOps
+from ..config import settings
+from . import minio_service, storage
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels
+DERIVATIVE_SIZES = {"thumb": 320, "preview": 1280}
+RESIZABLE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp'}
+DERIVED_PREFIX = "_derived"
+
+_executor = ThreadPoolExecutor(max_workers=max(1, settings.THUMBNAIL_WORKERS), thread_name_prefix="thumbnails")
+_inflight: Dict[str, asyncio.Task] = {}
+# Derived keys known to exist, so repeated requests skip the stat call
+_known: "OrderedDict[str, None]" = OrderedDict()
+_KNOWN_MAX = 4096
+_background: Set[asyncio.Task] = set()
+
+# Pillow refuses to open anything over twice this; _render checks the limit itself
+Image.MAX_IMAGE_PIXELS = settings.THUMBNAIL_MAX_PIXELS
+
+
+class SourceTooLargeError(ValueError):
+    """The source image is too large to resize in memory."""
+
+
+def derived_key(object_name: str, size: str) -> str:
+    return f"{DERIVED_PREFIX}/{size}/{object_name}.webp"
+
+
+def is_resizable(object_name: str) -> bool:
+    return mimetypes.guess_type(object_name)[0] in RESIZABLE_TYPES
+
+
+def _render(data: bytes, max_px: int) -> bytes:
+    with Image.open(BytesIO(data)) as img:
+        if img.width * img.height > settings.THUMBNAIL_MAX_PIXELS:
+            raise SourceTooLargeError(f"{img.width}x{img.height} exceeds THUMBNAIL_MAX_PIXELS")
+        img.draft("RGB", (max_px, max_px))  # JPEG: decode at a reduced scale, much faster for phone photos
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+        if img.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in img.getbands() or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+        out = BytesIO()
+        img.save(out, "WEBP", quality=80, method=4)
+        return out.getvalue()
+
+
+def _generate(object_name: str, size: str, key: str):
+    # read_file loads the whole object, so check its size before reading it
+    source_size = minio_service.stat_file(object_name).size
+    if source_size > settings.UPLOAD_MAX_SIZE_MB * 1024 * 1024:
+        raise SourceTooLargeError(f"{source_size} bytes exceeds UPLOAD_MAX_SIZE_MB")
+    data = minio_service.read_file(object_name)
+    minio_service.upload_bytes(key, _render(data, DERIVATIVE_SIZES[size]), "image/webp")
+    logger.info(f"✓ Generated {size} derivative for '{object_name}'")
+
+
+def _remember(key: str):
+    _known[key] = None
+    _known.move_to_end(key)
+    while len(_known) > _KNOWN_MAX:
+        _known.popitem(last=False)
+
+
+async def _ensure(object_name: str, size: str, key: str):
+    try:
+        await storage.stat_object(key)
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_executor, _generate, object_name, size, key)
+    _remember(key)
+
+
+async def ensure_derivative(object_name: str, size: str) -> str:
+    """Object name of the `size` derivative, generating it once if it doesn't exist yet."""
+    key = derived_key(object_name, size)
+    if key in _known:
+        _known.move_to_end(key)
+        return key
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_ensure(object_name, size, key))
+        _inflight[key] = task
+        task.add_done_callback(lambda t, k=key: _inflight.pop(k, None))
+    # Shield so one client disconnecting doesn't abort generation for the others
+    await asyncio.shield(task)
+    return key
+
+
+def forget(object_name: str):
+    """Drop a deleted object (a derivative itself, or its source) from the known-derivatives cache."""
+    _known.pop(object_name, None)
+    for size in DERIVATIVE_SIZES:
+        _known.pop(derived_key(object_name, size), None)
+
+
+def schedule_derivatives(object_name: str):
+    """Generate every derivative of a freshly uploaded image in the background."""
+    async def run(size: str):
+        try:
+            await ensure_derivative(object_name, size)
+        except Exception as e:
+            logger.warning(f"Failed to generate {size} derivative for '{object_name}': {e}")
+
+    for size in DERIVATIVE_SIZES:
+        task = asyncio.ensure_future(run(size))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
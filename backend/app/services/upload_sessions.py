@@ -0,0 +1,230 @@
+"""
+Resumable chunked uploads.
+
+A session maps onto one MinIO multipart upload. The client PUTs numbered
+chunks in any order, several at a time, and can re-send any of them after
+an interruption. Received parts are tracked in upload_session_parts, so a
+client can ask which ones are missing and resume. Completing the session
+assembles the object and records an Attachment reference. The scheduler
+aborts sessions left idle past UPLOAD_SESSION_TTL_HOURS.
+
+Completion locks the session row, so concurrent or repeated completes of
+one session assemble it once and all return the same attachment.
+"""
+import asyncio
+import logging
+import math
+import uuid
+from datetime import timedelta
+from typing import List, Tuple
+from minio.error import S3Error
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.report import Attachment
+from ..models.upload_session import UploadSession, UploadSessionPart, UploadSessionStatus
+from ..utils import now_beijing
+from . import attachments, minio_service, storage, thumbnails
+
+logger = logging.getLogger(__name__)
+
+
+def part_count(session: UploadSession) -> int:
+    return max(1, math.ceil(session.size / session.chunk_size))
+
+
+def expected_part_size(session: UploadSession, part_number: int) -> int:
+    """Every part is chunk_size bytes except the last, which holds the remainder."""
+    if part_number < part_count(session):
+        return session.chunk_size
+    return session.size - session.chunk_size * (part_count(session) - 1)
+
+
+def uploaded_parts(db: Session, session_id: str) -> List[UploadSessionPart]:
+    return (
+        db.query(UploadSessionPart)
+        .filter(UploadSessionPart.session_id == session_id)
+        .order_by(UploadSessionPart.part_number)
+        .all()
+    )
+
+
+async def create_session(
+    db: Session,
+    owner_id: str,
+    filename: str,
+    content_type: str,
+    folder: str,
+    size: int
+) -> UploadSession:
+    now = now_beijing()
+    session_id = str(uuid.uuid4())
+    safe_name = storage.safe_filename(filename)
+    session = UploadSession(
+        id=session_id,
+        owner_id=owner_id,
+        filename=filename,
+        content_type=content_type,
+        folder=folder,
+        object_name=f"{folder}/{session_id.replace('-', '')[:12]}_{safe_name}",
+        size=size,
+        chunk_size=max(5, settings.UPLOAD_CHUNK_SIZE_MB) * 1024 * 1024,
+        status=UploadSessionStatus.ACTIVE,
+        created_at=now,
+        updated_at=now,
+        expires_at=now + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS),
+    )
+    session.upload_id = await storage.create_multipart_upload(session.object_name, content_type)
+    db.add(session)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        await storage.abort_multipart_upload(session.object_name, session.upload_id)
+        raise
+    return session
+
+
+async def store_part(db: Session, session: UploadSession, part_number: int, data: bytes) -> str:
+    """Upload one part (again, if it was sent before) and record it. Returns the ETag."""
+    etag = await storage.upload_part(session.object_name, session.upload_id, part_number, data)
+    now = now_beijing()
+    db.execute(
+        mysql_insert(UploadSessionPart.__table__)
+        .values(
+            id=str(uuid.uuid4()),
+            session_id=session.id,
+            part_number=part_number,
+            etag=etag,
+            size=len(data),
+            uploaded_at=now,
+        )
+        .on_duplicate_key_update(etag=etag, size=len(data), uploaded_at=now)
+    )
+    # Sliding expiry: a session is abandoned only once it stops receiving parts
+    session.updated_at = now
+    session.expires_at = now + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    db.commit()
+    return etag
+
+
+def missing_parts(db: Session, session: UploadSession) -> List[int]:
+    received = {p.part_number for p in uploaded_parts(db, session.id)}
+    return [n for n in range(1, part_count(session) + 1) if n not in received]
+
+
+def _assembled(session: UploadSession) -> bool:
+    """Whether the session's object already exists with the expected size."""
+    try:
+        return minio_service.stat_file(session.object_name).size == session.size
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            return False
+        raise
+
+
+def _complete_locked(session_id: str) -> Tuple[str, bool]:
+    """
+    Assemble the session's object under a row lock on the session and record
+    its Attachment in the same transaction as the COMPLETED status.
+
+    Returns (attachment id, whether this call completed it). A session that
+    is already completed returns its existing attachment.
+    """
+    db = SessionLocal()
+    try:
+        session = db.query(UploadSession).filter(UploadSession.id == session_id).with_for_update().one()
+        if session.status == UploadSessionStatus.COMPLETED:
+            existing = (
+                db.query(Attachment)
+                .filter(Attachment.url == session.object_name)
+                .order_by(Attachment.created_at)
+                .first()
+            )
+            if existing:
+                return existing.id, False
+            raise ValueError("上传会话已完成，但找不到对应的文件记录")
+        if session.status != UploadSessionStatus.ACTIVE:
+            raise ValueError(f"上传会话已{'中止' if session.status == UploadSessionStatus.ABORTED else '关闭'}")
+        # A previous complete may have assembled the object and then failed to commit;
+        # its upload id is gone, so only the DB transition is left to do
+        if not _assembled(session):
+            missing = missing_parts(db, session)
+            if missing:
+                raise ValueError(f"缺少分片: {missing[:20]}")
+            parts = [(p.part_number, p.etag) for p in uploaded_parts(db, session.id)]
+            minio_service.complete_multipart_upload(session.object_name, session.upload_id, parts)
+
+        session.status = UploadSessionStatus.COMPLETED
+        session.updated_at = now_beijing()
+        db.query(UploadSessionPart).filter(UploadSessionPart.session_id == session.id).delete()
+        # Parts arrive in parallel, so there is no streaming hash to deduplicate on.
+        # add_reference commits, releasing the lock together with the status change.
+        attachment = attachments.add_reference(
+            db, session.object_name, session.filename, None, session.size,
+            session.content_type, session.folder, session.owner_id
+        )
+        return attachment.id, True
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def complete_session(db: Session, session: UploadSession) -> Attachment:
+    """
+    Assemble the object and record it as an attachment; idempotent. Raises
+    ValueError if parts are missing or the session was aborted.
+    """
+    # In a thread with its own DB session: a concurrent complete waits on the row lock there, not on the event loop
+    attachment_id, completed = await asyncio.to_thread(_complete_locked, session.id)
+    if completed and session.content_type in thumbnails.RESIZABLE_TYPES:
+        thumbnails.schedule_derivatives(session.object_name)
+    db.expire(session)
+    return db.query(Attachment).filter(Attachment.id == attachment_id).one()
+
+
+async def abort_session(db: Session, session: UploadSession):
+    try:
+        await storage.abort_multipart_upload(session.object_name, session.upload_id)
+    except Exception as e:
+        # Already gone upstream (e.g. expired by a bucket lifecycle rule); still close the session
+        logger.warning(f"Abort of multipart upload for session {session.id} failed: {e}")
+    session.status = UploadSessionStatus.ABORTED
+    session.updated_at = now_beijing()
+    db.query(UploadSessionPart).filter(UploadSessionPart.session_id == session.id).delete()
+    db.commit()
+
+
+async def cleanup_expired_sessions() -> int:
+    """Abort active sessions past their expiry. Returns the number cleaned up."""
+    def load_expired():
+        db = SessionLocal()
+        try:
+            return [
+                s.id for s in db.query(UploadSession.id).filter(
+                    UploadSession.status == UploadSessionStatus.ACTIVE,
+                    UploadSession.expires_at < now_beijing(),
+                ).all()
+            ]
+        finally:
+            db.close()
+
+    cleaned = 0
+    for session_id in await asyncio.to_thread(load_expired):
+        db = SessionLocal()
+        try:
+            session = db.query(UploadSession).filter(
+                UploadSession.id == session_id,
+                UploadSession.status == UploadSessionStatus.ACTIVE,
+            ).first()
+            if session and session.expires_at < now_beijing():
+                await abort_session(db, session)
+                cleaned += 1
+        finally:
+            db.close()
+    if cleaned:
+        logger.info(f"Aborted {cleaned} abandoned upload sessions")
+    return cleaned
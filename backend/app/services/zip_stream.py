@@ -0,0 +1,60 @@
+"""
+ZIP archives written as a stream.
+
+zipfile can write to an output that cannot seek: each entry's sizes and CRC
+go in a data descriptor after its data instead of being patched into the
+local header. ZipStream uses that to hand back the bytes of every entry as
+soon as it is added, so an archive can be sent while later entries are still
+being produced, and only the entry being added is held in memory.
+"""
+import zipfile
+from datetime import datetime
+from typing import List, Optional
+
+
+class _Sink:
+    """Write-only, unseekable output collecting what zipfile writes until drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", zipfile.ZIP_STORED)
+
+    def add(
+        self,
+        name: str,
+        data: bytes,
+        modified: Optional[datetime] = None,
+        compress_type: int = zipfile.ZIP_STORED,
+    ) -> bytes:
+        """
+        Add an entry and return the archive bytes it produced.
+
+        Entries are stored uncompressed by default: .docx files are already
+        ZIP-compressed, so deflating them again costs CPU for nothing.
+        """
+        info = zipfile.ZipInfo(name, (modified or datetime.now()).timetuple()[:6])
+        info.compress_type = compress_type
+        self._zip.writestr(info, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Finish the archive and return the central directory bytes."""
+        self._zip.close()
+        return self._sink.drain()
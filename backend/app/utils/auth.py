@@ -12,6 +12,9 @@ from ..models.user import User
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Scope of tokens that may only read files; API access tokens carry no scope
+FILE_SCOPE = "files"
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -28,6 +31,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+def create_file_token(user_id: str) -> str:
+    """Short-lived token that only grants reading files, sent as the file session cookie."""
+    return create_access_token(
+        data={"sub": user_id, "scope": FILE_SCOPE},
+        expires_delta=timedelta(minutes=settings.FILE_SESSION_MINUTES),
+    )
+
+
 def decode_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -46,7 +57,8 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     payload = decode_token(token)
-    if payload is None:
+    # Scoped tokens (the file session cookie) are not API credentials
+    if payload is None or payload.get("scope") is not None:
         raise credentials_exception
     user_id: str = payload.get("sub")
     if user_id is None:
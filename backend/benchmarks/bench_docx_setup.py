@@ -0,0 +1,70 @@
+"""
+Micro-benchmark for the per-document setup cost of DOCX exports.
+
+Compares creating a document the old way (Document() and restyling the
+Normal and Heading styles) with opening the prebuilt template, and the full
+cost of a small export on top of each. Runs in-process; no server needed.
+
+Usage:
+    python -m benchmarks.bench_docx_setup --iterations 500
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+from docx import Document
+from app.services import docx_service
+
+
+def _old_setup():
+    doc = Document()
+    docx_service._set_default_font(doc)
+    return doc
+
+
+def _timed(func: Callable[[], Any], iterations: int) -> List[float]:
+    func()  # Warm up (imports, template build)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 3),
+    }
+
+
+def _small_export(setup: Callable[[], Any]) -> Callable[[], Any]:
+    def run():
+        doc = setup()
+        doc.add_heading("周报 - 基准测试", 0)
+        docx_service.add_markdown_content(doc, "## 本周进展\n- **完成** 接口联调\n- 修复若干问题")
+        docx_service._save_doc(doc)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-document DOCX setup cost")
+    parser.add_argument("--iterations", type=int, default=300)
+    args = parser.parse_args()
+
+    results = {
+        "iterations": args.iterations,
+        "setup_restyle": _summary(_timed(_old_setup, args.iterations)),
+        "setup_template": _summary(_timed(docx_service.new_document, args.iterations)),
+        "small_export_restyle": _summary(_timed(_small_export(_old_setup), args.iterations)),
+        "small_export_template": _summary(_timed(_small_export(docx_service.new_document), args.iterations)),
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
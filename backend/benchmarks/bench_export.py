@@ -0,0 +1,151 @@
+"""
+API responsiveness benchmark for DOCX exports.
+
+Seeds a project with many timeline events, then runs large timeline exports
+at a fixed concurrency while a probe requests a cheap endpoint every few
+milliseconds. Reports probe latency before (baseline) and during the
+exports, and export latency. With rendering on the event loop the probe
+latency during exports rises to whole render times; with the render process
+pool it should stay close to the baseline.
+
+Usage:
+    uvicorn app.main:app --port 8000 &
+    python -m benchmarks.bench_export --events 2000 --concurrency 4 --exports 12
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+import httpx
+from .bench_llm import percentile
+
+
+async def seed_project(client: httpx.AsyncClient, user_id: str, events: int) -> str:
+    resp = await client.post("/api/projects", json={
+        "title": f"导出基准测试 {int(time.time())}",
+        "start_date": "2026-01-01",
+        "manager_id": user_id,
+        "description": "benchmark",
+    })
+    resp.raise_for_status()
+    project_id = resp.json()["id"]
+
+    semaphore = asyncio.Semaphore(16)
+
+    async def add(k: int):
+        async with semaphore:
+            r = await client.post("/api/events", json={
+                "project_id": project_id,
+                "author_id": user_id,
+                "author_name": "bench",
+                "type": "UPDATE",
+                "content": (f"## 第 {k} 次进展\n- **完成** 接口联调与测试\n- 修复若干问题\n"
+                            "本周继续推进部署上线工作，协调客户验收。\n") * 3,
+            })
+            r.raise_for_status()
+
+    await asyncio.gather(*(add(k) for k in range(events)))
+    return project_id
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> List[float]:
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/api/health")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1) if values else 0.0,
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=httpx.Timeout(args.timeout)) as client:
+        resp = await client.post("/api/auth/login", json={"job_number": args.job_number, "password": args.password})
+        resp.raise_for_status()
+        login = resp.json()
+        client.headers["Authorization"] = f"Bearer {login['access_token']}"
+        project_id = args.project_id or await seed_project(client, login["user_id"], args.events)
+
+        stop = asyncio.Event()
+        baseline_task = asyncio.create_task(probe(client, stop, args.probe_interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await baseline_task
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.exports):
+            queue.put_nowait(i)
+        exports: List[Dict[str, Any]] = []
+
+        async def worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                resp = await client.post(f"/api/projects/{project_id}/timeline/export", json=[])
+                exports.append({
+                    "status": resp.status_code,
+                    "latency": time.perf_counter() - started,
+                    "bytes": len(resp.content),
+                })
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, stop, args.probe_interval))
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        during = await probe_task
+
+    ok = [e for e in exports if e["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for e in exports:
+        statuses[str(e["status"])] = statuses.get(str(e["status"]), 0) + 1
+    return {
+        "project_id": project_id,
+        "concurrency": args.concurrency,
+        "exports": len(exports),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "export_latency_s": {
+            "p50": round(percentile([e["latency"] for e in ok], 0.50), 3),
+            "p95": round(percentile([e["latency"] for e in ok], 0.95), 3),
+        },
+        "docx_bytes": ok[0]["bytes"] if ok else 0,
+        "probe_baseline": _summary(baseline),
+        "probe_during_exports": _summary(during),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API latency while large DOCX exports run")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--job-number", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--project-id", help="export an existing project instead of seeding one")
+    parser.add_argument("--events", type=int, default=2000, help="events to seed in the benchmark project")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--exports", type=int, default=12)
+    parser.add_argument("--probe-interval", type=float, default=0.02, help="seconds between probe requests")
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Latency/throughput benchmark for the /api/llm/* endpoints.
+
+Drives a running backend at a fixed concurrency and reports p50/p95/p99
+latency and throughput, and for the SSE endpoint (personal-report/stream)
+time to the first generated field. Run it against
+benchmarks/mock_llm_server.py to measure LLM path changes offline.
+
+The services turn upstream failures into 200 responses carrying error text,
+so responses are checked for those payloads and counted as errors.
+
+Usage:
+    python -m benchmarks.mock_llm_server --latency 0.5 &
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1 OPENAI_API_KEY=mock uvicorn app.main:app &
+    python -m benchmarks.bench_llm --endpoint project-report --concurrency 16 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+import httpx
+
+
+def _project(i: int) -> Dict[str, Any]:
+    return {
+        "id": f"bench-project-{i}",
+        "title": f"基准测试项目 {i}",
+        "status": "EXECUTION",
+        "description": "benchmark",
+        "customer_name": "内部",
+    }
+
+
+def _events(project_id: str, n: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "project_id": project_id,
+            "date": f"2026-01-{(k % 28) + 1:02d}T10:00:00",
+            "type": "UPDATE",
+            "author_name": "bench",
+            "content": f"完成第 {k} 项工作，推进接口联调与测试。",
+        }
+        for k in range(n)
+    ]
+
+
+def build_payload(endpoint: str, projects: int, events: int, unique: Optional[int]) -> Dict[str, Any]:
+    """Request body for an endpoint. `unique` makes prompts distinct so they are not coalesced."""
+    tag = f" #{unique}" if unique is not None else ""
+    if endpoint == "project-report":
+        p = _project(0)
+        p["title"] += tag
+        return {"project": p, "events": _events(p["id"], events), "tasks": [],
+                "start_date": "2026-01-01", "end_date": "2026-01-31"}
+    if endpoint in ("dept-monthly-report", "dept-monthly-report-hierarchical"):
+        ps = [_project(i) for i in range(projects)]
+        ps[0]["title"] += tag
+        evs = [e for p in ps for e in _events(p["id"], events)]
+        body = {"projects": ps, "events": evs, "start_date": "2026-01-01", "end_date": "2026-01-31"}
+        if endpoint.endswith("hierarchical"):
+            body["mode"] = "hierarchical"
+        return body
+    if endpoint == "project-weekly-report":
+        p = _project(0)
+        p["title"] += tag
+        reports = [{"username": f"成员{k}", "content": "本周完成联调", "linked_project_ids": [p["id"]], "details": []}
+                   for k in range(events)]
+        return {"project": p, "personal_reports": reports, "week_range": "2026-01-05 至 2026-01-11"}
+    if endpoint in ("personal-report", "personal-report/stream"):
+        ps = [dict(_project(i), events=[{"content": e["content"]} for e in _events(f"p{i}", events)], tasks=[])
+              for i in range(projects)]
+        ps[0]["title"] += tag
+        return {"projects": ps, "inspirations": [], "refresh": True}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def _path(endpoint: str) -> str:
+    if endpoint == "dept-monthly-report-hierarchical":
+        return "/api/llm/dept-monthly-report"
+    return f"/api/llm/{endpoint}"
+
+
+async def login(client: httpx.AsyncClient, job_number: str, password: str) -> str:
+    resp = await client.post("/api/auth/login", json={"job_number": job_number, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+# Prefixes of the texts services/llm returns instead of raising
+ERROR_MARKERS = ("AI 服务暂时不可用", "AI 服务异常", "由于 API 错误", "生成失败", "缺少 API Key", "Mock Summary: No API Key")
+
+
+def _is_error_text(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(ERROR_MARKERS)
+
+
+def _payload_error(payload: Dict[str, Any]) -> bool:
+    """Whether a 200 response body carries a generation failure."""
+    if _is_error_text(payload.get("content")):
+        return True
+    data = payload.get("data")
+    return isinstance(data, dict) and _is_error_text(data.get("generalSummary"))
+
+
+async def _read_json(resp: httpx.Response) -> Dict[str, Any]:
+    return json.loads(await resp.aread())
+
+
+async def _read_sse(resp: httpx.Response, started: float) -> Dict[str, Any]:
+    """Consume the event stream, timing the first generated value; returns ttft and whether it failed."""
+    ttft, failed, done = None, False, None
+    event, buffer = "message", ""
+    async for line in resp.aiter_lines():
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: "):
+            buffer += line[6:]
+        elif not line and buffer:
+            if event in ("field", "summary") and ttft is None:
+                ttft = time.perf_counter() - started
+            elif event == "error":
+                failed = True
+            elif event == "done":
+                done = json.loads(buffer)
+            event, buffer = "message", ""
+    if done is None or _payload_error(done):
+        failed = True
+    return {"ttft": ttft, "failed": failed}
+
+
+async def one_request(client: httpx.AsyncClient, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    ttft = None
+    try:
+        async with client.stream("POST", path, json=body) as resp:
+            status = resp.status_code
+            if status != 200:
+                await resp.aread()
+                ok = False
+            elif path.endswith("/stream"):
+                result = await _read_sse(resp, started)
+                ttft, ok = result["ttft"], not result["failed"]
+            else:
+                ok = not _payload_error(await _read_json(resp))
+            if status == 200 and not ok:
+                status = "error_payload"
+    except (httpx.HTTPError, ValueError) as e:
+        ok, status = False, type(e).__name__
+    return {"ok": ok, "status": status, "latency": time.perf_counter() - started, "ttft": ttft}
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def run(args) -> Dict[str, Any]:
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+        token = await login(client, args.job_number, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+        path = _path(args.endpoint)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+        results: List[Dict[str, Any]] = []
+
+        async def worker():
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                body = build_payload(args.endpoint, args.projects, args.events, None if args.identical else i)
+                results.append(await one_request(client, path, body))
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+        metrics = None
+        resp = await client.get("/api/llm/metrics")
+        if resp.status_code == 200:
+            metrics = resp.json()
+
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+
+    return {
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "requests": len(results),
+        "succeeded": len(ok),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_s": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        },
+        # Time to the first generated field; only the SSE endpoint sends anything before it finishes
+        "ttft_s": {
+            "p50": round(percentile(ttfts, 0.50), 3),
+            "p95": round(percentile(ttfts, 0.95), 3),
+            "p99": round(percentile(ttfts, 0.99), 3),
+        } if ttfts else None,
+        "server_metrics": metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/llm/* endpoints")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--job-number", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--endpoint", default="project-report",
+                        choices=["project-report", "project-weekly-report", "dept-monthly-report",
+                                 "dept-monthly-report-hierarchical", "personal-report",
+                                 "personal-report/stream"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--projects", type=int, default=5, help="projects per request where applicable")
+    parser.add_argument("--events", type=int, default=20, help="events (or reports) per project")
+    parser.add_argument("--identical", action="store_true", help="send identical prompts to exercise coalescing")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
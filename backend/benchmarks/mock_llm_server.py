@@ -0,0 +1,158 @@
+"""
+OpenAI-compatible stub server for offline LLM benchmarks.
+
+Serves /v1/chat/completions (plain and streaming) and /v1/models with
+configurable latency, generation speed and error rate, so the services/llm
+paths can be measured without a live model.
+
+Usage:
+    python -m benchmarks.mock_llm_server --port 9100 --latency 0.5 --tokens-per-sec 40 --error-rate 0.02
+
+Then point the backend at it:
+    OPENAI_API_BASE=http://127.0.0.1:9100/v1 OPENAI_API_KEY=mock uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock LLM")
+
+config = {
+    "latency": 0.3,  # Seconds before the first token
+    "tokens_per_sec": 50.0,
+    "completion_tokens": 200,
+    "error_rate": 0.0,
+}
+
+# Personal reports are parsed as JSON, so reply with JSON when the prompt asks for it:
+# content and plan for every "Project ID:" in the prompt, then the summary, as the
+# personal_report prompt asks. Missing entries would make the backend retry per project.
+_PROJECT_ID = re.compile(r"Project ID: (\S+)")
+_TEXT_WORD = "进展"
+
+
+def _json_reply(prompt: str) -> dict:
+    reply = {
+        pid: {"content": "完成接口联调与测试，修复若干问题。", "plan": "推进部署上线，协调客户验收。"}
+        for pid in dict.fromkeys(_PROJECT_ID.findall(prompt))
+    }
+    reply["generalSummary"] = "本周整体推进顺利，完成了主要开发任务。"
+    return reply
+
+
+def _reply_tokens(messages) -> list:
+    prompt = " ".join(str(m.get("content", "")) for m in messages)
+    if "JSON" in prompt:
+        text = json.dumps(_json_reply(prompt), ensure_ascii=False)
+        # Roughly 4 characters per token
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    return [_TEXT_WORD] * config["completion_tokens"]
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(len(str(m.get("content", ""))) for m in messages) // 2
+
+
+def _error_response():
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"message": "mock upstream overloaded", "type": "server_error"}},
+    )
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "mock-model")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    await asyncio.sleep(config["latency"])
+    if random.random() < config["error_rate"]:
+        return _error_response()
+
+    tokens = _reply_tokens(messages)
+    prompt_tokens = _prompt_tokens(messages)
+    per_token = 1.0 / config["tokens_per_sec"] if config["tokens_per_sec"] > 0 else 0.0
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+    }
+
+    if not body.get("stream"):
+        await asyncio.sleep(per_token * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def event_stream():
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+        for token in tokens:
+            await asyncio.sleep(per_token)
+            yield f"data: {json.dumps(chunk({'content': token}), ensure_ascii=False)}\n\n"
+        yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+        if include_usage:
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": model, "choices": [], "usage": usage}
+            yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="seconds before first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"])
+    parser.add_argument("--completion-tokens", type=int, default=config["completion_tokens"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="0.0-1.0")
+    args = parser.parse_args()
+
+    config.update(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
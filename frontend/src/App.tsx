@@ -2,7 +2,7 @@ import React, { useState, useEffect, createContext, useContext } from 'react';
 import { HashRouter, Routes, Route, Navigate, useLocation, Link } from 'react-router-dom';
 import { LayoutDashboard, CheckSquare, Lightbulb, FileText, Settings, LogOut, Menu, X, ClipboardCheck, MonitorPlay } from 'lucide-react';
 import { User, UserRole } from './types';
-import { authApi, getToken, setToken, usersApi } from './services/api';
+import { authApi, getToken, setToken, usersApi, openFileSession } from './services/api';
 import { CONFIG } from './config';
 
 // Pages - lazy load
@@ -124,6 +124,8 @@ const App: React.FC = () => {
                     if (storedUser) {
                         setUser(JSON.parse(storedUser));
                     }
+                    // Attachments load through the file session cookie, so renew it before rendering
+                    await openFileSession().catch(e => console.error('File session failed:', e));
                 } catch {
                     setToken(null);
                 }
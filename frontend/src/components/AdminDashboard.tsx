@@ -2,10 +2,16 @@ import React, { useState, useEffect, useMemo } from 'react';
 import { useAuth } from '../App';
 import ReactMarkdown from 'react-markdown';
 import { UserRole, User, WeeklyReport, Project, TaskAssignment, Attachment } from '../types';
-import { usersApi, reportsApi, projectsApi, tasksApi, eventsApi, llmApi } from '../services/api';
+import { usersApi, reportsApi, projectsApi, tasksApi, eventsApi, llmApi, fileUrl } from '../services/api';
 import { useFetchWithCache } from '../hooks/useFetchWithCache';
 import { Shield, Users, FileText, Search, Download, Square, CheckSquare, BarChart3, PieChart, Sparkles, Loader2, LayoutDashboard, Edit2, Key, CheckCircle, AlertCircle, TrendingUp, Filter, Trello, Calendar, X, File, Paperclip, MonitorPlay } from 'lucide-react';
 
+const isImage = (url: string) => {
+    if (url.startsWith('data:image')) return true;
+    const ext = url.split('?')[0].split('.').pop()?.toLowerCase() || '';
+    return ['jpg', 'jpeg', 'png', 'gif', 'webp', 'svg', 'bmp', 'ico'].includes(ext);
+};
+
 const AdminDashboard: React.FC = () => {
     const { user: currentUser } = useAuth();
     const fetchDashboardData = async () => {
@@ -647,12 +653,12 @@ const AdminDashboard: React.FC = () => {
                                         <h4 className="text-xs font-bold text-slate-500 uppercase tracking-wider mb-3">附件</h4>
                                         <div className="flex flex-wrap gap-3">
                                             {viewingReport.attachments.map((att, i) => (
-                                                att.url.startsWith('data:image') ? (
+                                                isImage(att.url) ? (
                                                     <div key={i} className="w-32 h-32 border rounded-lg overflow-hidden bg-slate-50">
-                                                        <img src={att.url} className="w-full h-full object-cover" />
+                                                        <img src={fileUrl(att.url, 'thumb')} className="w-full h-full object-cover" />
                                                     </div>
                                                 ) : (
-                                                    <a key={i} href={att.url} download={att.name} className="flex items-center gap-2 px-3 py-2 bg-slate-50 border rounded text-xs hover:bg-slate-100">
+                                                    <a key={i} href={fileUrl(att.url)} download={att.name} className="flex items-center gap-2 px-3 py-2 bg-slate-50 border rounded text-xs hover:bg-slate-100">
                                                         <File size={14} /> {att.name}
                                                     </a>
                                                 )
@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import ReactMarkdown from 'react-markdown';
 import { Plus, FileText, Sparkles, Check, Loader2, Download, Briefcase, RefreshCw, Paperclip, X, Image as ImageIcon, File, Trash2 } from 'lucide-react';
 import { WeeklyReport, Project, Inspiration, WeeklyReportItem, Attachment } from '../types';
-import { reportsApi, projectsApi, eventsApi, inspirationsApi, tasksApi, llmApi, filesApi } from '../services/api';
+import { reportsApi, projectsApi, eventsApi, inspirationsApi, tasksApi, llmApi, filesApi, fileUrl } from '../services/api';
 import { useAuth } from '../App';
 import { useFetchWithCache } from '../hooks/useFetchWithCache';
 import { getBeijingISOString, formatToBeijingTime, formatBeijingDate } from '../utils/timeUtils';
@@ -36,6 +36,8 @@ const PersonalReports: React.FC = () => {
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const [isGenerating, setIsGenerating] = useState(false);
+  // Set when the last generation was served from the pre-generated draft
+  const [draftCreatedAt, setDraftCreatedAt] = useState<string | null>(null);
 
   // Data Fetching Hook
   const { data: cachedData, loading, refetch: refreshData } = useFetchWithCache(
@@ -110,9 +112,27 @@ const PersonalReports: React.FC = () => {
     }
   };
 
-  const handleSmartGenerate = async () => {
+  const startCreating = async () => {
+    setIsCreating(true);
+    if (selectedProjectIds.length > 0) return;
+    // Preselect what this week's pre-generated draft was made from, so generating returns it instantly
+    try {
+      const draft = await llmApi.getPersonalReportDraft();
+      if (!draft) return;
+      const projectIds: string[] = draft.projectIds.filter((id: string) => availableProjects.some(p => p.id === id));
+      if (projectIds.length === 0 || projectIds.length !== draft.projectIds.length) return;
+      setSelectedProjectIds(projectIds);
+      setSelectedInspirationIds(draft.inspirationIds);
+      setProjectInputs(Object.fromEntries(projectIds.map(id => [id, { content: '', plan: '' }])));
+    } catch (e) {
+      console.error('Failed to load draft selection', e);
+    }
+  };
+
+  const handleSmartGenerate = async (refresh: boolean = false) => {
     if (!user || selectedProjectIds.length === 0) return;
     setIsGenerating(true);
+    setDraftCreatedAt(null);
 
     try {
       const projectDataPromises = selectedProjectIds.map(async pid => {
@@ -136,30 +156,45 @@ const PersonalReports: React.FC = () => {
       const projectData = await Promise.all(projectDataPromises);
       const inspirationContext = availableInspirations.filter(i => selectedInspirationIds.includes(i.id));
 
-      const resultJSONString = await llmApi.generatePersonalReport(user.username, projectData, inspirationContext);
-
-      try {
-        // Attempt to parse strictly formatted JSON from AI
-        const cleanJson = resultJSONString.replace(/```json/g, '').replace(/```/g, '').trim();
-        const resultData = JSON.parse(cleanJson);
-
-        // Update inputs
-        const newInputs = { ...projectInputs };
-        selectedProjectIds.forEach(pid => {
-          if (resultData[pid]) {
-            newInputs[pid] = {
-              content: resultData[pid].content || newInputs[pid]?.content || '',
-              plan: resultData[pid].plan || newInputs[pid]?.plan || '',
-            };
+      const failed: string[] = [];
+      await llmApi.streamPersonalReport(projectData, inspirationContext, (event, payload) => {
+        if (event === 'field' && selectedProjectIds.includes(payload.projectId)) {
+          // Fill each box as soon as the model has finished it
+          setProjectInputs(prev => ({
+            ...prev,
+            [payload.projectId]: {
+              content: prev[payload.projectId]?.content || '',
+              plan: prev[payload.projectId]?.plan || '',
+              [payload.field]: payload.value,
+            },
+          }));
+        } else if (event === 'summary') {
+          setGeneralContent(payload.value);
+        } else if (event === 'error') {
+          failed.push(availableProjects.find(p => p.id === payload.projectId)?.title || payload.projectId);
+        } else if (event === 'done') {
+          // Final result (or a pre-generated draft); keep anything the user already typed
+          const resultData = payload.data || {};
+          setDraftCreatedAt(payload.draftCreatedAt || null);
+          setProjectInputs(prev => {
+            const next = { ...prev };
+            selectedProjectIds.forEach(pid => {
+              if (resultData[pid]) {
+                next[pid] = {
+                  content: resultData[pid].content || next[pid]?.content || '',
+                  plan: resultData[pid].plan || next[pid]?.plan || '',
+                };
+              }
+            });
+            return next;
+          });
+          if (resultData.generalSummary) {
+            setGeneralContent(resultData.generalSummary);
           }
-        });
-        setProjectInputs(newInputs);
-        if (resultData.generalSummary) {
-          setGeneralContent(resultData.generalSummary);
         }
-      } catch (e) {
-        console.error("Failed to parse AI response", e);
-        setGeneralContent("AI 生成了内容，但格式解析失败，请手动查看控制台或重试。\n" + resultJSONString);
+      }, refresh);
+      if (failed.length > 0) {
+        alert(`以下项目未能生成，请手动填写或重试：${failed.join('、')}`);
       }
 
     } catch (e) {
@@ -175,13 +210,14 @@ const PersonalReports: React.FC = () => {
 
     // Process attachments - upload to MinIO
     let finalAttachments: Attachment[] = [];
-    for (const att of pendingAttachments) {
-      try {
-        // Upload to MinIO - backend auto-classifies into reports/图片 or reports/文档
-        const result = await filesApi.upload(att.file, 'reports');
-        finalAttachments.push({ name: att.file.name, url: result.url, caption: att.caption });
-      } catch (err) { console.error(err); }
-    }
+    try {
+      // Upload to MinIO in one batch - backend auto-classifies into reports/图片 or reports/文档
+      const uploads = await filesApi.uploadMany(pendingAttachments.map(att => att.file), 'reports');
+      pendingAttachments.forEach((att, index) => {
+        const result = uploads[index];
+        if (result) finalAttachments.push({ name: att.file.name, url: result.url, caption: att.caption });
+      });
+    } catch (err) { console.error(err); }
 
     // Build structured details
     const details: WeeklyReportItem[] = selectedProjectIds.map(pid => ({
@@ -264,7 +300,7 @@ const PersonalReports: React.FC = () => {
               <p className="text-slate-500">每周个人工作总结。</p>
             </div>
             <button
-              onClick={() => setIsCreating(true)}
+              onClick={startCreating}
               className="flex items-center gap-2 bg-brand-600 hover:bg-brand-700 text-white px-4 py-2 rounded-lg transition-colors font-medium shadow-sm"
             >
               <Plus size={20} />
@@ -299,10 +335,10 @@ const PersonalReports: React.FC = () => {
                     {report.attachments.map((att, i) => (
                       isImage(att.url) ? (
                         <div key={i} className="w-20 h-20 border rounded overflow-hidden">
-                          <img src={att.url} className="w-full h-full object-cover" title={att.name} />
+                          <img src={fileUrl(att.url, 'thumb')} className="w-full h-full object-cover" title={att.name} />
                         </div>
                       ) : (
-                        <a key={i} href={att.url} download={att.name} className="flex items-center gap-2 px-3 py-2 bg-slate-50 border rounded text-xs text-slate-600 hover:bg-slate-100">
+                        <a key={i} href={fileUrl(att.url)} download={att.name} className="flex items-center gap-2 px-3 py-2 bg-slate-50 border rounded text-xs text-slate-600 hover:bg-slate-100">
                           <File size={14} /> {att.name}
                         </a>
                       )
@@ -350,14 +386,28 @@ const PersonalReports: React.FC = () => {
                       <h4 className="font-bold text-indigo-900">智能填报助手</h4>
                       <p className="text-xs text-indigo-700">自动读取您在所选项目的时间线更新和任务进度，生成周报初稿。</p>
                     </div>
-                    <button
-                      onClick={handleSmartGenerate}
-                      disabled={isGenerating}
-                      className="bg-indigo-600 text-white px-4 py-2 rounded-lg font-bold text-sm flex items-center gap-2 hover:bg-indigo-700 disabled:opacity-50 transition-colors"
-                    >
-                      {isGenerating ? <Loader2 className="animate-spin" size={16} /> : <Sparkles size={16} />}
-                      {isGenerating ? '生成中...' : '一键生成'}
-                    </button>
+                    <div className="flex items-center gap-2">
+                      {draftCreatedAt && !isGenerating && (
+                        <button
+                          type="button"
+                          onClick={() => handleSmartGenerate(true)}
+                          title={`已使用 ${formatToBeijingTime(draftCreatedAt)} 预生成的草稿，点击按最新数据重新生成`}
+                          className="text-indigo-700 border border-indigo-200 bg-white px-3 py-2 rounded-lg font-bold text-sm flex items-center gap-2 hover:bg-indigo-100 transition-colors"
+                        >
+                          <RefreshCw size={16} />
+                          重新生成
+                        </button>
+                      )}
+                      <button
+                        type="button"
+                        onClick={() => handleSmartGenerate()}
+                        disabled={isGenerating}
+                        className="bg-indigo-600 text-white px-4 py-2 rounded-lg font-bold text-sm flex items-center gap-2 hover:bg-indigo-700 disabled:opacity-50 transition-colors"
+                      >
+                        {isGenerating ? <Loader2 className="animate-spin" size={16} /> : <Sparkles size={16} />}
+                        {isGenerating ? '生成中...' : '一键生成'}
+                      </button>
+                    </div>
                   </div>
 
                   <div className="space-y-6">
@@ -9,7 +9,7 @@ import {
   AlertCircle, Users, Briefcase
 } from 'lucide-react';
 import { Project, TimelineEvent, User, TaskAssignment, Attachment, UserRole } from '../../types';
-import { projectsApi, eventsApi, usersApi, tasksApi, reportsApi, llmApi, filesApi } from '../../services/api';
+import { projectsApi, eventsApi, usersApi, tasksApi, reportsApi, llmApi, filesApi, fileUrl } from '../../services/api';
 import { useAuth } from '../../App';
 import { useFetchWithCache } from '../../hooks/useFetchWithCache';
 import { getBeijingISOString, formatToBeijingTime, formatBeijingDate, getBeijingTime } from '../../utils/timeUtils';
@@ -226,11 +226,14 @@ const ProjectDetail: React.FC = () => {
     if (!newEvent.content.trim() && pendingAttachments.length === 0) return;
 
     let finalAttachments: Attachment[] = [];
-    for (const att of pendingAttachments) {
+    // Upload all files to MinIO in one batch - backend auto-classifies by project and file type
+    const uploads = await filesApi.uploadMany(pendingAttachments.map(att => att.file), undefined, project.title)
+      .catch(err => { console.error(err); return pendingAttachments.map(() => null); });
+    for (const [index, att] of pendingAttachments.entries()) {
       try {
-        // Upload file to MinIO - backend auto-classifies by project and file type
         const defaultFolder = att.file.type.startsWith('image/') ? '图片' : '文档';
-        const result = await filesApi.upload(att.file, undefined, project.title);
+        const result = uploads[index];
+        if (!result) continue;
 
         let finalName = att.file.name;
         if (att.file.type.startsWith('image/') || att.caption) {
@@ -898,7 +901,7 @@ const ProjectDetail: React.FC = () => {
                         <div className={`grid gap-2 ${imgs.length > 1 ? 'grid-cols-2' : 'grid-cols-1'}`}>
                           {imgs.map((att, i) => (
                             <div key={i}>
-                              <img src={att.url} className="rounded border bg-slate-50 max-h-60 object-contain w-full" />
+                              <img src={fileUrl(att.url, 'preview')} className="rounded border bg-slate-50 max-h-60 object-contain w-full" />
                               {att.caption && <p className="text-xs text-slate-500 mt-1 italic">{att.caption}</p>}
                             </div>
                           ))}
@@ -907,7 +910,7 @@ const ProjectDetail: React.FC = () => {
                       {files.length > 0 && (
                         <div className="mt-2 pt-2 border-t flex flex-wrap gap-2">
                           {files.map((f, i) => (
-                            <a key={i} href={f.url} download={f.name} className="text-xs bg-slate-50 px-2 py-1 rounded flex items-center gap-1 text-blue-600">
+                            <a key={i} href={fileUrl(f.url)} download={f.name} className="text-xs bg-slate-50 px-2 py-1 rounded flex items-center gap-1 text-blue-600">
                               <File size={12} />{f.name}
                             </a>
                           ))}
@@ -1070,7 +1073,7 @@ const ProjectDetail: React.FC = () => {
                                 {isImage(att.url) ? <ImageIcon size={14} className="text-slate-500" /> : <File size={14} className="text-slate-500" />}
                               </div>
                               <div className="flex-1 min-w-0">
-                                <a href={att.url} download={att.name} className="block text-xs font-medium truncate text-slate-700 hover:text-brand-600 hover:underline">{att.caption || att.name}</a>
+                                <a href={fileUrl(att.url)} download={att.name} className="block text-xs font-medium truncate text-slate-700 hover:text-brand-600 hover:underline">{att.caption || att.name}</a>
                                 <p className="text-[10px] text-slate-400 truncate">{formatDateTime(event.date)}</p>
                               </div>
                               {isProjectAdmin && (
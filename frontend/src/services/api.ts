@@ -47,9 +47,36 @@ export const setToken = (token: string | null) => {
     localStorage.setItem('deptsync_token', token);
   } else {
     localStorage.removeItem('deptsync_token');
+    closeFileSession();
   }
 };
 
+// File session: an HttpOnly cookie scoped to /api/files that lets <img>/<a> load
+// attachments when the backend runs with FILE_REQUIRE_AUTH. It is short-lived,
+// so it is renewed at half its lifetime while logged in.
+let fileSessionTimer: ReturnType<typeof setTimeout> | null = null;
+
+export const openFileSession = async () => {
+  if (fileSessionTimer) clearTimeout(fileSessionTimer);
+  fileSessionTimer = null;
+  if (!accessToken) return;
+  const response = await fetch(`${API_BASE}/files/session`, {
+    method: 'POST',
+    headers: { Authorization: `Bearer ${accessToken}` },
+  });
+  if (!response.ok) throw new Error(`HTTP error ${response.status}`);
+  const { expires_in: expiresIn } = await response.json();
+  fileSessionTimer = setTimeout(() => {
+    openFileSession().catch(e => console.error('File session renewal failed:', e));
+  }, (expiresIn * 1000) / 2);
+};
+
+const closeFileSession = () => {
+  if (fileSessionTimer) clearTimeout(fileSessionTimer);
+  fileSessionTimer = null;
+  fetch(`${API_BASE}/files/session`, { method: 'DELETE' }).catch(() => undefined);
+};
+
 export const getToken = () => accessToken;
 
 // Generic fetch wrapper
@@ -114,6 +141,14 @@ export const api = {
   delete: <T>(endpoint: string) => request<T>(endpoint, { method: 'DELETE' }),
 };
 
+// Attachment URL for <img>/<a> tags. They authenticate with the file session
+// cookie (see openFileSession), never a token in the URL. `size` requests a resized
+// image derivative ('thumb' ~320px, 'preview' ~1280px) instead of the original.
+export const fileUrl = (url: string, size?: 'thumb' | 'preview') => {
+  if (!url || !url.startsWith(`${API_BASE}/files/content/`) || !size) return url;
+  return `${url}${url.includes('?') ? '&' : '?'}size=${size}`;
+};
+
 // File upload (multipart/form-data, separate from JSON api)
 export interface FileUploadResponse {
   url: string;
@@ -123,8 +158,91 @@ export interface FileUploadResponse {
   contentType: string;
 }
 
+// Files above this size go through a resumable upload session
+const RESUMABLE_THRESHOLD = 20 * 1024 * 1024;
+const PARALLEL_CHUNKS = 3;
+const CHUNK_RETRIES = 3;
+
+const uploadSessionKey = (file: File, folder?: string, projectName?: string) =>
+  `deptsync_upload:${file.name}:${file.size}:${file.lastModified}:${folder || ''}:${projectName || ''}`;
+
+// Resumable chunked upload: resumes a previous session for the same file (e.g. after a
+// page reload), sends missing chunks in parallel and retries each chunk on network errors
+async function uploadResumable(
+  file: File,
+  folder?: string,
+  projectName?: string,
+  onProgress?: (fraction: number) => void
+): Promise<FileUploadResponse> {
+  const key = uploadSessionKey(file, folder, projectName);
+  let session: any = null;
+  const savedId = localStorage.getItem(key);
+  if (savedId) {
+    session = await api.get<any>(`/files/upload-sessions/${savedId}`).catch(() => null);
+    if (session && session.status !== 'ACTIVE') session = null;
+  }
+  if (!session) {
+    session = await api.post<any>('/files/upload-sessions', {
+      filename: file.name,
+      size: file.size,
+      contentType: file.type || 'application/octet-stream',
+      folder,
+      projectName,
+    });
+    localStorage.setItem(key, session.id);
+  }
+
+  const done = new Set<number>(session.uploadedParts);
+  const pending: number[] = [];
+  for (let n = 1; n <= session.partCount; n++) if (!done.has(n)) pending.push(n);
+  onProgress?.(done.size / session.partCount);
+
+  const sendPart = async (n: number) => {
+    const chunk = file.slice((n - 1) * session.chunkSize, Math.min(n * session.chunkSize, file.size));
+    for (let attempt = 1; ; attempt++) {
+      try {
+        const response = await fetch(`${API_BASE}/files/upload-sessions/${session.id}/parts/${n}`, {
+          method: 'PUT',
+          headers: accessToken ? { Authorization: `Bearer ${accessToken}` } : {},
+          body: chunk,
+        });
+        if (!response.ok) {
+          const errorData = await response.json().catch(() => ({}));
+          throw new Error(errorData.detail || `Chunk ${n} failed: ${response.status}`);
+        }
+        break;
+      } catch (e) {
+        if (attempt >= CHUNK_RETRIES) throw e;
+        await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+      }
+    }
+    done.add(n);
+    onProgress?.(done.size / session.partCount);
+  };
+
+  const workers = Array.from({ length: PARALLEL_CHUNKS }, async () => {
+    while (pending.length > 0) {
+      await sendPart(pending.shift()!);
+    }
+  });
+  await Promise.all(workers);
+
+  const result = await api.post<FileUploadResponse>(`/files/upload-sessions/${session.id}/complete`, {});
+  localStorage.removeItem(key);
+  return result;
+}
+
 export const filesApi = {
-  upload: async (file: File, folder?: string, projectName?: string): Promise<FileUploadResponse> => {
+  upload: async (
+    file: File,
+    folder?: string,
+    projectName?: string,
+    onProgress?: (fraction: number) => void
+  ): Promise<FileUploadResponse> => {
+    if (file.size > RESUMABLE_THRESHOLD) {
+      return uploadResumable(file, folder, projectName, onProgress);
+    }
+
     const formData = new FormData();
     formData.append('file', file);
     if (folder) formData.append('folder', folder);
@@ -149,6 +267,58 @@ export const filesApi = {
     const data = await response.json();
     return toCamel(data);
   },
+
+  // Uploads several files, small ones in a single batch request; resolves in input
+  // order with null for each file that failed
+  uploadMany: async (
+    files: File[],
+    folder?: string,
+    projectName?: string
+  ): Promise<(FileUploadResponse | null)[]> => {
+    const results: (FileUploadResponse | null)[] = files.map(() => null);
+    const small = files.map((file, i) => ({ file, i })).filter(({ file }) => file.size <= RESUMABLE_THRESHOLD);
+
+    for (const [i, file] of files.entries()) {
+      if (file.size > RESUMABLE_THRESHOLD) {
+        results[i] = await filesApi.upload(file, folder, projectName).catch(err => {
+          console.error(err);
+          return null;
+        });
+      }
+    }
+    if (small.length === 0) return results;
+
+    const formData = new FormData();
+    small.forEach(({ file }) => formData.append('files', file));
+    if (folder) formData.append('folder', folder);
+    if (projectName) formData.append('project_name', projectName);
+
+    const headers: Record<string, string> = {};
+    if (accessToken) {
+      headers['Authorization'] = `Bearer ${accessToken}`;
+    }
+
+    const response = await fetch(`${API_BASE}/files/upload-batch`, {
+      method: 'POST',
+      headers,
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || `Upload failed: ${response.status}`);
+    }
+
+    const data = toCamel(await response.json());
+    data.results.forEach((result: any, k: number) => {
+      if (result.error) {
+        console.error(`Upload of ${result.name} failed: ${result.error}`);
+      } else {
+        results[small[k].i] = result;
+      }
+    });
+    return results;
+  },
 };
 
 // Auth API
@@ -168,6 +338,7 @@ export const authApi = {
       password,
     });
     setToken(response.accessToken);
+    await openFileSession().catch(e => console.error('File session failed:', e));
     return response;
   },
 
@@ -178,6 +349,7 @@ export const authApi = {
       password,
     });
     setToken(response.accessToken);
+    await openFileSession().catch(e => console.error('File session failed:', e));
     return response;
   },
 
@@ -314,6 +486,47 @@ export const llmApi = {
     });
     return JSON.stringify(response.data);
   },
+  // Selection of this week's pre-generated draft ({projectIds, inspirationIds, draftCreatedAt}), or null
+  getPersonalReportDraft: () => api.get<any>('/llm/personal-report/draft'),
+  // Server-sent events: each project's content/plan arrives as soon as the model finishes it.
+  // refresh skips the pre-generated draft and always generates anew.
+  streamPersonalReport: async (
+    projects: any[],
+    inspirations: any[],
+    onEvent: (event: string, payload: any) => void,
+    refresh: boolean = false
+  ) => {
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    if (accessToken) headers['Authorization'] = `Bearer ${accessToken}`;
+
+    const response = await fetch(`${API_BASE}/llm/personal-report/stream`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify(toSnake({ projects, inspirations, refresh })),
+    });
+    if (!response.ok || !response.body) throw new Error(`HTTP error ${response.status}`);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach(line => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (data) onEvent(event, toCamel(JSON.parse(data)));
+      }
+    }
+  },
   generateDeptMonthlyReport: (startDate: string, endDate: string, projects: any[], reports: any[]) => {
     return api.post<any>('/llm/generate-dept-monthly-report', {
       startDate,